@@ -0,0 +1,71 @@
+"""
+Measures how long a training step is blocked by a checkpoint: writing it synchronously in place, as `Job.checkpoint` used to,
+against `CheckpointEngine` in the background, optionally reusing unchanged tensors.
+Uses torch if it is installed, otherwise NumPy arrays written with pickle.
+
+    python benchmarks/bench_checkpoint.py --mb 256 --checkpoints 5
+"""
+import argparse
+import logging
+import os
+import pickle
+import tempfile
+import time
+from expman.checkpoint import CheckpointEngine
+
+
+def pickle_save(obj, fname):
+    with open(fname, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def pickle_load(fname, **kwargs):
+    with open(fname, 'rb') as f:
+        return pickle.load(f)
+
+
+def make_state(mb, num_tensors):
+    n = mb * 2 ** 20 // 4 // num_tensors
+    try:
+        import torch
+        return {'layer{}'.format(i): torch.randn(n) for i in range(num_tensors)}, torch.save, torch.load
+    except ImportError:
+        import numpy as np
+        return {'layer{}'.format(i): np.random.randn(n).astype(np.float32) for i in range(num_tensors)}, pickle_save, pickle_load
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=int, default=256, help='size of the state')
+    parser.add_argument('--tensors', type=int, default=64)
+    parser.add_argument('--checkpoints', type=int, default=5)
+    parser.add_argument('--step_time', type=float, default=1, help='seconds of simulated training between checkpoints')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    state, save_fn, load_fn = make_state(args.mb, args.tensors)
+    with tempfile.TemporaryDirectory() as d:
+        fjob = os.path.join(d, 'job.tar')
+        blocked = 0
+        for _ in range(args.checkpoints):
+            start = time.perf_counter()
+            save_fn(state, fjob)
+            blocked += time.perf_counter() - start
+        print('{:<28} blocked {:>7.3f}s per checkpoint'.format('synchronous, in place', blocked / args.checkpoints))
+
+        for name, kwargs in (('background', {}), ('background + incremental', dict(incremental=True))):
+            engine = CheckpointEngine(os.path.join(d, name.replace(' ', ''), 'job.tar'), save_fn=save_fn, load_fn=load_fn, **kwargs)
+            os.makedirs(os.path.dirname(engine.path))
+            blocked = 0
+            for _ in range(args.checkpoints):
+                start = time.perf_counter()
+                engine.save(state)
+                blocked += time.perf_counter() - start
+                # training continues while the checkpoint is written
+                time.sleep(args.step_time)
+            engine.wait()
+            print('{:<28} blocked {:>7.3f}s per checkpoint'.format(name, blocked / args.checkpoints))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares a plain `log.jsonl` with block-compressed ones: size on disk, time to write, to read everything, and to read a narrow
+step range, which only decompresses the blocks holding it.
+
+    python benchmarks/bench_compression.py --records 500000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from expman import JSONLogger
+from expman.loggers import blocks
+
+
+def write(dlog, records, compression):
+    logger = JSONLogger(compression=compression, buffer_size=1000, durability='none').start(dlog)
+    for step in range(records):
+        logger.log(dict(step=step, time='2024-01-01T00:00:00.000000', loss=1. / (step + 1), acc=step % 100 / 100, lr=1e-3, epoch=step // 10000))
+    logger.finish()
+    return logger
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=500000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    codecs = [None, 'gzip']
+    try:
+        import zstandard  # noqa: F401
+        codecs.append('zstd')
+    except ImportError:
+        pass
+    step_range = (args.records // 2, args.records // 2 + args.records // 100)
+    print('{:<8} {:>10} {:>8} {:>10} {:>12} {:>12}'.format('codec', 'MB', 'write', 'read all', 'read 1%', 'read all x{}'.format(args.workers)))
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in codecs:
+            dlog = os.path.join(tmp, codec or 'plain')
+            os.makedirs(dlog)
+            t_write, logger = timed(lambda: write(dlog, args.records, codec))
+            size = os.path.getsize(logger.fout) + (os.path.getsize(logger.fout + blocks.INDEX_EXT) if codec else 0)
+            t_all, logs = timed(lambda: JSONLogger(decompress_workers=1).start(dlog).load_logs())
+            assert len(logs) == args.records
+            t_range, logs = timed(lambda: JSONLogger(decompress_workers=1).start(dlog).load_logs(step_range=step_range))
+            assert len(logs) == step_range[1] - step_range[0]
+            t_par, logs = timed(lambda: JSONLogger(decompress_workers=args.workers).start(dlog).load_logs())
+            print('{:<8} {:>10.1f} {:>7.2f}s {:>9.2f}s {:>11.3f}s {:>11.2f}s'.format(
+                codec or 'plain', size / 2 ** 20, t_write, t_all, t_range, t_par))
+
+
+if __name__ == '__main__':
+    main()
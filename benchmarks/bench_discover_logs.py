@@ -0,0 +1,42 @@
+"""
+Times `Experiment.discover_logs` over synthetic sweeps of increasing size with different numbers of worker processes.
+
+    python benchmarks/bench_discover_logs.py --runs 10 100 1000 --workers 1 4 16
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from expman import Experiment, JSONLogger
+
+
+def make_sweep(logdir, num_runs, num_records):
+    for i in range(num_runs):
+        exp = Experiment(dict(name='run-seed{}'.format(i), logdir=logdir, lr=1e-3), loggers=[JSONLogger(buffer_size=num_records)], save_every=num_records).start()
+        for j in range(num_records):
+            exp.log(dict(loss=1 / (j + 1), acc=j / num_records))
+        exp.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--records', type=int, default=10000, help='records per run')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    for num_runs in args.runs:
+        with tempfile.TemporaryDirectory() as logdir:
+            make_sweep(logdir, num_runs, args.records)
+            for workers in args.workers:
+                start = time.perf_counter()
+                exps = Experiment.discover_logs(os.path.join(logdir, '*'), JSONLogger(), workers=workers)
+                elapsed = time.perf_counter() - start
+                assert len(exps) == num_runs
+                print('{:>5} runs {:>3} workers {:>8.2f}s'.format(num_runs, workers, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Import-time regression check: imports `expman` with `Experiment` and `JSONLogger` in a fresh interpreter under `python -X importtime`,
+prints the slowest modules, and fails if the import takes longer than `--budget` milliseconds or pulls in a heavy dependency.
+
+    python benchmarks/bench_import_time.py --budget 100
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+STATEMENT = 'import expman; from expman import Experiment, JSONLogger'
+HEAVY = ('torch', 'submitit', 'wandb', 'numpy', 'pandas', 'matplotlib', 'seaborn', 'tqdm')
+
+
+def import_times(statement):
+    """
+    Returns `{module: (self_us, cumulative_us)}` for one import of `statement` in a new interpreter.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.environ.get('PYTHONPATH', '')]))
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=float, default=100, help='milliseconds allowed for the import')
+    parser.add_argument('--repeat', type=int, default=5, help='the fastest of this many imports is reported, to skip a cold file cache')
+    parser.add_argument('--top', type=int, default=15, help='number of slowest modules to print')
+    args = parser.parse_args()
+
+    runs = [import_times(STATEMENT) for _ in range(args.repeat)]
+    times = min(runs, key=lambda t: sum(s for s, c in t.values()))
+    total_ms = sum(s for s, c in times.values()) / 1000
+    print('{}: {:.1f} ms over {} modules'.format(STATEMENT, total_ms, len(times)))
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda kv: -kv[1][1])[:args.top]:
+        print('{:>9.1f} ms cumulative {:>8.1f} ms self  {}'.format(cumulative_us / 1000, self_us / 1000, name))
+
+    failed = False
+    heavy = sorted(m for m in times if m.split('.')[0] in HEAVY)
+    if heavy:
+        print('FAIL: heavy dependencies imported: {}'.format(', '.join(heavy)))
+        failed = True
+    if total_ms > args.budget:
+        print('FAIL: import took {:.1f} ms, budget is {:.1f} ms'.format(total_ms, args.budget))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Times building the config index of a synthetic sweep and filtering it, against loading every `exp.json` and filtering in Python.
+
+    python benchmarks/bench_index.py --runs 50000
+"""
+import argparse
+import itertools
+import logging
+import os
+import tempfile
+import time
+import ujson as json
+from expman import Experiment
+from expman.index import ConfigIndex
+
+
+FILTER = "lr == 1e-3 and model == 'linear' and final.acc > 0.5"
+
+
+def make_sweep(logdir, num_runs):
+    grid = itertools.cycle(itertools.product([1e-2, 1e-3, 1e-4], ['linear', 'mlp', 'cnn'], range(5)))
+    for i, (lr, model, seed) in zip(range(num_runs), grid):
+        name = 'run{}-seed{}'.format(i, seed)
+        os.makedirs(os.path.join(logdir, name))
+        config = dict(name=name, logdir=logdir, lr=lr, model=model, seed=seed, seedless_name='run{}'.format(i))
+        with open(os.path.join(logdir, name, 'exp.json'), 'wt') as f:
+            json.dump(dict(name_field='name', logdir_field='logdir', config=config, step=100, last_written_time=None), f)
+        with open(os.path.join(logdir, name, 'log.jsonl'), 'wt') as f:
+            f.write(json.dumps(dict(step=99, acc=(i % 100) / 100)) + '\n')
+
+
+def python_filter(logdir):
+    matches = []
+    for d in sorted(os.listdir(logdir)):
+        fexp = os.path.join(logdir, d, 'exp.json')
+        if not os.path.isfile(fexp):
+            continue
+        exp = Experiment.from_fconfig(fexp)
+        if exp.config['lr'] == 1e-3 and exp.config['model'] == 'linear':
+            with open(os.path.join(logdir, d, 'log.jsonl')) as f:
+                last = json.loads(f.readlines()[-1])
+            if last['acc'] > 0.5:
+                matches.append(os.path.join(logdir, d))
+    return matches
+
+
+def timed(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    print('{:<36} {:>9.4f}s'.format(name, time.perf_counter() - start))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=50000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as logdir:
+        make_sweep(logdir, args.runs)
+        print('{} experiments, filter: {}'.format(args.runs, FILTER))
+        expected = timed('load every exp.json and filter', lambda: python_filter(logdir))
+        index = timed('build index', lambda: ConfigIndex(logdir))
+        found = timed('query', lambda: index.query(FILTER))
+        timed('query again', lambda: index.query(FILTER))
+        timed('refresh (nothing changed)', index.refresh)
+        index.close()
+        timed('open index and query', lambda: ConfigIndex(logdir).query(FILTER))
+        assert found == expected, (len(found), len(expected))
+        print('{} matches'.format(len(found)))
+
+
+if __name__ == '__main__':
+    main()
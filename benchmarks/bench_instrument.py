@@ -0,0 +1,47 @@
+"""
+Times `Experiment.log` with a `JSONLogger` with instrumentation off, on, and on with an export every second, to check that it
+costs nothing when off and little when on.
+
+    python benchmarks/bench_instrument.py --calls 20000
+"""
+import argparse
+import logging
+import tempfile
+import time
+from expman import Experiment, JSONLogger
+
+
+def time_logs(logdir, name, calls, **kwargs):
+    exp = Experiment(dict(name=name, logdir=logdir), loggers=[JSONLogger(buffer_size=100)], save_every=100, **kwargs).start()
+    start = time.perf_counter()
+    for i in range(calls):
+        exp.log(dict(loss=1. / (i + 1), acc=i % 100 / 100))
+    elapsed = time.perf_counter() - start
+    exp.finish()
+    return elapsed / calls, exp
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    variants = [
+        ('off', dict(instrument=False)),
+        ('on', dict(instrument=True)),
+        ('on, export every 1s', dict(instrument=True, instrument_interval=1)),
+    ]
+    print('{:<22} {:>12}'.format('instrumentation', 'per log'))
+    with tempfile.TemporaryDirectory() as logdir:
+        for name, kwargs in variants:
+            best = min(time_logs(logdir, '{}-{}'.format(name, r), args.calls, **kwargs)[0] for r in range(args.repeats))
+            print('{:<22} {:>10.2f}us'.format(name, best * 1e6))
+        _, exp = time_logs(logdir, 'stats', args.calls, instrument=True)
+        for timer, summary in exp.instrumentation_stats()['timers'].items():
+            print('{:<22} mean {:>8.2f}us  p99 {:>8.2f}us'.format(timer, summary['mean_us'], summary['p99_us']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares loading a whole `log.jsonl` against loading two columns over part of the step range.
+
+    python benchmarks/bench_load_logs.py --records 5000000
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from expman import Experiment, JSONLogger
+
+
+def measure(fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=500000)
+    parser.add_argument('--keys', type=int, default=20, help='number of metrics per record')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as logdir:
+        exp = Experiment(dict(name='bench', logdir=logdir), loggers=[JSONLogger(buffer_size=10000, durability='none')], save_every=10000).start()
+        for i in range(args.records):
+            exp.log({'metric{}'.format(k): i * k for k in range(args.keys)})
+        exp.finish()
+
+        cases = [
+            ('all columns', dict()),
+            ('2 columns', dict(columns=['step', 'metric1'])),
+            ('2 columns, half the steps', dict(columns=['step', 'metric1'], step_range=(args.records // 2, None))),
+            ('2 columns, every 10th', dict(columns=['step', 'metric1'], every=10)),
+        ]
+        for name, kwargs in cases:
+            elapsed, peak = measure(lambda: exp.load_logs(JSONLogger(), **kwargs))
+            print('{:<30} {:>8.2f}s {:>10.1f} MB peak'.format(name, elapsed, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures how many records per second `Experiment.log` sustains with the default, unbuffered settings,
+with a buffered `JSONLogger` and with asynchronous dispatch.
+
+    python benchmarks/bench_logging.py --records 20000
+"""
+import argparse
+import tempfile
+import time
+import os
+from expman import Experiment, JSONLogger
+
+
+def run(logdir, name, num_records, logger_kwargs, exp_kwargs):
+    exp = Experiment(dict(name=name, logdir=logdir, lr=1e-3, model=dict(layers=[512] * 16)), loggers=[JSONLogger(**logger_kwargs)], **exp_kwargs)
+    exp.start(delete_existing=True)
+    start = time.perf_counter()
+    for i in range(num_records):
+        exp.log(dict(loss=1 / (i + 1), acc=i % 100 / 100))
+    loop = time.perf_counter() - start
+    exp.finish()
+    return num_records / (time.perf_counter() - start), loop / num_records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    settings = [
+        ('unbuffered', dict(), dict()),
+        ('buffered, durability=flush', dict(buffer_size=1000, durability='flush'), dict(save_every=1000)),
+        ('buffered, durability=none', dict(buffer_size=1000, durability='none'), dict(save_every=1000)),
+        ('buffered, durability=fsync', dict(buffer_size=1000, durability='fsync'), dict(save_every=1000)),
+        ('async, unbuffered', dict(), dict(async_logging=True)),
+        ('async, buffered', dict(buffer_size=1000), dict(async_logging=True, save_every=1000)),
+    ]
+    with tempfile.TemporaryDirectory() as logdir:
+        for name, logger_kwargs, exp_kwargs in settings:
+            rate, latency = run(logdir, name.replace(' ', ''), args.records, logger_kwargs, exp_kwargs)
+            print('{:<30} {:>12,.0f} records/s {:>10.1f} us/log call'.format(name, rate, latency * 1e6))
+            assert sum(1 for _ in open(os.path.join(logdir, name.replace(' ', ''), 'log.jsonl'))) == args.records
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Times polling a directory of synthetic runs with `expman.monitor.Monitor`, first when every `exp.json` must be read and then when
+only some runs wrote since the last poll.
+
+    python benchmarks/bench_monitor.py --runs 5000
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+import ujson as json
+from expman.monitor import Monitor
+
+
+def write_exp(logdir, name, step, last_written, finished=None):
+    with open(os.path.join(logdir, name, 'exp.json'), 'wt') as f:
+        json.dump(dict(name_field='name', logdir_field='logdir', config=dict(name=name, logdir=logdir), step=step,
+                       last_written_time=last_written.isoformat(), start_time=None, start_step=None,
+                       finished_time=finished.isoformat() if finished else None), f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5000)
+    parser.add_argument('--changed', type=float, default=0.1, help='fraction of runs that write between polls')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as logdir:
+        now = datetime.datetime.utcnow()
+        for i in range(args.runs):
+            os.makedirs(os.path.join(logdir, 'run{}'.format(i)))
+            age = datetime.timedelta(seconds=[5, 1200, 7200][i % 3])
+            write_exp(logdir, 'run{}'.format(i), 100, now - age, finished=now if i % 7 == 0 else None)
+
+        monitor = Monitor(os.path.join(logdir, '*'), slurm=False)
+        start = time.perf_counter()
+        runs = monitor.poll()
+        print('{:<36} {:>9.4f}s'.format('first poll', time.perf_counter() - start))
+
+        changed = int(args.runs * args.changed)
+        later = datetime.datetime.utcnow()
+        for i in range(changed):
+            write_exp(logdir, 'run{}'.format(i), 200, later)
+        start = time.perf_counter()
+        runs = monitor.poll()
+        print('{:<36} {:>9.4f}s'.format('poll, {} runs changed'.format(changed), time.perf_counter() - start))
+
+        start = time.perf_counter()
+        runs = monitor.poll()
+        print('{:<36} {:>9.4f}s'.format('poll, nothing changed', time.perf_counter() - start))
+        print(Monitor.summary(runs))
+
+
+if __name__ == '__main__':
+    main()
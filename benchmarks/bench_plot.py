@@ -0,0 +1,95 @@
+"""
+Compares peak memory and wall time of `LinePlotter.plot` against the previous row-based implementation.
+
+    python benchmarks/bench_plot.py --runs 500 --steps 100000
+"""
+import argparse
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib import pyplot as plt
+from expman import Experiment
+from expman.plotters import LinePlotter
+from expman.plotters.line_plotter import next_color
+
+
+def legacy_plot(exps_and_logs, x, y, group, xpid, smooth_window=10, align_x=1):
+    """
+    The row-based implementation this benchmark compares against.
+    """
+    fig, ax = plt.subplots()
+    data = []
+    for exp, logs in exps_and_logs:
+        for r in logs:
+            r = r.copy()
+            r.update(exp.config)
+            data.append(r)
+    data = pd.DataFrame(data)
+    for g in sorted(data[group].unique()):
+        group_data = data[data[group] == g]
+        color = next_color(ax)
+        all_data = []
+        for xid in sorted(group_data[xpid].unique()):
+            xp_data = group_data[group_data[xpid] == xid].copy()
+            xp_data[y + '_smooth'] = xp_data[y].rolling(smooth_window, min_periods=smooth_window // 2).mean()
+            all_data.append(xp_data)
+            ax.plot(xp_data[x].to_numpy(), xp_data[y + '_smooth'].to_numpy(), linestyle='dashed', color=color, alpha=0.4)
+        group_data = pd.concat(all_data)
+        group_data[x] = group_data[x] // align_x * align_x
+        sns.lineplot(data=group_data, x=x, y=y + '_smooth', label=g, ax=ax, color=color)
+    plt.close(fig)
+
+
+def new_plot(exps_and_logs, x, y, group, xpid, smooth_window=10, align_x=1):
+    fig, ax = plt.subplots()
+    LinePlotter().plot(exps_and_logs, x=x, y=y, group=group, xpid=xpid, smooth_window=smooth_window, align_x=align_x, ax=ax)
+    plt.close(fig)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=5)
+    parser.add_argument('--config_size', type=int, default=50, help='number of extra config fields per run')
+    parser.add_argument('--skip_legacy', action='store_true', help='the legacy implementation needs tens of GB at full scale')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    exps_and_logs = []
+    for i in range(args.runs):
+        config = dict(name='run{}'.format(i), logdir='/tmp', type='type{}'.format(i % args.groups), **{'field{}'.format(k): k for k in range(args.config_size)})
+        exp = Experiment(config)
+        steps = np.arange(args.steps)
+        score = steps / args.steps + rng.normal(size=args.steps)
+        exps_and_logs.append((exp, dict(step=steps, score=score)))
+    align_x = max(1, args.steps // 100)
+
+    rows = [(exp, [dict(step=int(s), score=float(v)) for s, v in zip(logs['step'], logs['score'])]) for exp, logs in exps_and_logs]
+    cases = [
+        ('vectorized, arrays', lambda: new_plot(exps_and_logs, 'step', 'score', 'type', 'name', align_x=align_x)),
+        ('vectorized, rows', lambda: new_plot(rows, 'step', 'score', 'type', 'name', align_x=align_x)),
+    ]
+    if not args.skip_legacy:
+        cases.append(('legacy, rows', lambda: legacy_plot(rows, 'step', 'score', 'type', 'name', align_x=align_x)))
+    for name, fn in cases:
+        elapsed, peak = measure(fn)
+        print('{:<20} {:>8.2f}s {:>10.1f} MB peak'.format(name, elapsed, peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
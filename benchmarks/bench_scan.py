@@ -0,0 +1,88 @@
+"""
+Counts the filesystem calls needed to find the experiments of a synthetic sweep, the way `discover_logs` and `discover_jobs`
+used to (`glob` then `isfile` or `listdir` per match) and with `expman.scan.scan_experiments`, with and without a manifest.
+On network filesystems each of these calls is a round trip to the metadata server.
+
+    python benchmarks/bench_scan.py --runs 100 1000 10000
+"""
+import argparse
+import builtins
+import collections
+import glob
+import os
+import tempfile
+import time
+from expman.scan import scan_experiments
+
+
+CALLS = collections.Counter()
+COUNTED = ((os, 'stat'), (os, 'listdir'), (os, 'scandir'), (builtins, 'open'))
+
+
+def counted(module, name):
+    fn = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        CALLS[name] += 1
+        return fn(*args, **kwargs)
+    setattr(module, name, wrapper)
+
+
+def make_sweep(logdir, num_runs):
+    for i in range(num_runs):
+        d = os.path.join(logdir, 'run-seed{}'.format(i))
+        os.makedirs(d)
+        for fname in ('exp.json', 'log.jsonl'):
+            with open(os.path.join(d, fname), 'wt') as f:
+                f.write('{}\n')
+    # a directory without an experiment, which must be skipped
+    os.makedirs(os.path.join(logdir, 'slurm'))
+
+
+def legacy_discover_logs(glob_path):
+    fexps = [os.path.join(d, 'exp.json') for d in sorted(glob.glob(glob_path))]
+    return [f for f in fexps if os.path.isfile(f)]
+
+
+def legacy_discover_jobs(glob_path):
+    return [os.path.join(d, 'exp.json') for d in glob.glob(glob_path) if 'exp.json' in os.listdir(d)]
+
+
+def measure(name, fn, num_runs):
+    CALLS.clear()
+    start = time.perf_counter()
+    found = fn()
+    elapsed = time.perf_counter() - start
+    assert len(found) == num_runs, (name, len(found))
+    calls = ' '.join('{}={}'.format(k, CALLS[k]) for k in ('stat', 'listdir', 'scandir', 'open'))
+    print('{:>6} runs {:<24} {:>8.3f}s  {}'.format(num_runs, name, elapsed, calls))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    for num_runs in args.runs:
+        with tempfile.TemporaryDirectory() as logdir:
+            make_sweep(logdir, num_runs)
+            glob_path = os.path.join(logdir, '*')
+            originals = [getattr(module, name) for module, name in COUNTED]
+            for module, name in COUNTED:
+                counted(module, name)
+            try:
+                measure('glob + isfile', lambda: legacy_discover_logs(glob_path), num_runs)
+                measure('glob + listdir', lambda: legacy_discover_jobs(glob_path), num_runs)
+                measure('scandir', lambda: scan_experiments(glob_path, names=('exp.json', )), num_runs)
+                measure('scandir + stat', lambda: scan_experiments(glob_path, stat=True), num_runs)
+                measure('manifest (cold)', lambda: scan_experiments(glob_path, names=('exp.json', ), manifest=True), num_runs)
+                # the first run also creates the cache directory, which changes the mtime of `logdir` once
+                measure('manifest (second)', lambda: scan_experiments(glob_path, names=('exp.json', ), manifest=True), num_runs)
+                measure('manifest (warm)', lambda: scan_experiments(glob_path, names=('exp.json', ), manifest=True), num_runs)
+            finally:
+                for (module, name), fn in zip(COUNTED, originals):
+                    setattr(module, name, fn)
+
+
+if __name__ == '__main__':
+    main()
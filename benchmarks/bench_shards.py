@@ -0,0 +1,52 @@
+"""
+Times reading a log written by several ranks, one shard each, merged by step with and without a reduction, against reading the
+same records from a single `log.jsonl`.
+
+    python benchmarks/bench_shards.py --ranks 8 --steps 50000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from expman import JSONLogger
+
+
+def write(logdir, rank, steps, ranks):
+    logger = JSONLogger(rank=rank, buffer_size=1000, durability='none').start(logdir)
+    for step in range(steps):
+        for r in ([rank] if rank is not None else range(ranks)):
+            logger.log(dict(step=step, time='2024-01-01T00:00:{:09.6f}'.format(r / 1e3), loss=1. / (step + 1) + r, r=r))
+    logger.finish()
+
+
+def timed(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    print('{:<36} {:>9.4f}s {:>9} records'.format(name, time.perf_counter() - start, len(result)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ranks', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=50000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single, sharded = os.path.join(tmp, 'single'), os.path.join(tmp, 'sharded')
+        os.makedirs(single)
+        os.makedirs(sharded)
+        write(single, None, args.steps, args.ranks)
+        for rank in range(args.ranks):
+            write(sharded, rank, args.steps, args.ranks)
+
+        timed('single log.jsonl', lambda: JSONLogger().start(single).load_logs())
+        timed('{} shards, merged'.format(args.ranks), lambda: JSONLogger().start(sharded).load_logs())
+        timed('{} shards, reduce=mean'.format(args.ranks), lambda: JSONLogger(reduce='mean').start(sharded).load_logs())
+        timed('{} shards, mean, every 100'.format(args.ranks), lambda: JSONLogger(reduce='mean').start(sharded).load_logs(every=100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Times `Experiment.log` with no loggers against the size of the config, now that only `state.bin` is written per call, and the
+previous behaviour of rewriting the whole `exp.json` on every call.
+
+    python benchmarks/bench_state.py --calls 2000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import ujson as json
+from expman import Experiment
+
+
+class RewriteExperiment(Experiment):
+    """
+    Saves like expman did before `state.bin`: the whole `exp.json`, in place, on every call to `log`.
+    """
+
+    def save_state(self, fstate=None, index=True):
+        with open(self.explog, 'wt') as f:
+            json.dump(dict(name_field=self.name_field, logdir_field=self.logdir_field, config=self.config, step=self.step,
+                           last_written_time=self.last_written_time), f, indent=2)
+        return self
+
+
+def make_config(logdir, size):
+    return dict(name='run-{}'.format(size), logdir=logdir, vocab=['token{}'.format(i) for i in range(size)],
+                model=dict(layers=[dict(dim=512, heads=8, dropout=0.1)] * max(1, size // 100)))
+
+
+def time_logs(exp_cls, config, calls):
+    exp = exp_cls(config).start()
+    start = time.perf_counter()
+    for i in range(calls):
+        exp.log(dict(loss=1. / (i + 1)))
+    elapsed = time.perf_counter() - start
+    exp.finish()
+    return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000, 100000])
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print('{:>8} {:>12} {:>16} {:>14}'.format('vocab', 'exp.json', 'rewrite exp.json', 'state.bin'))
+    with tempfile.TemporaryDirectory() as logdir:
+        for size in args.sizes:
+            config = make_config(logdir, size)
+            old = time_logs(RewriteExperiment, dict(config, name='old-{}'.format(size)), args.calls)
+            new = time_logs(Experiment, dict(config, name='new-{}'.format(size)), args.calls)
+            fsize = os.path.getsize(os.path.join(logdir, 'new-{}'.format(size), 'exp.json'))
+            print('{:>8} {:>10}kB {:>14.1f}us {:>12.1f}us'.format(size, fsize // 1024, old * 1e6, new * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,26 @@
+import importlib
 from .experiment import Experiment
 from .loggers import *
+
+
+# names whose modules pull in heavy or optional dependencies (torch, submitit, matplotlib, numpy, wandb) and are only imported when first used
+_LAZY = {
+    'Job': '.job',
+    'SlurmJob': '.job',
+    'LazyJob': '.job',
+    'LinePlotter': '.plotters.line_plotter',
+    'ColumnarLogger': '.loggers.columnar_logger',
+    'WandbLogger': '.loggers.wandb_logger',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
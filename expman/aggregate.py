@@ -0,0 +1,256 @@
+"""
+Aggregates metrics over many experiments, one experiment at a time, with memory proportional to the number of x bins rather than records.
+"""
+import numpy as np
+from .downsample import rolling_mean
+
+
+def get_column(exp, logs, key):
+    """
+    Returns `key` of a run as a float array, from its logs (a list of dicts or a dict of arrays) or, failing that, its config.
+    """
+    if isinstance(logs, dict):
+        if key in logs:
+            return np.asarray(logs[key], dtype=float)
+        n = max([len(v) for v in logs.values()], default=0)
+    else:
+        if any(key in d for d in logs):
+            return np.array([d.get(key, np.nan) for d in logs], dtype=float)
+        n = len(logs)
+    return np.full(n, exp.config.get(key, np.nan), dtype=float)
+
+
+class BinTable:
+    """
+    Columns of per-bin values over a sorted set of integer bins that grows as new bins are added.
+    Each column is combined with its own ufunc, e.g. `np.add` for sums and `np.minimum` for minimums.
+    """
+
+    def __init__(self, reducers):
+        """
+        Args:
+            reducers: maps column names to `(ufunc, identity)`.
+        """
+        self.reducers = reducers
+        self.bins = np.zeros(0, dtype=np.int64)
+        self.columns = {name: np.zeros(0) for name in reducers}
+
+    def add(self, bins, values):
+        """
+        Args:
+            bins: sorted unique bins.
+            values: maps column names to arrays aligned with `bins`.
+        """
+        if len(bins) == 0:
+            return
+        union = np.union1d(self.bins, bins)
+        if len(union) != len(self.bins):
+            old = np.searchsorted(union, self.bins)
+            for name, (ufunc, identity) in self.reducers.items():
+                column = np.full(len(union), identity, dtype=float)
+                column[old] = self.columns[name]
+                self.columns[name] = column
+            self.bins = union
+        idx = np.searchsorted(self.bins, bins)
+        for name, v in values.items():
+            ufunc = self.reducers[name][0]
+            self.columns[name][idx] = ufunc(self.columns[name][idx], v)
+
+
+def _reduce_bins(bins, values):
+    """
+    Returns the sorted unique `bins` with the count, sum, sum of squares, min and max of `values` in each.
+    """
+    keys, inverse = np.unique(bins, return_inverse=True)
+    inverse = inverse.ravel()
+    n = len(keys)
+    vmin = np.full(n, np.inf)
+    vmax = np.full(n, -np.inf)
+    np.minimum.at(vmin, inverse, values)
+    np.maximum.at(vmax, inverse, values)
+    return keys, dict(
+        count=np.bincount(inverse, minlength=n).astype(float),
+        sum=np.bincount(inverse, weights=values, minlength=n),
+        sumsq=np.bincount(inverse, weights=values ** 2, minlength=n),
+        min=vmin,
+        max=vmax,
+    )
+
+
+class Aggregator:
+    """
+    Computes per-bin statistics of `metrics` against `x` for groups of experiments, fed one experiment at a time.
+
+    Rows are binned by `x // bin_width`. With `over='runs'` each run (by default each experiment) is first averaged within a bin
+    and the statistics are taken over runs, e.g. over the seeds of a group, so quantiles are available and each run counts once.
+    Only the per-bin means of each run are kept. With `over='rows'` the statistics are taken over every record in a bin and
+    only running moments are kept per group.
+
+    The last values of every metric of every run are also kept for `report`.
+
+    Args:
+        x: column to bin on.
+        metrics: columns to aggregate.
+        group: config field, list of config fields, or function of the experiment, giving the group of each experiment.
+            Defaults to `seedless_name`, i.e. the name without its `-seed<n>` suffix.
+        bin_width: width of the x bins.
+        quantiles: quantiles to compute per bin, between 0 and 1, only with `over='runs'`.
+        smooth_window: window of a trailing rolling mean applied to each metric of an experiment before binning.
+        final_window: number of last records averaged into the final value of a run.
+    """
+
+    def __init__(self, x, metrics, group='seedless_name', bin_width=1, over='runs', quantiles=(), smooth_window=1, final_window=1):
+        assert over in ('runs', 'rows'), 'over must be runs or rows'
+        assert over == 'runs' or not quantiles, 'quantiles are only available over runs'
+        self.x = x
+        self.metrics = list(metrics)
+        self.group = group
+        self.bin_width = bin_width
+        self.over = over
+        self.quantiles = list(quantiles)
+        self.smooth_window = smooth_window
+        self.final_window = final_window
+        # key -> run -> BinTable of per-metric sums and counts, or key -> BinTable of per-metric moments
+        self.tables = {}
+        # key -> run -> metric -> (last x, final value)
+        self.finals = {}
+
+    def key(self, exp):
+        if callable(self.group):
+            return self.group(exp)
+        if isinstance(self.group, (list, tuple)):
+            return tuple(exp.config.get(g) for g in self.group)
+        return exp.config.get(self.group)
+
+    def _new_table(self):
+        if self.over == 'runs':
+            stats = (('sum', np.add, 0), ('count', np.add, 0))
+        else:
+            stats = (('count', np.add, 0), ('sum', np.add, 0), ('sumsq', np.add, 0), ('min', np.minimum, np.inf), ('max', np.maximum, -np.inf))
+        return BinTable({(m, name): (ufunc, identity) for m in self.metrics for name, ufunc, identity in stats})
+
+    def add(self, exp, logs, run=None):
+        """
+        Adds the logs of one experiment, as a list of dicts or a dict of arrays.
+        `run` identifies the run for `over='runs'`, it defaults to the experiment directory. Logs added under the same run are merged.
+        """
+        xs = get_column(exp, logs, self.x)
+        columns = {m: get_column(exp, logs, m) for m in self.metrics}
+        return self.add_arrays(self.key(exp), str(exp.expdir) if run is None else run, xs, columns)
+
+    def add_arrays(self, key, run, xs, columns):
+        """
+        Adds one run given as arrays: `columns` maps each metric to an array aligned with `xs`.
+        """
+        xs = np.asarray(xs, dtype=float)
+        order = np.argsort(xs, kind='stable')
+        xs = xs[order]
+        valid_x = ~np.isnan(xs)
+        bins = np.floor(np.where(valid_x, xs, 0) / self.bin_width).astype(np.int64)
+        if self.over == 'runs':
+            table = self.tables.setdefault(key, {}).get(run)
+            if table is None:
+                table = self.tables[key][run] = self._new_table()
+        else:
+            table = self.tables.get(key)
+            if table is None:
+                table = self.tables[key] = self._new_table()
+        finals = self.finals.setdefault(key, {}).setdefault(run, {})
+        for m in self.metrics:
+            ys = np.asarray(columns[m], dtype=float)[order]
+            if self.smooth_window > 1:
+                ys = rolling_mean(ys, self.smooth_window, min_periods=1)
+            keep = valid_x & ~np.isnan(ys)
+            if not keep.any():
+                continue
+            ys_m = ys[keep]
+            last_x = xs[keep][-1]
+            if m not in finals or last_x >= finals[m][0]:
+                finals[m] = (last_x, ys_m[-self.final_window:].mean())
+            keys, stats = _reduce_bins(bins[keep], ys_m)
+            if self.over == 'runs':
+                table.add(keys, {(m, 'sum'): stats['sum'], (m, 'count'): stats['count']})
+            else:
+                table.add(keys, {(m, name): stats[name] for name in ('count', 'sum', 'sumsq', 'min', 'max')})
+        return self
+
+    def _run_stats(self, runs, m):
+        bins = np.unique(np.concatenate([t.bins for t in runs.values()] or [np.zeros(0, dtype=np.int64)]))
+        means = np.full((len(runs), len(bins)), np.nan)
+        for i, t in enumerate(runs.values()):
+            idx = np.searchsorted(bins, t.bins)
+            count = t.columns[(m, 'count')]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means[i, idx] = np.where(count > 0, t.columns[(m, 'sum')] / count, np.nan)
+        count = (~np.isnan(means)).sum(axis=0)
+        full = count > 0
+        bins, means, count = bins[full], means[:, full], count[full]
+        result = dict(x=bins * self.bin_width, count=count)
+        if not len(bins):
+            result.update(mean=np.zeros(0), std=np.zeros(0), min=np.zeros(0), max=np.zeros(0))
+            result.update(('q{:g}'.format(100 * q), np.zeros(0)) for q in self.quantiles)
+            return result
+        result.update(
+            mean=np.nanmean(means, axis=0),
+            std=np.nanstd(means, axis=0),
+            min=np.nanmin(means, axis=0),
+            max=np.nanmax(means, axis=0),
+        )
+        for q in self.quantiles:
+            result['q{:g}'.format(100 * q)] = np.nanquantile(means, q, axis=0)
+        return result
+
+    def _row_stats(self, table, m):
+        count = table.columns[(m, 'count')]
+        full = count > 0
+        count = count[full]
+        mean = table.columns[(m, 'sum')][full] / count
+        return dict(
+            x=table.bins[full] * self.bin_width,
+            count=count.astype(int),
+            mean=mean,
+            std=np.sqrt(np.maximum(0, table.columns[(m, 'sumsq')][full] / count - mean ** 2)),
+            min=table.columns[(m, 'min')][full],
+            max=table.columns[(m, 'max')][full],
+        )
+
+    def result(self):
+        """
+        Returns `{group: {metric: stats}}`, where `stats` holds arrays `x` (the start of each non-empty bin), `count` (runs, or
+        records with `over='rows'`), `mean`, `std`, `min`, `max`, and `q<percent>` for each quantile, e.g. `q50` for the median.
+        """
+        out = {}
+        for key, tables in self.tables.items():
+            if self.over == 'runs':
+                out[key] = {m: self._run_stats(tables, m) for m in self.metrics}
+            else:
+                out[key] = {m: self._row_stats(tables, m) for m in self.metrics}
+        return out
+
+    def report(self, metric, mode='max'):
+        """
+        Returns one row per group with the mean, std, min and max over runs of the final value of `metric`, and the best run,
+        sorted from the best group (highest mean with `mode='max'`, lowest with `mode='min'`) to the worst.
+        """
+        assert mode in ('max', 'min'), 'mode must be max or min'
+        rows = []
+        for key, runs in self.finals.items():
+            finals = {run: f[metric][1] for run, f in runs.items() if metric in f}
+            if not finals:
+                continue
+            values = np.array(list(finals.values()))
+            best = (max if mode == 'max' else min)(finals, key=finals.get)
+            rows.append(dict(group=key, runs=len(values), mean=values.mean(), std=values.std(), min=values.min(), max=values.max(),
+                             best_run=best, best=finals[best]))
+        rows.sort(key=lambda r: r['mean'], reverse=mode == 'max')
+        return rows
+
+
+def aggregate(exps_and_logs, x, metrics, **kwargs):
+    """
+    Feeds every `(experiment, logs)` of the iterable, e.g. `Experiment.iter_logs`, to an `Aggregator` and returns it.
+    """
+    agg = Aggregator(x, metrics, **kwargs)
+    for exp, logs in exps_and_logs:
+        agg.add(exp, logs)
+    return agg
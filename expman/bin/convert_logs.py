@@ -1,18 +1,145 @@
 #!/usr/bin/env python
 import os
+import time
 import tqdm
 import argparse
+import concurrent.futures
+import functools
+import ujson as json
+from ..loggers import blocks
 from ..loggers.json_logger import JSONLogger
-from ..loggers.wandb_logger import WandbLogger
 from ..experiment import Experiment
 
 
+def marker_path(fdst):
+    return fdst + '.converted.json'
+
+
+def unmark_converted(fdst):
+    """
+    Removes the marker of `fdst` before it is rewritten, so that it is not taken as complete if the conversion is interrupted.
+    """
+    try:
+        os.remove(marker_path(fdst))
+    except FileNotFoundError:
+        pass
+
+
+def mark_converted(st, fdst):
+    """
+    Records the size and mtime `st` of the source `fdst` was converted from. Written last, so that a conversion that was
+    interrupted half-way is never taken for a complete one.
+    """
+    fmark = marker_path(fdst)
+    ftmp = '{}.{}.tmp'.format(fmark, os.getpid())
+    with open(ftmp, 'wt') as f:
+        json.dump(dict(size=st.st_size, mtime_ns=st.st_mtime_ns), f)
+    os.replace(ftmp, fmark)
+
+
+def up_to_date(fsrc, fdst):
+    """
+    Whether `fdst` exists and was completely converted from `fsrc` with its current size and mtime, see `mark_converted`.
+    """
+    if not os.path.exists(fdst):
+        return False
+    try:
+        with open(marker_path(fdst)) as f:
+            mark = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    st = os.stat(fsrc)
+    return mark.get('size') == st.st_size and mark.get('mtime_ns') == st.st_mtime_ns
+
+
+def convert_rl(frl, force=False):
+    """
+    Returns the number of converted rows and bytes, or `None` if the output was up to date.
+    """
+    flog = os.path.join(os.path.dirname(frl), 'logs.csv')
+    fexp = os.path.join(os.path.dirname(frl), 'exp.json')
+    fout = os.path.join(os.path.dirname(frl), 'log.jsonl')
+    if not force and up_to_date(frl, fexp) and (not os.path.isfile(flog) or up_to_date(flog, fout)):
+        return None
+    st = os.stat(frl)
+    unmark_converted(fexp)
+    Experiment.convert_rl_exp(frl)
+    mark_converted(st, fexp)
+    if not os.path.isfile(flog):
+        return 0, 0
+    st = os.stat(flog)
+    unmark_converted(fout)
+    log = JSONLogger.convert_rl_log(flog, delete_existing=True)
+    mark_converted(st, fout)
+    return getattr(log, 'num_records', 0), st.st_size
+
+
+def convert_columnar(flog, force=False):
+    from ..loggers.columnar_logger import ColumnarLogger
+    fjson = os.path.join(os.path.dirname(flog), 'log.jsonl')
+    fjson = blocks.find_log(fjson) or fjson
+    fout = os.path.join(os.path.dirname(flog), 'log.columns')
+    if not force and up_to_date(fjson, fout):
+        return None
+    st = os.stat(fjson)
+    unmark_converted(fout)
+    log = ColumnarLogger.convert_json_log(fjson)
+    mark_converted(st, fout)
+    return log.num_rows, st.st_size
+
+
+def convert_compressed(flog, force=False, compression='gzip', block_size=1000, delete_source=False):
+    """
+    Compresses the `log.jsonl` next to `flog`. The plain log is kept, and still preferred by readers, unless `delete_source`
+    is set, in which case it is removed once completely compressed, also by a later run if its compressed log is up to date.
+    """
+    fjson = os.path.join(os.path.dirname(flog), 'log.jsonl')
+    fout = fjson + blocks.CODECS[compression]['ext']
+    if not os.path.isfile(fjson):
+        return None
+    if not force and up_to_date(fjson, fout):
+        if delete_source:
+            os.remove(fjson)
+        return None
+    st = os.stat(fjson)
+    unmark_converted(fout)
+    log = JSONLogger.compress_log(fjson, compression=compression, block_size=block_size, delete_existing=delete_source)
+    mark_converted(st, fout)
+    return log.num_records, st.st_size
+
+
+def run(fn, files, jobs, force, desc):
+    """
+    Applies `fn` to every file in a pool of `jobs` processes and prints throughput statistics.
+    """
+    start = time.time()
+    rows = size = skipped = 0
+    with concurrent.futures.ProcessPoolExecutor(jobs) if jobs > 1 else concurrent.futures.ThreadPoolExecutor(1) as executor:
+        for result in tqdm.tqdm(executor.map(fn, files, [force] * len(files)), desc, total=len(files)):
+            if result is None:
+                skipped += 1
+            else:
+                rows += result[0]
+                size += result[1]
+    elapsed = max(time.time() - start, 1e-9)
+    print('{}: converted {} files, skipped {} up to date, {:.0f} rows/s, {:.1f} MB/s'.format(
+        desc, len(files) - skipped, skipped, rows / elapsed, size / 2 ** 20 / elapsed))
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('-i', '--input_type', choices=('expman', 'rl'), default='expman', help='input format')
-    parser.add_argument('-o', '--output_type', choices=('expman', 'rl', 'wandb'), default='expman', help='output format')
+    parser.add_argument('-o', '--output_type', choices=('expman', 'rl', 'wandb', 'columnar', 'compressed'), default='expman', help='output format')
     parser.add_argument('--project', help='wandb project name')
     parser.add_argument('--ignore', nargs='*', help='fields to ignore in config file', default=tuple())
+    parser.add_argument('--jobs', type=int, help='number of files to convert in parallel', default=1)
+    parser.add_argument('--force', action='store_true', help='convert files even if their output is up to date')
+    parser.add_argument('--batch_size', type=int, help='records per wandb upload batch', default=1000)
+    parser.add_argument('--sync_every', type=int, help='records after which a wandb upload is synced and its progress saved, by default only at the end')
+    parser.add_argument('--restart', action='store_true', help='reupload to wandb from scratch instead of resuming interrupted uploads')
+    parser.add_argument('--compression', choices=tuple(blocks.CODECS), help='codec of compressed logs', default='gzip')
+    parser.add_argument('--block_size', type=int, help='records per block of compressed logs', default=1000)
+    parser.add_argument('--delete_source', action='store_true', help='remove plain logs once compressed, they are kept otherwise')
     parser.add_argument('log_files', nargs='+', help='logs to convert')
     args = parser.parse_args()
 
@@ -22,11 +149,7 @@ def main():
     if args.input_type == 'expman':
         pass
     elif args.input_type == 'rl':
-        for frl in tqdm.tqdm(files, '{}2expman'.format(args.input_type)):
-            Experiment.convert_rl_exp(frl)
-            flog = os.path.join(os.path.dirname(frl), 'logs.csv')
-            if os.path.isfile(flog):
-                JSONLogger.convert_rl_log(flog, delete_existing=True)
+        run(convert_rl, files, args.jobs, args.force, '{}2expman'.format(args.input_type))
     else:
         raise NotImplementedError()
 
@@ -34,9 +157,19 @@ def main():
     if args.output_type == 'expman':
         return
     elif args.output_type == 'wandb':
+        from ..loggers.wandb_logger import WandbLogger
         assert args.project, 'Must give project to wandb'
-        for flog in tqdm.tqdm(files, 'expman2{}'.format(args.output_type)):
-            fexp = os.path.join(os.path.dirname(flog), 'exp.json')
-            WandbLogger.convert_exp(fexp, args.project, ignore=args.ignore)
+        fexps = [os.path.join(os.path.dirname(flog), 'exp.json') for flog in files]
+        if args.jobs > 1:
+            with tqdm.tqdm(total=len(fexps), desc='expman2{}'.format(args.output_type)) as bar:
+                WandbLogger.convert_exps(fexps, args.project, ignore=args.ignore, batch_size=args.batch_size, resume=not args.restart, sync_every=args.sync_every, workers=args.jobs, callback=lambda fexp: bar.update())
+        else:
+            for fexp in tqdm.tqdm(fexps, 'expman2{}'.format(args.output_type)):
+                WandbLogger.convert_exp(fexp, args.project, ignore=args.ignore, batch_size=args.batch_size, resume=not args.restart, sync_every=args.sync_every)
+    elif args.output_type == 'columnar':
+        run(convert_columnar, files, args.jobs, args.force, 'expman2{}'.format(args.output_type))
+    elif args.output_type == 'compressed':
+        fn = functools.partial(convert_compressed, compression=args.compression, block_size=args.block_size, delete_source=args.delete_source)
+        run(fn, files, args.jobs, args.force, 'expman2{}'.format(args.compression))
     else:
         raise NotImplementedError()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import argparse
+import datetime
+import time
+from expman.monitor import Monitor, STATES
+from expman.bin.report import format_table
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '-'
+    seconds = int(seconds)
+    if seconds < 3600:
+        return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}h{:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+
+
+def show(monitor, states):
+    runs = monitor.poll()
+    rows = [dict(
+        name=r['name'],
+        state=r['state'],
+        step=r['step'],
+        rate='-' if r['rate'] is None else '{:.3g}'.format(r['rate']),
+        idle=format_duration(r['idle']),
+        job=r['job_id'] or '-',
+        job_state=r['job_state'] or '-',
+    ) for r in runs if not states or r['state'] in states]
+    if rows:
+        print(format_table(rows, ['name', 'state', 'step', 'rate', 'idle', 'job', 'job_state']))
+    summary = Monitor.summary(runs)
+    print('{}  {} runs: {}  {:.4g} steps/s'.format(
+        datetime.datetime.now().strftime('%H:%M:%S'), summary['runs'],
+        ', '.join('{} {}'.format(summary[s], s) for s in STATES if summary[s]), summary['rate']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shows which experiments are running, stalled, finished or crashed, and their throughput')
+    parser.add_argument('glob', help='directories of experiments to monitor')
+    parser.add_argument('--watch', help='poll again every this many seconds', type=float)
+    parser.add_argument('--states', nargs='+', help='only list runs in these states', choices=STATES)
+    parser.add_argument('--stall_after', help='seconds without writes after which a run is stalled', type=float, default=600)
+    parser.add_argument('--dead_after', help='seconds without writes after which a run with no running job is crashed', type=float, default=3600)
+    parser.add_argument('--stall_factor', help='a run is also only stalled after this many times its usual interval between writes', type=float, default=10)
+    parser.add_argument('--no_slurm', help='do not query sacct for the state of slurm jobs', action='store_true')
+    args = parser.parse_args()
+
+    monitor = Monitor(args.glob, stall_after=args.stall_after, dead_after=args.dead_after, stall_factor=args.stall_factor, slurm=not args.no_slurm)
+    show(monitor, args.states)
+    while args.watch:
+        time.sleep(args.watch)
+        print()
+        show(monitor, args.states)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+import argparse
+from expman import Experiment, JSONLogger
+from expman.aggregate import Aggregator
+
+
+def format_table(rows, columns):
+    cells = [[str(c) for c in columns]] + [[format_cell(r[c]) for c in columns] for r in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    lines = ['  '.join(cell.ljust(w) for cell, w in zip(row, widths)) for row in cells]
+    lines.insert(1, '  '.join('-' * w for w in widths))
+    return '\n'.join(lines)
+
+
+def format_cell(value):
+    if isinstance(value, float):
+        return '{:.4g}'.format(value)
+    if isinstance(value, tuple):
+        return '-'.join(map(str, value))
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tabulates the final value of a metric per group of experiments, best group first')
+    parser.add_argument('glob', help='directories of experiments to report on')
+    parser.add_argument('-y', '--metric', help='metric to report', required=True)
+    parser.add_argument('-x', help='column giving the order of records', default='step')
+    parser.add_argument('--group', nargs='+', help='config fields to group experiments by', default=['seedless_name'])
+    parser.add_argument('--mode', help='whether higher or lower values are better', choices=('max', 'min'), default='max')
+    parser.add_argument('--last', help='average the metric over this many last records of each experiment', type=int, default=1)
+    parser.add_argument('--every', help='only read every this many records', type=int, default=1)
+    args = parser.parse_args()
+
+    group = args.group[0] if len(args.group) == 1 else args.group
+    agg = Aggregator(args.x, [args.metric], group=group, final_window=args.last)
+    for exp, logs in Experiment.iter_logs(args.glob, JSONLogger(), columns=[args.x, args.metric], every=args.every):
+        agg.add(exp, logs)
+    rows = agg.report(args.metric, mode=args.mode)
+    print(format_table(rows, ['group', 'runs', 'mean', 'std', 'min', 'max', 'best']))
@@ -1,32 +1,36 @@
 #!/usr/bin/env bash
 import argparse
+import glob
+import os
+import shutil
+import time
+import numpy as np
 import plotille
-import pandas as pd
 from expman import Experiment, JSONLogger
+from expman.aggregate import Aggregator, get_column
+from expman.downsample import downsample, rolling_mean, StreamingBuckets, METHODS
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Plots an experiment in terminal')
-    parser.add_argument('glob', help='directory of experiment to plot')
-    parser.add_argument('--window', help='smoothing window', type=int, default=100)
-    parser.add_argument('--width', help='smoothing window', type=int)
-    parser.add_argument('--height', help='smoothing window', type=int)
-    parser.add_argument('-x', help='x axis', default='frames')
-    parser.add_argument('-y', help='y axis', default='mean_win_rate')
-    args = parser.parse_args()
+def num_points(args):
+    # braille characters fit two points per column
+    return 2 * (args.width or shutil.get_terminal_size().columns)
 
-    exps_and_logs = Experiment.discover_logs(args.glob, JSONLogger())
-    print('loaded {} experiments'.format(len(exps_and_logs)))
 
+def draw(series, args):
+    """
+    Args:
+        series: list of `(name, xs, ys)`, `ys` already smoothed.
+    """
     fig = plotille.Figure()
     kwargs = {}
-    for exp, log in exps_and_logs:
-        if log:
-            df = pd.DataFrame(log)
+    for name, xs, ys in series:
+        if len(xs):
+            if args.downsample != 'none':
+                xs, ys = downsample(xs, ys, num_points(args), method=args.downsample)
             fig.plot(
-                X=df[args.x], 
-                Y=df[args.y].rolling(args.window, min_periods=1).mean(),
-                label=exp.name,
+                X=xs,
+                Y=ys,
+                label=name,
                 **kwargs
             )
     fig.x_label = args.x
@@ -35,5 +39,96 @@ def main():
         fig.height = args.height
     if args.width:
         fig.width = args.width
+    return fig.show(legend=True)
+
+
+def smooth_buckets(stats, window):
+    """
+    Trailing rolling mean of the buckets of `StreamingBuckets.result()` over about `window` records, weighted by their counts.
+    """
+    count = stats['count']
+    if window <= 1 or not len(count):
+        return stats['mean']
+    k = max(1, int(round(window / count.mean())))
+    sums, counts = np.cumsum(stats['mean'] * count), np.cumsum(count)
+    sums[k:] = sums[k:] - sums[:-k]
+    counts[k:] = counts[k:] - counts[:-k]
+    return sums / counts
+
+
+def follow(args):
+    exps = [Experiment.from_fconfig(f) for f in sorted(glob.glob(os.path.join(args.glob, 'exp.json')))]
+    print('following {} experiments'.format(len(exps)))
+    columns = [args.x, args.y]
+    followers = [exp.follow(JSONLogger(), columns=columns, batch=True, poll_interval=0) for exp in exps]
+    # new records are averaged into terminal-width buckets, so old data is neither kept nor re-read
+    buckets = [StreamingBuckets(num_points(args)) for _ in exps]
+    try:
+        while True:
+            start = time.time()
+            for b, follower in zip(buckets, followers):
+                log = [d for d in next(follower) if all(k in d for k in columns)][::args.every]
+                b.add([d[args.x] for d in log], [d[args.y] for d in log])
+            series = []
+            for exp, b in zip(exps, buckets):
+                stats = b.result()
+                series.append((exp.name, stats['x'], smooth_buckets(stats, args.window)))
+            # clear the terminal and redraw from the top
+            print('\033[H\033[J' + draw(series, args), flush=True)
+            time.sleep(max(0, 1 / args.fps - (time.time() - start)))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plots an experiment in terminal')
+    parser.add_argument('glob', help='directory of experiment to plot')
+    parser.add_argument('--window', help='smoothing window', type=int, default=100)
+    parser.add_argument('--width', help='smoothing window', type=int)
+    parser.add_argument('--height', help='smoothing window', type=int)
+    parser.add_argument('-x', help='x axis', default='frames')
+    parser.add_argument('-y', help='y axis', default='mean_win_rate')
+    parser.add_argument('--every', help='only plot every this many records', type=int, default=1)
+    parser.add_argument('--follow', help='keep redrawing as new records are logged', action='store_true')
+    parser.add_argument('--fps', help='redraws per second with --follow', type=float, default=2)
+    parser.add_argument('--overview', help='plot the per-bucket summaries written with JSONLogger(summary_levels=...)', action='store_true')
+    parser.add_argument('--downsample', help='how to reduce lines to the terminal width', choices=METHODS + ('none', ), default='lttb')
+    parser.add_argument('--group', nargs='+', help='config fields to average experiments over, e.g. seedless_name, instead of one line per experiment')
+    parser.add_argument('--bin', type=float, help='width of the x bins records are averaged over, 1 with --group. Without either, each experiment is plotted at its logged x values')
+    args = parser.parse_args()
+
+    if args.follow:
+        follow(args)
+        return
+
+    kwargs = dict(summary_level='auto', summary_points=num_points(args)) if args.overview else {}
+    logs = Experiment.iter_logs(args.glob, JSONLogger(), columns=[args.x, args.y], every=args.every, **kwargs)
+    if not args.group and args.bin is None:
+        series = []
+        for exp, log in logs:
+            xs, ys = get_column(exp, log, args.x), get_column(exp, log, args.y)
+            valid = ~np.isnan(xs) & ~np.isnan(ys)
+            series.append((str(exp.name), xs[valid], rolling_mean(ys[valid], args.window, min_periods=1)))
+        print('loaded {} experiments'.format(len(series)))
+        print(draw(sorted(series, key=lambda s: s[0]), args))
+        return
 
-    print(fig.show(legend=True))
+    if args.group:
+        group = args.group[0] if len(args.group) == 1 else args.group
+    else:
+        # one line per experiment, labelled with its name whatever its name field
+        group = lambda exp: str(exp.expdir)
+    agg = Aggregator(args.x, [args.y], group=group, bin_width=args.bin or 1, smooth_window=args.window)
+    names = {}
+    for exp, log in logs:
+        agg.add(exp, log)
+        names[str(exp.expdir)] = exp.name
+    print('loaded {} experiments'.format(len(names)))
+    series = []
+    for key, stats in sorted(agg.result().items(), key=lambda kv: str(names.get(kv[0], kv[0]))):
+        if not args.group:
+            name = str(names[key])
+        else:
+            name = '-'.join(map(str, key)) if isinstance(key, tuple) else str(key)
+        series.append((name, stats[args.y]['x'], stats[args.y]['mean']))
+    print(draw(series, args))
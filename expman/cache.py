@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import os
+import pickle
+import ujson as json
+
+
+class LogCache:
+    """
+    On-disk cache of parsed `exp.json` and `log.jsonl` files.
+
+    Each cached file is keyed by its path and remembers the size, mtime, inode and byte offset it was parsed up to.
+    Unchanged files are returned from the cache, and files that only grew are parsed from the remembered offset.
+    A file that shrank, was replaced or whose first bytes changed (e.g. recreated with `delete_existing=True`) is parsed again.
+    The rows parsed from a grown log are appended to its entry rather than rewriting all of them, see `append`.
+
+    The least recently used entries are evicted once there are more than `max_entries` or they take more than `max_bytes`.
+    The cache directory is only listed when the entries and bytes written since the last eviction may exceed these limits, or
+    every `evict_every` writes to account for other processes, rather than on every write.
+    """
+
+    DIRNAME = '.expman_cache'
+    HEAD_SIZE = 256
+    # caches shared by the loads of this process, see `shared`
+    _shared = {}
+    # appended frames after which an entry is rewritten as one, so that reading it stays cheap
+    MAX_APPENDS = 64
+    # once over a limit, entries are evicted down to this fraction of it, so that the next writes do not list the cache again
+    LOW_WATERMARK = 0.9
+
+    def __init__(self, root, max_entries=10000, max_bytes=2 ** 30, evict_every=1000):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        # estimates of the size of the cache, `None` until the directory is first listed
+        self.num_entries = None
+        self.num_bytes = None
+        self.writes = 0
+
+    @classmethod
+    def for_logdir(cls, logdir, **kwargs):
+        return cls(os.path.join(logdir, cls.DIRNAME), **kwargs)
+
+    @classmethod
+    def shared(cls, logdir):
+        """
+        Returns the cache of `logdir` shared within this process, e.g. by a pool worker across the experiments it loads, so that its
+        size estimates and thus the listing of the cache directory are not repeated for every experiment.
+        """
+        root = os.path.join(os.path.abspath(logdir), cls.DIRNAME)
+        cache = cls._shared.get(root)
+        if cache is None:
+            cache = cls._shared[root] = cls(root)
+        return cache
+
+    def _path(self, fname):
+        return os.path.join(self.root, hashlib.sha1(os.path.abspath(fname).encode()).hexdigest() + '.pkl')
+
+    def get(self, fname):
+        fcache = self._path(fname)
+        try:
+            with open(fcache, 'rb') as f:
+                entry = pickle.load(f)
+                entry['appends'] = 0
+                while True:
+                    pos = f.tell()
+                    try:
+                        frame = pickle.load(f)
+                    except Exception:
+                        if pos < os.fstat(f.fileno()).st_size:
+                            # an append that was cut short, later appends would be lost behind it so the entry is rewritten
+                            entry['appends'] = self.MAX_APPENDS
+                        break
+                    entry['appends'] += 1
+                    if frame['start'] != entry['offset']:
+                        # continues another version of the entry, e.g. rows appended twice by concurrent readers
+                        continue
+                    entry['rows'].extend(frame['rows'])
+                    entry.update((k, v) for k, v in frame.items() if k not in ('start', 'rows'))
+            # mark as recently used
+            os.utime(fcache)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.critical('Ignoring corrupt cache entry {}: {}'.format(fcache, repr(e)))
+            return None
+
+    def put(self, fname, entry):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root, exist_ok=True)
+        fcache = self._path(fname)
+        ftmp = '{}.{}.tmp'.format(fcache, os.getpid())
+        new = not os.path.isfile(fcache)
+        with open(ftmp, 'wb') as f:
+            pickle.dump({k: v for k, v in entry.items() if k != 'appends'}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        os.replace(ftmp, fcache)
+        self._written(size, new)
+
+    def append(self, fname, start, rows, **meta):
+        """
+        Appends `rows`, parsed from byte `start` of `fname`, and the updated `meta` to the entry of `fname` in one write.
+        `get` only applies them if the entry was parsed up to `start`. Raises `FileNotFoundError` if the entry was evicted.
+        """
+        data = pickle.dumps(dict(meta, start=start, rows=rows), protocol=pickle.HIGHEST_PROTOCOL)
+        fd = os.open(self._path(fname), os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self._written(len(data), False)
+
+    def _written(self, size, new):
+        self.writes += 1
+        if self.num_entries is not None:
+            self.num_entries += new
+            self.num_bytes += size
+        if self.num_entries is None or self.num_entries > self.max_entries or self.num_bytes > self.max_bytes or \
+                self.writes >= self.evict_every:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        with os.scandir(self.root) as it:
+            for e in it:
+                if e.name.endswith('.pkl'):
+                    st = e.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, e.path))
+        entries.sort(reverse=True)
+        max_entries, max_bytes = self.max_entries, self.max_bytes
+        if len(entries) > max_entries or sum(e[1] for e in entries) > max_bytes:
+            max_entries, max_bytes = int(max_entries * self.LOW_WATERMARK), int(max_bytes * self.LOW_WATERMARK)
+        total = kept = kept_bytes = 0
+        for i, (_, size, path) in enumerate(entries):
+            total += size
+            if i >= max_entries or total > max_bytes:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                kept += 1
+                kept_bytes += size
+        self.num_entries, self.num_bytes, self.writes = kept, kept_bytes, 0
+
+    @staticmethod
+    def _unchanged(entry, st):
+        return entry is not None and entry['ino'] == st.st_ino and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+
+    def read_json(self, fname):
+        """
+        Returns the decoded contents of the JSON file `fname`.
+        """
+        st = os.stat(fname)
+        entry = self.get(fname)
+        if self._unchanged(entry, st):
+            return entry['content']
+        with open(fname) as f:
+            content = json.load(f)
+        self.put(fname, dict(ino=st.st_ino, size=st.st_size, mtime_ns=st.st_mtime_ns, content=content))
+        return content
+
+    def read_jsonl(self, fname, error='warn'):
+        """
+        Returns the decoded records of the JSON lines file `fname`, only parsing lines appended since the last call.
+        A trailing line without a newline is left for the next call.
+        """
+        st = os.stat(fname)
+        entry = self.get(fname)
+        if self._unchanged(entry, st):
+            return entry['rows']
+        with open(fname, 'rb') as f:
+            head = f.read(self.HEAD_SIZE)
+            if entry is not None and entry['ino'] == st.st_ino and entry['offset'] <= st.st_size and head.startswith(entry['head']):
+                rows, start = entry['rows'], entry['offset']
+            else:
+                entry, rows, start = None, [], 0
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        new = []
+        for line in data[:end].splitlines():
+            try:
+                new.append(json.loads(line))
+            except Exception as e:
+                if error == 'warn':
+                    logging.critical('In {}'.format(fname))
+                    logging.critical(repr(e))
+                elif error == 'ignore':
+                    pass
+                else:
+                    raise e
+        offset = start + end
+        meta = dict(ino=st.st_ino, size=st.st_size, mtime_ns=st.st_mtime_ns, offset=offset, head=head[:offset])
+        rows.extend(new)
+        if entry is not None and entry['appends'] < self.MAX_APPENDS:
+            try:
+                self.append(fname, start, new, **meta)
+                return rows
+            except FileNotFoundError:
+                pass
+        self.put(fname, dict(meta, rows=rows))
+        return rows
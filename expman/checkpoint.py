@@ -0,0 +1,224 @@
+import copy
+import datetime
+import glob
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+import ujson as json
+
+
+def _torch_save(obj, fname):
+    import torch
+    torch.save(obj, fname)
+
+
+def _torch_load(fname, mmap=False, **kwargs):
+    import inspect
+    import torch
+    if mmap and 'mmap' in inspect.signature(torch.load).parameters:
+        try:
+            return torch.load(fname, mmap=True, **kwargs)
+        except RuntimeError:
+            # only checkpoints in the zip format (the default since torch 1.6) can be memory-mapped
+            pass
+    return torch.load(fname, **kwargs)
+
+
+class CheckpointEngine:
+    """
+    Writes checkpoints without blocking training and without ever overwriting the last good one.
+
+    `save` copies the state to CPU memory and returns, a background thread then writes it to `<base>.<version>.<ext>.tmp`,
+    syncs it to disk and renames it into place. Only the last `keep` versions are kept, and they are listed, oldest first,
+    in `<base>.manifest.json`, which is also replaced atomically. `load_latest` tries them newest first and falls back to older
+    ones, and finally to a checkpoint written directly to `path` by older versions of expman.
+
+    Args:
+        path: the checkpoint path, e.g. `<logdir>/<name>/job.tar`, from which the versioned file names are derived.
+        keep: number of checkpoints to keep.
+        background: write on a background thread. Otherwise `save` only returns once the checkpoint is on disk.
+        incremental: reuse the CPU copy of tensors that were not modified since the last `save`, which is detected from their
+            identity, storage and version counter. Tensors modified through `.data` do not bump the version counter, so
+            only enable this if the job modifies its tensors in place through regular operations or replaces them.
+        save_fn: `save_fn(obj, fname)` writes a checkpoint, `torch.save` by default.
+        load_fn: `load_fn(fname, **kwargs)` reads one, `torch.load` by default. With `mmap=True` and torch >= 2.1, tensors are
+            memory-mapped from the file and only read from disk when accessed.
+
+    If `instrumentation` is set to an `expman.instrument.Instrumentation`, e.g. that of the job's experiment, the duration of
+    each write is recorded as `checkpoint.write`, and the checkpoints and their bytes are counted.
+    """
+
+    def __init__(self, path, keep=3, background=True, incremental=False, save_fn=None, load_fn=None):
+        assert keep >= 1, 'Must keep at least one checkpoint'
+        self.path = path
+        self.base, self.ext = os.path.splitext(path)
+        self.keep = keep
+        self.background = background
+        self.incremental = incremental
+        self.save_fn = save_fn or _torch_save
+        self.load_fn = load_fn or _torch_load
+        self.thread = None
+        self.error = None
+        self.tensors = {}
+        self.lock = threading.Lock()
+        self.instrumentation = None
+
+    @property
+    def manifest_path(self):
+        return self.base + '.manifest.json'
+
+    def version_path(self, version):
+        return '{}.{}{}'.format(self.base, version, self.ext)
+
+    def read_manifest(self):
+        """
+        Returns the list of checkpoint entries, oldest first. If the manifest is missing or unreadable, the versioned files on disk are listed instead.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)['checkpoints']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.critical('Ignoring corrupt checkpoint manifest {}: {}'.format(self.manifest_path, repr(e)))
+        pattern = re.compile(re.escape(os.path.basename(self.base)) + r'\.(\d+)' + re.escape(self.ext) + '$')
+        versions = []
+        for fname in glob.glob(glob.escape(self.base) + '.*' + self.ext):
+            m = pattern.match(os.path.basename(fname))
+            if m:
+                versions.append(int(m.group(1)))
+        return [dict(version=v, fname=os.path.basename(self.version_path(v))) for v in sorted(versions)]
+
+    def _write_manifest(self, entries):
+        ftmp = '{}.{}.tmp'.format(self.manifest_path, os.getpid())
+        with open(ftmp, 'wt') as f:
+            json.dump(dict(checkpoints=entries), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ftmp, self.manifest_path)
+
+    def snapshot(self, obj, key=''):
+        """
+        Returns a copy of `obj` that shares no memory with the training state: tensors are copied to CPU and other values deep-copied.
+        """
+        torch = sys.modules.get('torch')
+        if torch is not None and isinstance(obj, torch.Tensor):
+            return self._snapshot_tensor(obj, key)
+        if isinstance(obj, dict):
+            # a shallow copy keeps the mapping's class and attributes, e.g. the `_metadata` of a state_dict or a default_factory
+            snapshot = copy.copy(obj)
+            for k, v in obj.items():
+                snapshot[k] = self.snapshot(v, '{}/{}'.format(key, k))
+            if hasattr(obj, '_metadata'):
+                snapshot._metadata = copy.deepcopy(obj._metadata)
+            return snapshot
+        if isinstance(obj, (list, tuple)) and not hasattr(obj, '_fields'):
+            return obj.__class__(self.snapshot(v, '{}/{}'.format(key, i)) for i, v in enumerate(obj))
+        if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+            return obj
+        return copy.deepcopy(obj)
+
+    def _snapshot_tensor(self, t, key):
+        signature = (t.data_ptr(), t._version, t.dtype, t.shape, t.device)
+        if self.incremental:
+            cached = self.tensors.get(key)
+            if cached is not None and cached[0]() is t and cached[1] == signature:
+                return cached[2]
+        cpu = t.detach().to('cpu', copy=True)
+        if self.incremental:
+            self.tensors[key] = (weakref.ref(t), signature, cpu)
+        return cpu
+
+    def save(self, state, **meta):
+        """
+        Snapshots `state` and writes it as the next checkpoint version. Extra keyword arguments are stored in its manifest entry.
+        Waits for the previous write first, so at most one checkpoint is in memory besides the training state.
+        """
+        self.wait()
+        snapshot = self.snapshot(state)
+        if self.background:
+            # not a daemon, so a checkpoint being written when the job exits is still completed
+            self.thread = threading.Thread(target=self._write, args=(snapshot, meta), name='expman-checkpoint')
+            self.thread.start()
+        else:
+            self._write(snapshot, meta)
+            self.raise_error()
+
+    def _write(self, snapshot, meta):
+        inst = self.instrumentation
+        t0 = time.perf_counter_ns()
+        try:
+            with self.lock:
+                entries = self.read_manifest()
+                version = max([e['version'] for e in entries], default=-1) + 1
+                fname = self.version_path(version)
+                ftmp = '{}.{}.tmp'.format(fname, os.getpid())
+                self.save_fn(snapshot, ftmp)
+                with open(ftmp, 'rb+') as f:
+                    os.fsync(f.fileno())
+                os.replace(ftmp, fname)
+                entry = dict(version=version, fname=os.path.basename(fname), time=datetime.datetime.utcnow().isoformat(), bytes=os.path.getsize(fname))
+                entry.update(meta)
+                if inst is not None:
+                    inst.record('checkpoint.write', time.perf_counter_ns() - t0)
+                    inst.count('checkpoint.count')
+                    inst.count('checkpoint.bytes', entry['bytes'])
+                entries.append(entry)
+                entries, old = entries[-self.keep:], entries[:-self.keep]
+                self._write_manifest(entries)
+                for e in old:
+                    try:
+                        os.remove(os.path.join(os.path.dirname(self.path), e['fname']))
+                    except FileNotFoundError:
+                        pass
+        except Exception as e:
+            logging.critical('Failed to write checkpoint {}: {}'.format(self.path, repr(e)))
+            self.error = e
+
+    def raise_error(self):
+        if self.error is not None:
+            e, self.error = self.error, None
+            raise e
+
+    def wait(self):
+        """
+        Blocks until the checkpoint being written, if any, is on disk, and raises the error if writing it failed.
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.raise_error()
+
+    def latest_entry(self):
+        """
+        Returns the manifest entry of the newest checkpoint on disk, with the keyword arguments it was saved with, without loading it.
+        """
+        self.wait()
+        root = os.path.dirname(self.path)
+        for e in reversed(self.read_manifest()):
+            if os.path.isfile(os.path.join(root, e['fname'])):
+                return e
+        return None
+
+    def load_latest(self, **kwargs):
+        """
+        Returns `(state, fname)` for the newest checkpoint that loads, or `(None, None)` if there is none.
+        `kwargs` are passed to `load_fn`, e.g. `map_location` and `mmap`.
+        """
+        self.wait()
+        root = os.path.dirname(self.path)
+        fnames = [os.path.join(root, e['fname']) for e in reversed(self.read_manifest())]
+        if os.path.isfile(self.path):
+            fnames.append(self.path)
+        for fname in fnames:
+            if not os.path.isfile(fname):
+                continue
+            try:
+                return self.load_fn(fname, **kwargs), fname
+            except Exception as e:
+                logging.critical('Failed to load checkpoint {}, trying an older one: {}'.format(fname, repr(e)))
+        return None, None
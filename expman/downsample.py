@@ -0,0 +1,168 @@
+"""
+Reduces long series to roughly the number of points that can be drawn, in O(n) time on NumPy arrays.
+"""
+import numpy as np
+
+
+METHODS = ('lttb', 'minmax', 'mean')
+
+
+def lttb(xs, ys, num_points):
+    """
+    Largest-triangle-three-buckets: keeps the first and last point and, from each of `num_points - 2` buckets,
+    the point that forms the largest triangle with the previously kept point and the average of the next bucket.
+    """
+    n = len(xs)
+    if num_points >= n or num_points < 3:
+        return xs, ys
+    edges = np.append(np.linspace(1, n - 1, num_points - 1).astype(int), n)
+    # average of every bucket, the last "bucket" is the last point
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(xs, edges[:-1]) / counts
+    avg_y = np.add.reduceat(ys, edges[:-1]) / counts
+    keep = np.empty(num_points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(num_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((xs[a] - avg_x[i + 1]) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (avg_y[i + 1] - ys[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return xs[keep], ys[keep]
+
+
+def _bucket_starts(n, num_buckets):
+    return np.unique(np.linspace(0, n, num_buckets + 1).astype(int)[:-1])
+
+
+def bucket_stats(xs, ys, num_buckets):
+    """
+    Splits the series into `num_buckets` buckets of consecutive points and returns their mean x, count, mean, min and max.
+    """
+    n = len(xs)
+    if n == 0:
+        return dict(x=xs, count=np.zeros(0, dtype=int), mean=ys, min=ys, max=ys)
+    starts = _bucket_starts(n, min(num_buckets, n))
+    count = np.diff(np.append(starts, n))
+    return dict(
+        x=np.add.reduceat(xs, starts) / count,
+        count=count,
+        mean=np.add.reduceat(ys, starts) / count,
+        min=np.minimum.reduceat(ys, starts),
+        max=np.maximum.reduceat(ys, starts),
+    )
+
+
+def minmax(xs, ys, num_points):
+    """
+    Keeps the minimum and the maximum of each of `num_points // 2` buckets of consecutive points, so spikes survive.
+    """
+    n = len(xs)
+    if num_points >= n or num_points < 2:
+        return xs, ys
+    starts = _bucket_starts(n, num_points // 2)
+    ends = np.append(starts[1:], n)
+    keep = []
+    for lo, hi in zip(starts, ends):
+        i, j = lo + int(np.argmin(ys[lo:hi])), lo + int(np.argmax(ys[lo:hi]))
+        keep.extend((i, j) if i <= j else (j, i))
+    keep = np.unique(keep)
+    return xs[keep], ys[keep]
+
+
+def rolling_mean(values, window, min_periods):
+    """
+    Trailing mean over `window` values ignoring NaNs, like `pd.Series.rolling(window, min_periods).mean()`.
+    """
+    valid = ~np.isnan(values)
+    sums = np.concatenate([[0], np.cumsum(np.where(valid, values, 0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(0, end - window)
+    count = counts[end] - counts[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[end] - sums[start]) / count
+    mean[count < max(min_periods, 1)] = np.nan
+    return mean
+
+
+def downsample(xs, ys, num_points, method='lttb'):
+    """
+    Reduces `(xs, ys)` to about `num_points` points with one of `METHODS`. NaNs in `ys` are dropped first.
+    """
+    assert method in METHODS, 'method must be one of {}'.format(METHODS)
+    keep = ~np.isnan(ys)
+    xs, ys = xs[keep], ys[keep]
+    if method == 'lttb':
+        return lttb(xs, ys, num_points)
+    elif method == 'minmax':
+        return minmax(xs, ys, num_points)
+    stats = bucket_stats(xs, ys, num_points)
+    return stats['x'], stats['mean']
+
+
+class StreamingBuckets:
+    """
+    Summarises a stream of `(xs, ys)` chunks into at most `num_buckets` equal-width buckets over x, in O(num_buckets) memory.
+
+    The bucket width is picked from the first chunks and doubled, merging neighbouring buckets, whenever new points fall past the last bucket.
+    Points left of the first point seen are put in the first bucket.
+    """
+
+    def __init__(self, num_buckets=1000):
+        self.num_buckets = num_buckets + num_buckets % 2
+        self.origin = None
+        self.width = None
+        self.pending = []
+        n = self.num_buckets
+        self.count = np.zeros(n, dtype=np.int64)
+        self.sum_x = np.zeros(n)
+        self.sum = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+
+    def _coarsen(self):
+        self.width *= 2
+        for name, reduce, empty in (('count', np.add, 0), ('sum_x', np.add, 0), ('sum', np.add, 0), ('min', np.minimum, np.inf), ('max', np.maximum, -np.inf)):
+            values = getattr(self, name)
+            merged = reduce(values[0::2], values[1::2])
+            setattr(self, name, np.concatenate([merged, np.full(len(merged), empty, dtype=values.dtype)]))
+
+    def add(self, xs, ys):
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        keep = ~(np.isnan(xs) | np.isnan(ys))
+        xs, ys = xs[keep], ys[keep]
+        if not len(xs):
+            return self
+        if self.width is None:
+            # wait until the x range is known before choosing a bucket width
+            self.pending.append((xs, ys))
+            xs, ys = np.concatenate([c[0] for c in self.pending]), np.concatenate([c[1] for c in self.pending])
+            span = xs.max() - xs.min()
+            if span == 0:
+                self.pending = [(xs, ys)]
+                return self
+            self.origin, self.width, self.pending = xs.min(), span / (self.num_buckets - 1), []
+        idx = np.maximum(0, np.floor((xs - self.origin) / self.width)).astype(np.int64)
+        while idx.max() >= self.num_buckets:
+            self._coarsen()
+            idx //= 2
+        n = self.num_buckets
+        self.count += np.bincount(idx, minlength=n)
+        self.sum_x += np.bincount(idx, weights=xs, minlength=n)
+        self.sum += np.bincount(idx, weights=ys, minlength=n)
+        np.minimum.at(self.min, idx, ys)
+        np.maximum.at(self.max, idx, ys)
+        return self
+
+    def result(self):
+        """
+        Returns the mean x, count, mean, min and max of the non-empty buckets.
+        """
+        if self.width is None:
+            xs = np.concatenate([c[0] for c in self.pending]) if self.pending else np.zeros(0)
+            ys = np.concatenate([c[1] for c in self.pending]) if self.pending else np.zeros(0)
+            return bucket_stats(xs, ys, 1)
+        full = self.count > 0
+        count = self.count[full]
+        return dict(x=self.sum_x[full] / count, count=count, mean=self.sum[full] / count, min=self.min[full], max=self.max[full])
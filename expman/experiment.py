@@ -1,20 +1,74 @@
 import os
-import glob
 import datetime
+import functools
+import glob
 import logging
+import concurrent.futures
+import fnmatch
+import time
 import ujson as json
 from pathlib import Path
+from .cache import LogCache
+from .instrument import Instrumentation, from_env
+from .scan import scan_experiments
+from .state import StateFile, read_exp
+from .loggers.async_logger import AsyncLogger
+from .loggers.json_logger import resolve_rank
 
 
 class Experiment:
 
-    def __init__(self, config, loggers=tuple(), name_field='name', logdir_field='logdir', step=0, last_written_time=None):
+    def __init__(self, config, loggers=tuple(), name_field='name', logdir_field='logdir', step=0, last_written_time=None, save_every=1,
+                 async_logging=False, max_queue_size=10000, backpressure='block', finish_timeout=None, index=False,
+                 start_time=None, start_step=None, finished_time=None, rank=None, instrument=None, instrument_interval=None,
+                 index_interval=60):
+        """
+        Args:
+            config: experiment configuration, must contain `name_field` and `logdir_field`.
+            loggers: loggers that receive every record passed to `log`.
+            save_every: update the progress in `state.bin` every this many calls to `log`. The config is only written to `exp.json`
+                by `save`, which `start` and `finish` call.
+            async_logging: if set, each logger is wrapped in an `AsyncLogger` so that `log` only enqueues records.
+            max_queue_size: per-logger queue size when `async_logging` is set.
+            backpressure: `AsyncLogger` policy when a queue is full, one of 'block', 'drop_oldest' or 'drop'.
+            finish_timeout: seconds `finish` waits for each queue to drain when `async_logging` is set.
+            index: update the `expman.index.ConfigIndex` of the log directory, with the config, step and last logged metrics, on every
+                `save` and at most every `index_interval` seconds while logging. An index locked by another process is skipped
+                rather than waited for, readers refresh it anyway.
+            start_time: when the experiment was last started or resumed, with `start_step` its step then, from which monitors
+                estimate its throughput. Both are set by `start`.
+            finished_time: when `finish` was last called, `None` while the experiment runs.
+            rank: rank of this process in a distributed job, or 'env' to read it from the environment. Only rank 0 writes
+                `exp.json` and `state.bin`, so every rank can call `log`, e.g. with `JSONLogger(rank=rank)` to write one shard per rank.
+            instrument: time `log`, each logger, `save` and checkpoints, and count records, flushes and bytes, see
+                `instrumentation_stats`. Defaults to the `EXPMAN_INSTRUMENT` environment variable.
+            instrument_interval: if set, export the instrumentation to `instrument.jsonl` every this many seconds. Defaults to
+                the `EXPMAN_INSTRUMENT_INTERVAL` environment variable.
+            index_interval: see `index`.
+        """
         self.name_field = name_field
         self.logdir_field = logdir_field
         self.config = config
         self.loggers = list(loggers)
+        if async_logging:
+            self.loggers = [AsyncLogger(logger, max_queue_size=max_queue_size, policy=backpressure, finish_timeout=finish_timeout) for logger in self.loggers]
         self.step = step
         self.last_written_time = last_written_time
+        self.save_every = save_every
+        self.start_time = start_time
+        self.start_step = start_step
+        self.finished_time = finished_time
+        self.rank = resolve_rank(rank)
+        instrument, instrument_interval = from_env(instrument, instrument_interval)
+        self.instrumentation = Instrumentation(instrument_interval) if instrument else None
+        self.logger_names = []
+        self.index = index
+        self.index_interval = index_interval
+        self.index_time = None
+        self.index_failed = False
+        self.config_index = None
+        self.state_file = None
+        self.last_metrics = {}
         self.started = False
         self.config['seedless_name'] = self.name.split('-seed')[0]
 
@@ -39,87 +93,300 @@ class Experiment:
         return cls(vars(args), name_field=name_field, logdir_field=logdir_field, loggers=loggers)
 
     @classmethod
-    def from_fconfig(cls, fname):
-        with open(fname) as f:
-            return cls(**json.load(f))
+    def from_fconfig(cls, fname, cache=None):
+        """
+        Loads an experiment from its `exp.json`, through `cache` (an `expman.cache.LogCache`) if given.
+        """
+        return cls(**read_exp(fname, cache=cache))
 
     def time_since_last_written(self):
         return datetime.datetime.utcnow() - datetime.datetime.fromisoformat(self.last_written_time)
 
+    def progress(self):
+        """
+        The fields of the experiment that change as it runs, as stored in `state.bin`.
+        """
+        return {k: getattr(self, k) for k in StateFile.FIELDS}
+
     def save(self, fout=None):
+        """
+        Writes the config and progress to `exp.json`, replacing it atomically, and the progress to the `state.bin` next to it.
+        Does nothing on ranks other than 0.
+        """
+        if self.rank:
+            return self
+        t0 = time.perf_counter_ns() if self.instrumentation is not None else None
         fout = os.path.abspath(fout or self.explog)
         parent = os.path.dirname(fout)
         if not os.path.isdir(parent):
-            os.makedirs(parent)
-        with open(fout, 'wt') as f:
+            os.makedirs(parent, exist_ok=True)
+        # the progress first, so that it is never older than what `exp.json` holds
+        self.save_state(os.path.join(parent, StateFile.FNAME), index=False)
+        ftmp = '{}.{}.tmp'.format(fout, os.getpid())
+        with open(ftmp, 'wt') as f:
             json.dump(dict(
                 name_field=self.name_field,
                 logdir_field=self.logdir_field,
                 config=self.config,
-                step=self.step,
-                last_written_time=self.last_written_time,
+                state_file=StateFile.FNAME,
+                **self.progress()
             ), f, indent=2)
+        os.replace(ftmp, fout)
+        if self.index:
+            self.update_index()
+        if t0 is not None:
+            self.instrumentation.record('experiment.save', time.perf_counter_ns() - t0)
         return self
 
+    def save_state(self, fstate=None, index=True):
+        """
+        Writes only the progress, i.e. the step and times, to `state.bin`, in place and without serializing the config.
+        """
+        if self.rank:
+            return self
+        t0 = time.perf_counter_ns() if self.instrumentation is not None else None
+        fstate = os.path.abspath(fstate or self.expdir.joinpath(StateFile.FNAME))
+        if self.state_file is None or self.state_file.fname != fstate:
+            if self.state_file is not None:
+                self.state_file.close()
+            self.state_file = StateFile(fstate)
+        self.state_file.write(self.progress())
+        if self.index and index and (self.index_time is None or time.time() - self.index_time >= self.index_interval):
+            self.update_index(config=False)
+        if t0 is not None:
+            self.instrumentation.record('experiment.save_state', time.perf_counter_ns() - t0)
+        return self
+
+    def update_index(self, config=True):
+        self.index_time = time.time()
+        try:
+            if self.config_index is None:
+                from .index import ConfigIndex
+                # readers rebuild the index if needed, so that jobs never scan the whole log directory, and only briefly wait for a lock
+                self.config_index = ConfigIndex(self.logdir, rebuild=False, timeout=1)
+            self.config_index.put(self, self.last_metrics, config=config)
+            self.index_failed = False
+        except Exception as e:
+            if not self.index_failed:
+                logging.critical('Failed to update the index of {}, retrying silently: {}'.format(self.logdir, repr(e)))
+            self.index_failed = True
+
     def load(self):
-        with open(self.explog) as f:
-            d = json.load(f)
-            for k, v in d.items():
-                setattr(self, k, v)
+        for k, v in read_exp(str(self.explog)).items():
+            setattr(self, k, v)
 
     def start(self, delete_existing=False):
         if not self.exists() or not os.path.isdir(os.path.dirname(self.explog)):
             logging.critical('Making directory at {}'.format(self.expdir))
-            os.makedirs(self.expdir)
+            # other ranks may create it at the same time
+            os.makedirs(self.expdir, exist_ok=True)
         for logger in self.loggers:
             logger.start(self.expdir, self.config, delete_existing=delete_existing)
+        if self.index and not self.rank and not self.last_metrics:
+            from .index import _exp_last_metrics
+            # when resuming, so that saving does not drop the metrics indexed so far
+            self.last_metrics = _exp_last_metrics(str(self.expdir)) or {}
+        if self.instrumentation is not None:
+            self.start_instrumentation()
         self.started = True
+        self.start_time = datetime.datetime.utcnow().isoformat()
+        self.start_step = self.step
+        self.finished_time = None
         self.save()
         return self
 
-    def load_logs(self, logger, ignore=('time',), error='warn'):
+    def load_logs(self, logger, ignore=('time',), error='warn', columns=None, step_range=None, every=1, as_arrays=False, cache=None,
+                  summary_level=None, summary_points=1000):
+        """
+        Loads the records written by `logger`.
+
+        Args:
+            columns: if given, only these keys are returned.
+            step_range: if given, a `(lo, hi)` tuple, only records with `lo <= step < hi` are returned. Either end may be `None`.
+            every: only return every `every`-th record.
+            as_arrays: return a dict mapping each key to a NumPy array instead of a list of dicts.
+            cache: an `expman.cache.LogCache` passed on to loggers that support it, such as `JSONLogger`.
+            summary_level: load the per-bucket summaries written with `JSONLogger(summary_levels=...)` for buckets of this many steps
+                instead of the raw records. 'auto' picks the finest level with at most about `summary_points` buckets.
+                Each row has the bucket's start as `step` and the mean of each key, see `SummaryPyramid.load`.
+
+        The filters are applied by the logger while reading, so skipped records and keys are never built.
+        """
         assert self.exists(), 'Experiment does not exist at {}'.format(self.expdir)
         logger.start(self.expdir, self.config, delete_existing=False)
-        logs = logger.load_logs(ignore=ignore, error=error)
-        ret = []
-        for d in logs:
-            ret.append(d)
+        if summary_level == 'auto':
+            summary_level = logger.pick_summary_level(summary_points)
+        if summary_level is not None:
+            ret = logger.load_summary(summary_level, columns=columns, step_range=step_range, error=error)
+        elif as_arrays:
+            ret = logger.load_columns(columns=columns, ignore=ignore, error=error, step_range=step_range, every=every)
+        else:
+            kwargs = dict(cache=cache) if cache is not None else {}
+            ret = logger.load_logs(ignore=ignore, error=error, columns=columns, step_range=step_range, every=every, **kwargs)
         logger.finish()
         return ret
 
+    def follow(self, logger, columns=None, from_step=None, **kwargs):
+        """
+        Streams the records of a running experiment as `logger` appends them. See `JSONLogger.follow` for the other arguments.
+        """
+        logger.start(self.expdir, self.config, delete_existing=False)
+        return logger.follow(columns=columns, from_step=from_step, **kwargs)
+
+    @classmethod
+    def discover_logs(self, glob_path, logger, ignore=('time',), error='warn', verbose=False, columns=None, step_range=None, every=1, as_arrays=False,
+                      workers=None, executor=None, cache=None, summary_level=None, summary_points=1000, manifest=False,
+                      filter=None, refresh_index=True):
+        """
+        Loads every experiment matching `glob_path` together with its logs.
+
+        Args:
+            error: what to do when an experiment fails to load, one of 'warn', 'ignore' or 'raise'. Also passed to `load_logs`.
+            verbose: show a progress bar, use 'notebook' inside notebooks.
+            workers: if given, experiments are loaded in a pool of this many processes.
+            executor: a `concurrent.futures.Executor` to load experiments with instead of creating a pool. Takes precedence over `workers`.
+            cache: an `expman.cache.LogCache`, or `True` to keep a cache in each log directory.
+                Unchanged experiments are then read from the cache and growing logs are only parsed from where they were last read.
+            summary_level: load precomputed summaries instead of raw records, see `load_logs`.
+            manifest: remember which directories hold experiments in a manifest next to them, see `expman.scan.scan_experiments`.
+            filter: only load experiments matching this expression or dict of config values, looked up in the
+                `expman.index.ConfigIndex` of the directory containing `glob_path`, e.g. `"lr == 1e-3 and model == 'linear'"`.
+            refresh_index: before applying `filter`, index new experiments and reread those that changed since they were indexed,
+                which only stats their `exp.json` and `state.bin`. Without it, experiments not created with `index=True` may be
+                missed.
+
+        Returns:
+            a list of `(experiment, logs)` tuples, ordered by experiment directory.
+        """
+        return list(self.iter_logs(
+            glob_path, logger, ignore=ignore, error=error, verbose=verbose, columns=columns, step_range=step_range, every=every, as_arrays=as_arrays,
+            workers=workers, executor=executor, cache=cache, summary_level=summary_level, summary_points=summary_points, manifest=manifest,
+            filter=filter, refresh_index=refresh_index))
+
     @classmethod
-    def discover_logs(self, glob_path, logger, ignore=('time',), error='warn', verbose=False):
-        dirs = glob.glob(glob_path)
-        exps = []
-        if verbose == 'notebook':
-            from tqdm.autonotebook import tqdm
-            dirs = tqdm(dirs)
-        elif verbose:
-            from tqdm.auto import tqdm
-            dirs = tqdm(dirs)
-        for d in dirs:
-            f = os.path.join(d, 'exp.json')
-            if os.path.isfile(f):
-                exp = Experiment.from_fconfig(f)
-                logs = exp.load_logs(logger, ignore=ignore, error=error)
-                exps.append((exp, logs))
-        return exps
+    def iter_logs(self, glob_path, logger, ignore=('time',), error='warn', verbose=False, columns=None, step_range=None, every=1, as_arrays=False,
+                  workers=None, executor=None, cache=None, summary_level=None, summary_points=1000, manifest=False, filter=None, refresh_index=True):
+        """
+        Like `discover_logs`, but yields each `(experiment, logs)` as soon as it is loaded, so that only one experiment needs to be
+        held in memory at a time, e.g. to feed an `expman.aggregate.Aggregator`.
+        """
+        if filter is None:
+            fexps = [os.path.join(e.path, 'exp.json') for e in scan_experiments(glob_path, names=('exp.json', ), manifest=manifest)]
+        else:
+            from .index import ConfigIndex
+            # one index per log directory, e.g. per matched parent of 'logs/*/*', never creating directories from a pattern
+            logdir = os.path.dirname(glob_path)
+            logdirs = sorted(glob.glob(logdir)) if glob.has_magic(logdir) else [logdir]
+            expdirs = []
+            for logdir in logdirs:
+                if not os.path.isdir(logdir):
+                    continue
+                with ConfigIndex(logdir) as index:
+                    if refresh_index:
+                        index.refresh()
+                    expdirs.extend(index.query(filter))
+            pattern = os.path.abspath(glob_path)
+            fexps = [os.path.join(d, 'exp.json') for d in expdirs if fnmatch.fnmatch(d, pattern)]
+        load = functools.partial(_load_exp_logs, logger=logger, cache=cache, kwargs=dict(
+            ignore=ignore, error=error, columns=columns, step_range=step_range, every=every, as_arrays=as_arrays,
+            summary_level=summary_level, summary_points=summary_points,
+        ))
+        pool = None
+        if executor is None and workers and workers > 1:
+            executor = pool = concurrent.futures.ProcessPoolExecutor(workers)
+        try:
+            if executor is None:
+                results = map(load, fexps)
+            else:
+                chunksize = max(1, len(fexps) // (4 * (workers or os.cpu_count() or 1)))
+                results = executor.map(load, fexps, chunksize=chunksize)
+            if verbose == 'notebook':
+                from tqdm.autonotebook import tqdm
+                results = tqdm(results, total=len(fexps))
+            elif verbose:
+                from tqdm.auto import tqdm
+                results = tqdm(results, total=len(fexps))
+            for f, (exp, logs, e) in zip(fexps, results):
+                if e is None:
+                    yield exp, logs
+                elif error == 'warn':
+                    logging.critical('Failed to load {}'.format(f))
+                    logging.critical(repr(e))
+                elif error != 'ignore':
+                    raise e
+        finally:
+            if pool is not None:
+                pool.shutdown()
 
     def exists(self):
         return os.path.isfile(self.explog)
 
     def log(self, content: dict):
         assert self.started, 'Please run experiment.start()'
+        inst = self.instrumentation
+        if inst is not None:
+            t0 = time.perf_counter_ns()
         content['step'] = self.step
         self.last_written_time = content['time'] = datetime.datetime.utcnow().isoformat()
-        for logger in self.loggers:
-            logger.log(content)
-        self.save()
+        if inst is None:
+            for logger in self.loggers:
+                logger.log(content)
+        else:
+            for name, logger in zip(self.logger_names, self.loggers):
+                t = time.perf_counter_ns()
+                logger.log(content)
+                inst.record(name, time.perf_counter_ns() - t)
+        if self.index:
+            self.last_metrics.update(content)
+        if (self.step + 1) % self.save_every == 0:
+            self.save_state()
+        if inst is not None:
+            inst.record('experiment.log', time.perf_counter_ns() - t0)
+            inst.maybe_export(self.step)
         self.step += 1
 
+    def start_instrumentation(self):
+        """
+        Names the timers of the loggers, registers their own counters, and opens `instrument.jsonl` if exporting.
+        """
+        self.logger_names = []
+        for logger in self.loggers:
+            inner = logger.logger if isinstance(logger, AsyncLogger) else logger
+            name = 'logger.{}'.format(type(inner).__name__)
+            if name in self.logger_names:
+                name = '{}.{}'.format(name, len(self.logger_names))
+            self.logger_names.append(name)
+            if hasattr(inner, 'stats'):
+                self.instrumentation.add_source(name, inner.stats)
+            if inner is not logger:
+                self.instrumentation.add_source(name + '.queue', logger.stats)
+        self.instrumentation.start_export(self.expdir, rank=self.rank)
+
+    def instrumentation_stats(self):
+        """
+        Timing summaries and counters collected with `instrument=True`, see `expman.instrument.Instrumentation.stats`, or `None`.
+        """
+        return self.instrumentation.stats() if self.instrumentation is not None else None
+
+    def logging_stats(self):
+        """
+        Queue depth and drop counters of asynchronous loggers, keyed by the wrapped logger's class name.
+        """
+        return {type(logger.logger).__name__: logger.stats() for logger in self.loggers if isinstance(logger, AsyncLogger)}
+
     def finish(self):
         for logger in self.loggers:
             logger.finish()
+        if self.started:
+            self.finished_time = datetime.datetime.utcnow().isoformat()
+            self.save()
+        if self.config_index is not None:
+            self.config_index.close()
+            self.config_index = None
+        if self.state_file is not None:
+            self.state_file.close()
+        if self.instrumentation is not None:
+            self.instrumentation.finish(self.step)
 
     @classmethod
     def convert_rl_exp(cls, explog):
@@ -129,3 +396,17 @@ class Experiment:
         c = cls(config, name_field='xpid', logdir_field='logdir')
         c.save()
         logging.info('Converted {} to {}'.format(explog, c.explog))
+
+
+def _load_exp_logs(fexp, logger, cache, kwargs):
+    """
+    Loads one experiment for `Experiment.discover_logs`. Errors are returned instead of raised so that one broken
+    experiment does not stop the others when running in a process pool.
+    """
+    try:
+        if cache is True:
+            cache = LogCache.shared(os.path.dirname(os.path.dirname(fexp)))
+        exp = Experiment.from_fconfig(fexp, cache=cache or None)
+        return exp, exp.load_logs(logger, cache=cache or None, **kwargs), None
+    except Exception as e:
+        return None, None, e
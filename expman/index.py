@@ -0,0 +1,321 @@
+import ast
+import logging
+import os
+import sqlite3
+import ujson as json
+from .scan import scan_experiments
+from .state import StateFile, read_exp
+from .loggers.blocks import find_log, iter_lines
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS experiments (
+    expdir TEXT PRIMARY KEY,
+    name TEXT,
+    config TEXT,
+    step INTEGER,
+    last_written_time TEXT,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS config (key TEXT, value, expdir TEXT, PRIMARY KEY (key, value, expdir)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metrics (key TEXT, value, expdir TEXT, PRIMARY KEY (key, value, expdir)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS config_expdir ON config (expdir);
+CREATE INDEX IF NOT EXISTS metrics_expdir ON metrics (expdir);
+"""
+
+# columns of `experiments` that can be used in filters besides config fields
+COLUMNS = ('name', 'step', 'last_written_time')
+
+OPERATORS = {ast.Eq: '=', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+FLIPPED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+
+
+def _sql_value(v):
+    if isinstance(v, bool):
+        return int(v)
+    if v is None or isinstance(v, (int, float, str)):
+        return v
+    return json.dumps(v)
+
+
+def _mtime_ns(files):
+    """
+    The last time an experiment was saved, from the `os.stat_result` of its `exp.json` and `state.bin`.
+    """
+    return max(st.st_mtime_ns for st in files.values() if st is not None)
+
+
+def _last_metrics(flog):
+    """
+    Returns the last logged value of every key of a `log.jsonl`, plain or compressed, as `Experiment.log` accumulates them
+    for `put`, or `None` without a log. Metrics logged at different steps are found even if the last record lacks them.
+    """
+    flog = find_log(flog)
+    if flog is None:
+        return None
+    metrics = {}
+    try:
+        for line in iter_lines(flog):
+            if line.strip():
+                try:
+                    metrics.update(json.loads(line))
+                except Exception:
+                    # e.g. a record being written
+                    continue
+    except FileNotFoundError:
+        return None
+    return metrics
+
+
+def _exp_last_metrics(path):
+    last = _last_metrics(os.path.join(path, 'log.jsonl'))
+    if last is None:
+        # logged in shards by every rank, see `JSONLogger(rank=...)`
+        last = _last_metrics(os.path.join(path, 'log.rank0.jsonl'))
+    return last
+
+
+class FilterCompiler:
+    """
+    Compiles a filter expression in Python syntax into a SQL condition on `experiments`.
+
+    Supported are comparisons (`==`, `!=`, `<`, `<=`, `>`, `>=`, `in`, `not in`) between a field and constants, combined with
+    `and`, `or` and `not`. Fields are top-level config keys, `name`, `step`, `last_written_time`, or `final.<metric>` for the last
+    logged value of a metric. Keys that are not identifiers can be written as `config['some-key']`.
+    For example `lr == 1e-3 and model in ('linear', 'mlp') and final.acc > 0.9`.
+    """
+
+    def __init__(self):
+        self.params = []
+
+    def compile(self, expression):
+        tree = ast.parse(expression, mode='eval')
+        return self.visit(tree.body)
+
+    def field(self, node):
+        if isinstance(node, ast.Name):
+            return 'config', node.id
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'final':
+            return 'metrics', node.attr
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id in ('config', 'final'):
+            key = ast.literal_eval(node.slice)
+            return 'config' if node.value.id == 'config' else 'metrics', key
+        raise ValueError('Unsupported field {}'.format(ast.dump(node)))
+
+    def condition(self, table, key, sql_op, values):
+        if table == 'config' and key in COLUMNS:
+            self.params.extend(values)
+            return '{} {} {}'.format(key, sql_op, self.placeholders(sql_op, values))
+        self.params.append(key)
+        self.params.extend(values)
+        # answered from the (key, value, expdir) primary key alone
+        return 'expdir IN (SELECT expdir FROM {} WHERE key = ? AND value {} {})'.format(table, sql_op, self.placeholders(sql_op, values))
+
+    @staticmethod
+    def placeholders(sql_op, values):
+        if sql_op in ('IN', 'NOT IN'):
+            return '({})'.format(', '.join('?' * len(values)))
+        return '?'
+
+    def visit(self, node):
+        if isinstance(node, ast.BoolOp):
+            op = ' AND ' if isinstance(node.op, ast.And) else ' OR '
+            return '(' + op.join(self.visit(v) for v in node.values) + ')'
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return '(NOT {})'.format(self.visit(node.operand))
+        if isinstance(node, ast.Compare):
+            parts = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                parts.append(self.compare(left, op, right))
+                left = right
+            return '(' + ' AND '.join(parts) + ')'
+        raise ValueError('Unsupported filter {}'.format(ast.dump(node)))
+
+    def compare(self, left, op, right):
+        try:
+            value = ast.literal_eval(right)
+            table, key = self.field(left)
+        except ValueError:
+            # constant on the left, e.g. `1e-3 <= lr`
+            value = ast.literal_eval(left)
+            table, key = self.field(right)
+            if type(op) not in FLIPPED:
+                raise ValueError('Unsupported comparison {}'.format(ast.dump(op)))
+            op = FLIPPED[type(op)]()
+        if isinstance(op, (ast.In, ast.NotIn)):
+            values = [_sql_value(v) for v in value]
+            return self.condition(table, key, 'IN' if isinstance(op, ast.In) else 'NOT IN', values)
+        if type(op) not in OPERATORS:
+            raise ValueError('Unsupported comparison {}'.format(ast.dump(op)))
+        if value is None:
+            return self.condition(table, key, 'IS' if isinstance(op, ast.Eq) else 'IS NOT', [None])
+        return self.condition(table, key, OPERATORS[type(op)], [_sql_value(value)])
+
+
+class ConfigIndex:
+    """
+    SQLite index of the experiments in a log directory: their config fields, step, last written time and the last logged
+    value of each numeric metric, stored in `<logdir>/.expman_cache/index.sqlite`.
+
+    The index is only a cache of the `exp.json` and `log.jsonl` files: `rebuild` recreates it from them, and `refresh` rereads
+    the experiments whose `exp.json` or `state.bin` changed. Experiments created with `Experiment(..., index=True)` update it on every save.
+    Since it can always be rebuilt, writes are not synced to disk, and a corrupt index is deleted and rebuilt.
+
+    Args:
+        rebuild: rebuild the index if it was never built, e.g. because it was deleted.
+        timeout: seconds to wait for other processes writing to the index.
+    """
+
+    FNAME = os.path.join('.expman_cache', 'index.sqlite')
+
+    def __init__(self, logdir, rebuild=True, timeout=30):
+        self.logdir = os.path.abspath(logdir)
+        self.fname = os.path.join(self.logdir, self.FNAME)
+        if not os.path.isdir(self.logdir):
+            raise FileNotFoundError('No log directory {}'.format(self.logdir))
+        os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+        try:
+            self._connect(timeout)
+        except sqlite3.DatabaseError as e:
+            if isinstance(e, sqlite3.OperationalError):
+                # e.g. locked by another process
+                raise
+            logging.critical('Rebuilding corrupt index {}: {}'.format(self.fname, repr(e)))
+            os.remove(self.fname)
+            self._connect(timeout)
+        if rebuild and self.db.execute("SELECT value FROM meta WHERE key = 'built'").fetchone() is None:
+            self.rebuild()
+
+    def _connect(self, timeout):
+        self.db = sqlite3.connect(self.fname, timeout=timeout)
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM experiments').fetchone()[0]
+
+    def _put(self, expdir, d, metrics=None, mtime_ns=None):
+        config = d['config']
+        expdir = os.path.abspath(expdir)
+        self.db.execute('INSERT OR REPLACE INTO experiments VALUES (?, ?, ?, ?, ?, ?)', (
+            expdir, config.get(d.get('name_field', 'name')), json.dumps(config), d.get('step'), d.get('last_written_time'), mtime_ns))
+        self.db.execute('DELETE FROM config WHERE expdir = ?', (expdir, ))
+        self.db.executemany('INSERT OR REPLACE INTO config VALUES (?, ?, ?)', [(k, _sql_value(v), expdir) for k, v in config.items()])
+        self._put_metrics(expdir, metrics)
+
+    def _put_metrics(self, expdir, metrics):
+        if metrics is not None:
+            self.db.execute('DELETE FROM metrics WHERE expdir = ?', (expdir, ))
+            self.db.executemany('INSERT OR REPLACE INTO metrics VALUES (?, ?, ?)', [
+                (k, v, expdir) for k, v in metrics.items() if isinstance(v, (int, float)) and not isinstance(v, bool)])
+
+    def put(self, exp, metrics=None, config=True):
+        """
+        Indexes `exp`, with `metrics` the last logged values of its metrics if known.
+        Without `config`, only its step, last written time and metrics are updated, unless it is not indexed yet.
+        """
+        files = {}
+        for fname in ('exp.json', StateFile.FNAME):
+            try:
+                files[fname] = os.stat(str(exp.expdir.joinpath(fname)))
+            except FileNotFoundError:
+                pass
+        mtime_ns = _mtime_ns(files) if files else None
+        expdir = os.path.abspath(str(exp.expdir))
+        with self.db:
+            if not config:
+                updated = self.db.execute('UPDATE experiments SET step = ?, last_written_time = ?, mtime_ns = ? WHERE expdir = ?', (
+                    exp.step, exp.last_written_time, mtime_ns, expdir)).rowcount
+                if updated:
+                    self._put_metrics(expdir, metrics)
+                    return
+            self._put(expdir, dict(
+                name_field=exp.name_field, config=exp.config, step=exp.step, last_written_time=exp.last_written_time), metrics, mtime_ns)
+
+    def _read(self, path, files=None):
+        if files is None:
+            files = {}
+            for fname in ('exp.json', StateFile.FNAME):
+                try:
+                    files[fname] = os.stat(os.path.join(path, fname))
+                except FileNotFoundError:
+                    pass
+        d = read_exp(os.path.join(path, 'exp.json'))
+        return d, _exp_last_metrics(path), _mtime_ns(files)
+
+    def rebuild(self):
+        """
+        Recreates the index from the `exp.json` and the last value of each metric in the `log.jsonl` of every experiment in the log directory.
+        """
+        entries = scan_experiments(os.path.join(self.logdir, '*'), names=('exp.json', ))
+        with self.db:
+            self.db.execute('DELETE FROM experiments')
+            self.db.execute('DELETE FROM config')
+            self.db.execute('DELETE FROM metrics')
+            for e in entries:
+                try:
+                    d, last, mtime_ns = self._read(e.path)
+                    self._put(e.path, d, last or {}, mtime_ns)
+                except Exception as ex:
+                    logging.critical('Not indexing {}: {}'.format(e.path, repr(ex)))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('built', 1)")
+        return self
+
+    def refresh(self):
+        """
+        Adds new experiments, rereads those whose `exp.json` or `state.bin` changed since they were indexed and drops deleted ones.
+        """
+        known = dict(self.db.execute('SELECT expdir, mtime_ns FROM experiments'))
+        entries = scan_experiments(os.path.join(self.logdir, '*'), names=('exp.json', StateFile.FNAME), stat=True)
+        seen = set()
+        with self.db:
+            for e in entries:
+                expdir = os.path.abspath(e.path)
+                seen.add(expdir)
+                if known.get(expdir) == _mtime_ns(e.files):
+                    continue
+                try:
+                    d, last, mtime_ns = self._read(e.path, e.files)
+                    self._put(expdir, d, last or {}, mtime_ns)
+                except Exception as ex:
+                    logging.critical('Not indexing {}: {}'.format(e.path, repr(ex)))
+            for expdir in set(known) - seen:
+                for table in ('experiments', 'config', 'metrics'):
+                    self.db.execute('DELETE FROM {} WHERE expdir = ?'.format(table), (expdir, ))
+        return self
+
+    def query(self, filter=None):
+        """
+        Returns the sorted directories of the experiments matching `filter`, an expression for `FilterCompiler`, or a dict of
+        config fields and the values they must equal. All experiments are returned without `filter`.
+        """
+        if isinstance(filter, dict):
+            filter = ' and '.join('config[{!r}] == {!r}'.format(k, v) for k, v in filter.items()) or None
+        sql, params = 'SELECT expdir FROM experiments', []
+        if filter:
+            compiler = FilterCompiler()
+            sql += ' WHERE ' + compiler.compile(filter)
+            params = compiler.params
+        return sorted(row[0] for row in self.db.execute(sql, params))
+
+    def get(self, expdir):
+        """
+        Returns the indexed summary of one experiment: its config, step, last written time and final metric values.
+        """
+        expdir = os.path.abspath(expdir)
+        row = self.db.execute('SELECT config, step, last_written_time FROM experiments WHERE expdir = ?', (expdir, )).fetchone()
+        if row is None:
+            return None
+        metrics = dict(self.db.execute('SELECT key, value FROM metrics WHERE expdir = ?', (expdir, )))
+        return dict(config=json.loads(row[0]), step=row[1], last_written_time=row[2], final=metrics)
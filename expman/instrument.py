@@ -0,0 +1,156 @@
+"""
+Low-overhead timing histograms and counters for the logging and checkpointing hot paths.
+
+Instrumentation is off unless requested with `Experiment(..., instrument=True)` or the `EXPMAN_INSTRUMENT=1` environment variable.
+While it is off, the instrumented code only checks that `Experiment.instrumentation` is `None`.
+"""
+import datetime
+import os
+import threading
+import time
+
+
+ENV_VAR = 'EXPMAN_INSTRUMENT'
+ENV_INTERVAL = 'EXPMAN_INSTRUMENT_INTERVAL'
+FNAME = 'instrument.jsonl'
+
+# durations are bucketed by powers of two nanoseconds, 64 buckets cover any duration
+NUM_BUCKETS = 64
+QUANTILES = (50, 90, 99)
+
+
+def from_env(instrument, interval):
+    """
+    Resolves the `instrument` and `interval` arguments of `Experiment`, where `None` defers to the environment variables.
+    """
+    if instrument is None:
+        instrument = os.environ.get(ENV_VAR, '').lower() not in ('', '0', 'false', 'no')
+    if interval is None and os.environ.get(ENV_INTERVAL):
+        interval = float(os.environ[ENV_INTERVAL])
+    return instrument, interval
+
+
+class Histogram:
+    """
+    Counts, sum, min, max and power-of-two buckets of durations in nanoseconds. Adding a duration is a few integer operations.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def add(self, ns):
+        self.buckets[min(ns.bit_length(), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+
+    def quantile(self, q):
+        """
+        Returns an upper bound on the `q`-th percentile, within a factor of two.
+        """
+        target = self.count * q / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** i - 1, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Returns the count, total seconds, and mean, min, max and percentile durations in microseconds.
+        """
+        if not self.count:
+            return dict(count=0)
+        d = dict(count=self.count, total_s=self.total / 1e9, mean_us=self.total / self.count / 1e3, min_us=self.min / 1e3, max_us=self.max / 1e3)
+        for q in QUANTILES:
+            d['p{}_us'.format(q)] = self.quantile(q) / 1e3
+        return d
+
+
+class Instrumentation:
+    """
+    Named timing histograms and counters, e.g. `experiment.log`, `logger.JSONLogger` or `checkpoint.write`.
+
+    With `interval`, `maybe_export` appends a flat record of the summaries to `instrument.jsonl` in the experiment directory every
+    `interval` seconds, so that it can be loaded and plotted like any other log with `JSONLogger(logname='instrument.jsonl')`.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.timers = {}
+        self.counters = {}
+        # gauges read when exporting, e.g. the bytes written by each logger
+        self.sources = {}
+        self.export_logger = None
+        self.last_export = time.time()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # e.g. pickled by submitit along with its `Experiment`; sources and the export log are set up again by `Experiment.start`
+        d = dict(self.__dict__, sources={}, export_logger=None)
+        del d['lock']
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.lock = threading.Lock()
+
+    def record(self, name, ns):
+        timer = self.timers.get(name)
+        if timer is None:
+            # checkpoints are recorded from their background thread
+            with self.lock:
+                timer = self.timers.setdefault(name, Histogram())
+        timer.add(ns)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_source(self, name, fn):
+        """
+        Adds the dict returned by `fn()` to the stats under `name`.
+        """
+        self.sources[name] = fn
+
+    def stats(self):
+        """
+        Returns `dict(timers={name: Histogram.summary()}, counters={name: value})`, the counters including those of the sources.
+        """
+        counters = dict(self.counters)
+        for name, fn in self.sources.items():
+            for k, v in (fn() or {}).items():
+                counters['{}.{}'.format(name, k)] = v
+        return dict(timers={name: t.summary() for name, t in list(self.timers.items())}, counters=counters)
+
+    def start_export(self, dlog, rank=None):
+        if self.interval is not None and self.export_logger is None:
+            from .loggers.json_logger import JSONLogger
+            self.export_logger = JSONLogger(logname=FNAME, rank=rank).start(dlog)
+
+    def maybe_export(self, step=None, force=False):
+        if self.export_logger is None:
+            return
+        now = time.time()
+        if not force and now - self.last_export < self.interval:
+            return
+        self.last_export = now
+        stats = self.stats()
+        record = dict(step=step, time=datetime.datetime.utcnow().isoformat())
+        for name, summary in stats['timers'].items():
+            record.update(('{}/{}'.format(name, k), v) for k, v in summary.items())
+        record.update(stats['counters'])
+        self.export_logger.log(record)
+
+    def finish(self, step=None):
+        if self.export_logger is not None:
+            self.maybe_export(step, force=True)
+            self.export_logger.finish()
+            self.export_logger = None
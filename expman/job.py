@@ -1,13 +1,24 @@
-import submitit
 import logging
-import torch
 import argparse
-import glob
 import os
+import time
+import ujson as json
+from .checkpoint import CheckpointEngine
 from .experiment import Experiment
+from .scan import scan_experiments
 
 
 class Job:
+    """
+    Checkpoints are written by a `CheckpointEngine`, configured through the class attributes below.
+    On resume, tensors are memory-mapped from the checkpoint when torch supports it, and moved to `checkpoint_map_location` if set.
+    """
+
+    checkpoint_keep = 3
+    checkpoint_background = True
+    checkpoint_incremental = False
+    checkpoint_mmap = True
+    checkpoint_map_location = None
 
     def __init__(self, exp=None):
         self.exp = exp
@@ -44,39 +55,99 @@ class Job:
         """
         raise NotImplementedError()
 
-    def job_checkpoint_path(self, explog):
+    @classmethod
+    def job_checkpoint_path(cls, explog):
         """
         Where the job's state_dict is saved.
+        A classmethod, so that checkpoints can be inspected without creating the job.
         """
         root = os.path.dirname(explog)
         return os.path.join(root, 'job.tar')
 
-    def checkpoint(self, explog):
+    def checkpoint_engine(self, explog):
+        fjob = self.job_checkpoint_path(explog)
+        engine = getattr(self, '_checkpoint_engine', None)
+        if engine is None or engine.path != fjob:
+            engine = self._checkpoint_engine = CheckpointEngine(
+                fjob, keep=self.checkpoint_keep, background=self.checkpoint_background, incremental=self.checkpoint_incremental)
+        if self.exp is not None:
+            engine.instrumentation = self.exp.instrumentation
+        return engine
+
+    def checkpoint(self, explog, block=False):
         """
         Saves the checkpoint to `explog`.
+        Only copying the state to CPU memory happens before returning, unless `block` is set, the write itself happens in the background.
         """
         assert self.exp is not None, 'Cannot checkpoint empty experiment!'
+        t0 = time.perf_counter_ns()
         logging.critical('Saving experiment to {}'.format(explog))
         self.exp.save(explog)
-        d = self.non_user_state_dict()
+        non_user = self.non_user_state_dict()
+        d = dict(non_user)
         d.update(self.state_dict())
-        fjob = self.job_checkpoint_path(explog)
-        logging.critical('Saving job to {}'.format(fjob))
-        torch.save(d, fjob)
+        engine = self.checkpoint_engine(explog)
+        logging.critical('Saving job to {}'.format(engine.path))
+        meta = dict(step=self.exp.step)
+        try:
+            # kept in the manifest as well, so that `load_metadata` does not need to read the checkpoint
+            json.dumps(non_user)
+            meta['non_user_state_dict'] = non_user
+        except Exception:
+            pass
+        engine.save(d, **meta)
+        if block:
+            engine.wait()
+        if self.exp.instrumentation is not None:
+            # the time training was blocked, the write itself is `checkpoint.write`
+            self.exp.instrumentation.record('job.checkpoint', time.perf_counter_ns() - t0)
+
+    def wait_checkpoint(self):
+        """
+        Blocks until the last checkpoint is on disk.
+        """
+        engine = getattr(self, '_checkpoint_engine', None)
+        if engine is not None:
+            engine.wait()
 
     @classmethod
-    def from_fconfig(cls, explog, job=None):
+    def load_metadata(cls, explog):
+        """
+        Returns the `non_user_state_dict` of the latest checkpoint from its manifest, without reading any weights.
+        Checkpoints whose `non_user_state_dict` is not JSON serializable, or written by earlier versions of expman, are memory-mapped
+        instead, and the whole state dict is returned.
+        """
+        engine = CheckpointEngine(cls.job_checkpoint_path(explog))
+        entry = engine.latest_entry()
+        if entry is not None and 'non_user_state_dict' in entry:
+            return entry['non_user_state_dict']
+        d, fjob = engine.load_latest(mmap=True, map_location='cpu')
+        return d or {}
+
+    @classmethod
+    def from_fconfig(cls, explog, job=None, map_location=None, mmap=None):
+        """
+        Loads the experiment at `explog` and resumes the job from its latest checkpoint.
+
+        Args:
+            map_location: where to load tensors, e.g. `'cuda:0'`, defaults to `checkpoint_map_location`.
+            mmap: memory-map tensors instead of reading the whole checkpoint into memory, defaults to `checkpoint_mmap`.
+        """
         assert os.path.isfile(explog), 'Cannot launch job without experiment config'
         exp = Experiment.from_fconfig(explog)
         job = job or cls(exp)
         if job.exp is None:
             job.exp = exp
         logging.critical('Loading experiment from {}'.format(explog))
-        fjob = job.job_checkpoint_path(explog)
-        if os.path.isfile(fjob):
+        # falls back to older checkpoints if the newest one cannot be read
+        kwargs = dict(mmap=job.checkpoint_mmap if mmap is None else mmap)
+        map_location = job.checkpoint_map_location if map_location is None else map_location
+        if map_location is not None:
+            kwargs['map_location'] = map_location
+        d, fjob = job.checkpoint_engine(explog).load_latest(**kwargs)
+        if d is not None:
             logging.critical('Resuming job from {}'.format(fjob))
             try:
-                d = torch.load(fjob)
                 job.load_non_user_state_dict(d)
                 job.load_state_dict(d)
             except Exception:
@@ -89,20 +160,76 @@ class Job:
         """
         self.from_fconfig(explog, job=self)
         self.forward(explog)
+        self.wait_checkpoint()
 
     @classmethod
-    def discover_jobs(cls, glob_path, explog_fname='exp.json'):
-        jobs = []
-        for d in glob.glob(glob_path):
-            files = os.listdir(d)
-            if explog_fname in files:
-                jobs.append(cls.from_fconfig(os.path.join(d, explog_fname)))
-        return jobs
+    def discover_jobs(cls, glob_path, explog_fname='exp.json', lazy=False, manifest=False):
+        """
+        Loads every job under `glob_path` that has an `explog_fname`.
+
+        Args:
+            lazy: return `LazyJob`s, which only read the experiment config and checkpoint when used.
+            manifest: remember which directories hold experiments, see `expman.scan.scan_experiments`.
+        """
+        entries = scan_experiments(glob_path, names=(explog_fname, ), require=explog_fname, manifest=manifest)
+        explogs = [os.path.join(e.path, explog_fname) for e in entries]
+        if lazy:
+            return [LazyJob(cls, explog) for explog in explogs]
+        return [cls.from_fconfig(explog) for explog in explogs]
+
+
+class LazyJob:
+    """
+    A job found by `Job.discover_jobs(lazy=True)`.
+    `exp` only reads the experiment config and `metadata` only the checkpoint manifest, the checkpoint is loaded the first time the
+    job itself is needed. Any other attribute is looked up on the loaded job.
+    """
+
+    def __init__(self, job_cls, explog):
+        self.job_cls = job_cls
+        self.explog = explog
+        self._exp = None
+        self._job = None
+        self._metadata = None
+
+    @property
+    def metadata(self):
+        """
+        The `non_user_state_dict` of the latest checkpoint, e.g. the `job_id` of a `SlurmJob`, see `Job.load_metadata`.
+        """
+        if self._job is not None:
+            return self._job.non_user_state_dict()
+        if self._metadata is None:
+            self._metadata = self.job_cls.load_metadata(self.explog)
+        return self._metadata
+
+    @property
+    def exp(self):
+        if self._job is not None:
+            return self._job.exp
+        if self._exp is None:
+            self._exp = Experiment.from_fconfig(self.explog)
+        return self._exp
+
+    @property
+    def job(self):
+        if self._job is None:
+            self._job = self.job_cls.from_fconfig(self.explog)
+        return self._job
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the `LazyJob` itself
+        if name.startswith('_') or name in ('job_cls', 'explog'):
+            raise AttributeError(name)
+        return getattr(self.job, name)
+
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__, self.job_cls.__name__, self.explog)
 
 
 class SlurmJob(Job):
     """
-    This supports preemption through submitit
+    This supports preemption through submitit, which is only imported once a job is checkpointed or launched.
     """
 
     def __init__(self):
@@ -115,14 +242,25 @@ class SlurmJob(Job):
     def load_non_user_state_dict(self, d: dict):
         self.job_id = d.get('job_id', None)
 
-    def checkpoint(self, explog) -> submitit.helpers.DelayedSubmission:
-        super().checkpoint(explog)
+    def checkpoint(self, explog) -> 'submitit.helpers.DelayedSubmission':
+        try:
+            from submitit.helpers import DelayedSubmission
+        except ImportError:
+            from .local import DelayedSubmission
+        # the job is requeued once this returns, so the checkpoint must be on disk
+        super().checkpoint(explog, block=True)
         training_callable = self.__class__()
-        return submitit.helpers.DelayedSubmission(training_callable, explog)
+        return DelayedSubmission(training_callable, explog)
 
     def launch_slurm(self, explog, slurm_kwargs=None, executor=None):
+        """
+        Submits the job to slurm, or to `executor`, e.g. an `expman.local.LocalPoolExecutor` to run it on this machine.
+        """
         if executor is None:
+            import submitit
             executor = submitit.SlurmExecutor(folder=os.path.join(self.exp.logdir, 'slurm'), max_num_timeout=3)
+            executor.update_parameters(**(slurm_kwargs or {}))
+        elif slurm_kwargs:
             executor.update_parameters(**slurm_kwargs)
         slurm_job = executor.submit(self, explog)
         self.job_id = slurm_job.job_id
@@ -0,0 +1,363 @@
+"""
+Runs jobs in local processes through the same interface as a `submitit.SlurmExecutor`, so that `SlurmJob.launch_slurm` and sweeps
+can be run and tested on a single machine.
+"""
+import collections
+import contextlib
+import datetime
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+import ujson as json
+
+
+# exit code of a job that checkpointed after a timeout signal and asked to be requeued
+REQUEUE_EXIT_CODE = 75
+
+
+class DelayedSubmission:
+    """
+    What `checkpoint` returns to be requeued, a stand-in for `submitit.helpers.DelayedSubmission` when submitit is not installed.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+
+def _write_json(fname, d):
+    ftmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(ftmp, 'wt') as f:
+        json.dump(d, f, indent=2)
+    os.replace(ftmp, fname)
+
+
+def _write_pickle(fname, obj):
+    ftmp = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(ftmp, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(ftmp, fname)
+
+
+def _run(fn, args, kwargs, paths, env):
+    """
+    Entry point of the job processes.
+    """
+    os.environ.update(env)
+    for fd, fname in ((1, paths['stdout']), (2, paths['stderr'])):
+        with open(fname, 'ab') as f:
+            os.dup2(f.fileno(), fd)
+
+    def on_timeout(signum, frame):
+        logging.critical('Job {} received signal {}'.format(env['EXPMAN_JOB_ID'], signum))
+        checkpoint = getattr(fn, 'checkpoint', None)
+        delayed = checkpoint(*args, **kwargs) if checkpoint is not None else None
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if delayed is None:
+            os._exit(1)
+        _write_pickle(paths['requeue'], delayed)
+        os._exit(REQUEUE_EXIT_CODE)
+    signal.signal(signal.SIGUSR1, on_timeout)
+
+    try:
+        outcome = ('success', fn(*args, **kwargs))
+    except Exception:
+        outcome = ('error', traceback.format_exc())
+        traceback.print_exc()
+    _write_pickle(paths['result'], outcome)
+
+
+class LocalJob:
+    """
+    A job submitted to a `LocalPoolExecutor`, with the parts of the `submitit.Job` interface used by expman.
+    Requeued jobs keep their `job_id`.
+    """
+
+    def __init__(self, executor, job_id, fn, args, kwargs, parameters):
+        self.executor = executor
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.parameters = parameters
+        self.state = 'PENDING'
+        self.requeues = 0
+        self.process = None
+        self.start_time = None
+        self.signal_time = None
+        self.gpus = []
+        self.cancelled = False
+        self.exitcode = None
+        self.array = None
+        self.finished = threading.Event()
+        folder = executor.folder
+        self.paths = {k: os.path.join(folder, '{}.{}'.format(job_id, ext)) for k, ext in (
+            ('stdout', 'out'), ('stderr', 'err'), ('result', 'result.pkl'), ('requeue', 'requeue.pkl'))}
+        explog = args[0] if args and isinstance(args[0], str) and args[0].endswith('.json') and os.path.isfile(args[0]) else None
+        # jobs running an experiment report their status next to it
+        self.paths['status'] = os.path.join(os.path.dirname(explog), 'job_status.json') if explog else os.path.join(folder, '{}.status.json'.format(job_id))
+
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__, self.job_id, self.state)
+
+    def write_status(self):
+        _write_json(self.paths['status'], dict(
+            job_id=self.job_id,
+            state=self.state,
+            requeues=self.requeues,
+            host=socket.gethostname(),
+            pid=self.process.pid if self.process is not None else None,
+            cpus=self.parameters['cpus_per_task'],
+            gpus=self.gpus,
+            exitcode=self.exitcode,
+            time=datetime.datetime.utcnow().isoformat(),
+        ))
+
+    def done(self):
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def result(self, timeout=None):
+        """
+        Waits for the job and returns what it returned, or raises if it did not complete.
+        """
+        if not self.wait(timeout):
+            raise TimeoutError('Job {} is still {}'.format(self.job_id, self.state))
+        if self.state != 'COMPLETED':
+            error = ''
+            if os.path.isfile(self.paths['result']):
+                with open(self.paths['result'], 'rb') as f:
+                    error = pickle.load(f)[1]
+            raise RuntimeError('Job {} ended in state {}\n{}'.format(self.job_id, self.state, error))
+        with open(self.paths['result'], 'rb') as f:
+            return pickle.load(f)[1]
+
+    def preempt(self):
+        """
+        Sends the timeout signal now, as if the job ran out of time: it checkpoints and is requeued.
+        """
+        self.executor.signal(self)
+
+    def cancel(self):
+        self.executor.cancel(self)
+
+
+class LocalPoolExecutor:
+    """
+    Runs submitted callables in separate processes on this machine, as many at a time as the CPU and GPU slots allow.
+
+    Mirrors `submitit.SlurmExecutor`: jobs are configured with `update_parameters`, and a job that runs longer than `timeout_min`
+    receives `SIGUSR1`. If the callable has a `checkpoint` method, e.g. a `SlurmJob`, it is called with the same arguments, and the
+    `DelayedSubmission` it returns is requeued up to `max_num_timeout` times. Jobs that do not exit within `signal_delay_s` of the
+    signal are killed.
+
+    Jobs submitted inside `batch()` form an array, of which at most `array_parallelism` run at once.
+    Logs, results and status files of every job go to `folder`. Jobs whose first argument is an `exp.json` also write their
+    status to `job_status.json` in the experiment directory.
+
+    Args:
+        folder: where to write job logs and results.
+        cpus: number of CPU slots, defaults to the number of CPUs.
+        gpus: number of GPUs or list of GPU ids to hand out, defaults to `CUDA_VISIBLE_DEVICES`.
+        max_num_timeout: how many times a job may be requeued after a timeout.
+    """
+
+    PARAMETERS = dict(cpus_per_task=1, gpus_per_node=0, timeout_min=None, array_parallelism=None)
+    ALIASES = dict(time='timeout_min', gpus_per_task='gpus_per_node', gpus='gpus_per_node', cpus='cpus_per_task')
+
+    def __init__(self, folder, cpus=None, gpus=None, max_num_timeout=3, signal_delay_s=90, poll_interval=0.1):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.cpus = cpus or os.cpu_count()
+        if gpus is None:
+            visible = os.environ.get('CUDA_VISIBLE_DEVICES', '')
+            gpus = [g for g in visible.split(',') if g]
+        elif isinstance(gpus, int):
+            gpus = list(range(gpus))
+        self.free_gpus = [str(g) for g in gpus]
+        self.num_gpus = len(self.free_gpus)
+        self.free_cpus = self.cpus
+        self.max_num_timeout = max_num_timeout
+        self.signal_delay_s = signal_delay_s
+        self.poll_interval = poll_interval
+        self.parameters = dict(self.PARAMETERS)
+        self.context = multiprocessing.get_context('spawn')
+        self.pending = collections.deque()
+        self.running = []
+        self.num_submitted = 0
+        self.batched = None
+        self.lock = threading.Lock()
+        self.scheduler = None
+
+    def update_parameters(self, **kwargs):
+        for k, v in kwargs.items():
+            k = self.ALIASES.get(k, k)
+            if k in self.parameters:
+                self.parameters[k] = v
+            else:
+                logging.critical('LocalPoolExecutor ignores parameter {}={}'.format(k, v))
+
+    def _new_id(self):
+        self.num_submitted += 1
+        return '{}.{}'.format(os.getpid(), self.num_submitted - 1)
+
+    def _enqueue(self, jobs):
+        for job in jobs:
+            job.write_status()
+        self.pending.extend(jobs)
+        if self.scheduler is None or not self.scheduler.is_alive():
+            self.scheduler = threading.Thread(target=self._schedule, name='expman-local-executor', daemon=True)
+            self.scheduler.start()
+
+    def submit(self, fn, *args, **kwargs):
+        parameters = dict(self.parameters)
+        assert parameters['cpus_per_task'] <= self.cpus, 'Job needs {} CPUs, only {} available'.format(parameters['cpus_per_task'], self.cpus)
+        assert parameters['gpus_per_node'] <= self.num_gpus, 'Job needs {} GPUs, only {} available'.format(parameters['gpus_per_node'], self.num_gpus)
+        with self.lock:
+            if self.batched is None:
+                job = LocalJob(self, self._new_id(), fn, args, kwargs, parameters)
+                self._enqueue([job])
+            else:
+                array, jobs = self.batched
+                job = LocalJob(self, '{}_{}'.format(array, len(jobs)), fn, args, kwargs, parameters)
+                job.array = array
+                jobs.append(job)
+        return job
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Jobs submitted inside this context are queued together as one array when it exits, like `submitit.Executor.batch`.
+        Their ids are `<array id>_<task index>`.
+        """
+        assert self.batched is None, 'Batches cannot be nested'
+        with self.lock:
+            self.batched = (self._new_id(), [])
+        try:
+            yield
+        except Exception:
+            self.batched = None
+            raise
+        with self.lock:
+            array, jobs = self.batched
+            self.batched = None
+            self._enqueue(jobs)
+
+    def _fits(self, job):
+        parallelism = job.parameters['array_parallelism']
+        if job.array is not None and parallelism is not None and sum(j.array == job.array for j in self.running) >= parallelism:
+            return False
+        return job.parameters['cpus_per_task'] <= self.free_cpus and job.parameters['gpus_per_node'] <= len(self.free_gpus)
+
+    def _start(self, job):
+        cpus, num_gpus = job.parameters['cpus_per_task'], job.parameters['gpus_per_node']
+        self.free_cpus -= cpus
+        job.gpus, self.free_gpus = self.free_gpus[:num_gpus], self.free_gpus[num_gpus:]
+        env = dict(EXPMAN_JOB_ID=job.job_id, CUDA_VISIBLE_DEVICES=','.join(job.gpus), OMP_NUM_THREADS=str(cpus))
+        for k in ('result', 'requeue'):
+            if os.path.isfile(job.paths[k]):
+                os.remove(job.paths[k])
+        job.process = self.context.Process(target=_run, args=(job.fn, job.args, job.kwargs, job.paths, env), name='expman-job-{}'.format(job.job_id))
+        job.process.start()
+        job.start_time, job.signal_time = time.time(), None
+        job.state = 'RUNNING'
+        job.write_status()
+        self.running.append(job)
+
+    def _finish(self, job):
+        self.running.remove(job)
+        self.free_cpus += job.parameters['cpus_per_task']
+        self.free_gpus.extend(job.gpus)
+        job.exitcode = job.process.exitcode
+        if job.cancelled:
+            job.state = 'CANCELLED'
+        elif job.exitcode == REQUEUE_EXIT_CODE and os.path.isfile(job.paths['requeue']):
+            with open(job.paths['requeue'], 'rb') as f:
+                delayed = pickle.load(f)
+            if job.requeues < self.max_num_timeout:
+                job.requeues += 1
+                job.fn, job.args, job.kwargs = delayed.function, delayed.args, delayed.kwargs
+                job.state = 'REQUEUED'
+                job.write_status()
+                self.pending.appendleft(job)
+                return
+            job.state = 'TIMEOUT'
+        elif job.signal_time is not None and job.exitcode != 0:
+            job.state = 'TIMEOUT'
+        elif os.path.isfile(job.paths['result']):
+            with open(job.paths['result'], 'rb') as f:
+                job.state = 'COMPLETED' if pickle.load(f)[0] == 'success' else 'FAILED'
+        else:
+            job.state = 'FAILED'
+        job.write_status()
+        job.finished.set()
+
+    def _schedule(self):
+        while True:
+            with self.lock:
+                # start every pending job that fits, in order of submission
+                for job in list(self.pending):
+                    if self._fits(job):
+                        self.pending.remove(job)
+                        self._start(job)
+                now = time.time()
+                for job in list(self.running):
+                    if not job.process.is_alive():
+                        job.process.join()
+                        self._finish(job)
+                        continue
+                    timeout = job.parameters['timeout_min']
+                    if job.signal_time is None and timeout is not None and now - job.start_time > timeout * 60:
+                        self._signal(job)
+                    elif job.signal_time is not None and now - job.signal_time > self.signal_delay_s:
+                        job.process.kill()
+                if not self.pending and not self.running:
+                    self.scheduler = None
+                    return
+            time.sleep(self.poll_interval)
+
+    def _signal(self, job):
+        job.signal_time = time.time()
+        os.kill(job.process.pid, signal.SIGUSR1)
+
+    def signal(self, job):
+        with self.lock:
+            if job in self.running and job.signal_time is None:
+                self._signal(job)
+
+    def cancel(self, job):
+        with self.lock:
+            job.cancelled = True
+            if job in self.pending:
+                self.pending.remove(job)
+                job.state = 'CANCELLED'
+                job.write_status()
+                job.finished.set()
+            elif job in self.running:
+                job.process.terminate()
+
+    def wait(self, jobs=None):
+        """
+        Blocks until `jobs`, or all jobs submitted so far, are done.
+        """
+        with self.lock:
+            jobs = list(self.pending) + list(self.running) if jobs is None else jobs
+        for job in jobs:
+            job.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.wait()
@@ -1,2 +1,3 @@
 from .stdout_logger import StdoutLogger
 from .json_logger import JSONLogger
+from .async_logger import AsyncLogger
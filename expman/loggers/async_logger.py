@@ -0,0 +1,147 @@
+from .logger import Logger
+import logging
+import queue
+import threading
+import time
+
+
+POLICIES = ('block', 'drop_oldest', 'drop')
+
+_STOP = object()
+
+
+class AsyncLogger(Logger):
+    """
+    Wraps a logger so that `log` only puts the record on a bounded queue.
+    A background thread drains the queue into the wrapped logger, so a slow disk or a slow sink does not stall the caller.
+    """
+
+    def __init__(self, logger, max_queue_size=10000, policy='block', finish_timeout=None):
+        """
+        Args:
+            logger: the logger that receives the records.
+            max_queue_size: maximum number of records waiting to be written.
+            policy: what to do when the queue is full.
+                'block' waits for space.
+                'drop_oldest' discards the oldest queued record to make space.
+                'drop' discards the new record.
+                Discarded records are counted in `dropped`.
+            finish_timeout: seconds `finish` waits for the queue to drain. `None` waits indefinitely.
+        """
+        super().__init__()
+        assert policy in POLICIES, 'policy must be one of {}'.format(POLICIES)
+        self.logger = logger
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self.finish_timeout = finish_timeout
+        self.queue = None
+        self.thread = None
+        self.abandon = threading.Event()
+        self.lock = threading.Lock()
+        self.logged = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+
+    def __getstate__(self):
+        # e.g. pickled to load logs in worker processes with `discover_logs(workers=...)`; the copy is not started
+        d = dict(self.__dict__, queue=None, thread=None)
+        del d['abandon'], d['lock']
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.abandon = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def stats(self) -> dict:
+        return dict(queue_depth=self.queue_depth, max_queue_depth=self.max_queue_depth, logged=self.logged, dropped=self.dropped, errors=self.errors)
+
+    def start(self, dlog, config=None, delete_existing=False):
+        super().start(dlog, config=config, delete_existing=delete_existing)
+        self.logger.start(dlog, config=config, delete_existing=delete_existing)
+        self.queue = queue.Queue(maxsize=self.max_queue_size)
+        self.abandon.clear()
+        self.thread = threading.Thread(target=self._drain, name='expman-{}'.format(type(self.logger).__name__), daemon=True)
+        self.thread.start()
+        return self
+
+    def _drain(self):
+        while True:
+            content = self.queue.get()
+            if content is _STOP or self.abandon.is_set():
+                return
+            try:
+                self.logger.log(content)
+                self.logged += 1
+            except Exception as e:
+                self.errors += 1
+                logging.critical('{} failed to log: {}'.format(type(self.logger).__name__, repr(e)))
+
+    def log(self, content: dict):
+        assert self.thread is not None, 'Please run logger.start()'
+        # the caller may reuse the dict after this returns
+        content = dict(content)
+        if self.policy == 'block':
+            self.queue.put(content)
+        elif self.policy == 'drop':
+            try:
+                self.queue.put_nowait(content)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            with self.lock:
+                while True:
+                    try:
+                        self.queue.put_nowait(content)
+                        break
+                    except queue.Full:
+                        try:
+                            self.queue.get_nowait()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def load_logs(self, *args, **kwargs):
+        return self.logger.load_logs(*args, **kwargs)
+
+    def load_columns(self, *args, **kwargs):
+        return self.logger.load_columns(*args, **kwargs)
+
+    def follow(self, *args, **kwargs):
+        return self.logger.follow(*args, **kwargs)
+
+    def finish(self, timeout=None):
+        """
+        Waits up to `timeout` seconds in total (default `self.finish_timeout`) for queued records to be written, then finishes the
+        wrapped logger.
+        Records still queued after the timeout are discarded and counted in `dropped`.
+        """
+        if self.thread is None:
+            return
+        timeout = self.finish_timeout if timeout is None else timeout
+        # one deadline for queueing the stop marker and for draining
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(None if deadline is None else max(0., deadline - time.monotonic()))
+        if self.thread.is_alive():
+            self.abandon.set()
+            remaining = self.queue.qsize()
+            self.dropped += remaining
+            logging.critical('{} did not drain within {}s, discarding {} records'.format(type(self.logger).__name__, timeout, remaining))
+            # wake the thread up in case it is waiting on an empty queue
+            try:
+                self.queue.put_nowait(_STOP)
+            except queue.Full:
+                pass
+        else:
+            self.logger.finish()
+        self.thread = None
@@ -0,0 +1,308 @@
+"""
+Block-compressed JSON lines logs.
+
+A compressed log, e.g. `log.jsonl.gz`, is a sequence of independently compressed blocks of records. With gzip each block is a
+gzip member, so the whole file is still a valid gzip file that `zcat` or `gzip.open` can read. With zstd each block is a frame.
+Next to it, `log.jsonl.gz.idx` has one JSON line per block with its byte offset, size, number of records and the range of steps in
+it, so that readers only read and decompress the blocks of the steps they want, in parallel since both codecs release the GIL.
+Blocks written after the last index entry, e.g. because the writer died in between, are found by decompressing the end of the file.
+"""
+import collections
+import concurrent.futures
+import os
+import time
+import zlib
+import ujson as json
+
+
+def _gzip_compress(data, level):
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+def _zstd():
+    import zstandard
+    return zstandard
+
+
+CODECS = {
+    'gzip': dict(
+        ext='.gz',
+        compress=_gzip_compress,
+        decompressobj=lambda: zlib.decompressobj(31),
+    ),
+    'zstd': dict(
+        ext='.zst',
+        compress=lambda data, level: _zstd().ZstdCompressor(level=level).compress(data),
+        decompressobj=lambda: _zstd().ZstdDecompressor().decompressobj(),
+    ),
+}
+DEFAULT_LEVEL = {'gzip': 6, 'zstd': 3}
+INDEX_EXT = '.idx'
+
+Block = collections.namedtuple('Block', ['offset', 'size', 'records', 'first_step', 'last_step'])
+
+
+def compress(codec, data, level=None):
+    return CODECS[codec]['compress'](data, DEFAULT_LEVEL[codec] if level is None else level)
+
+
+def decompress(codec, data):
+    d = CODECS[codec]['decompressobj']()
+    return d.decompress(data)
+
+
+def codec_for(fname):
+    """
+    Returns the codec of a compressed log from its extension, or `None` for a plain one.
+    """
+    for codec, c in CODECS.items():
+        if fname.endswith(c['ext']):
+            return codec
+    return None
+
+
+def find_log(fname):
+    """
+    Returns the path of the log `fname` as written, plain or compressed with any codec, or `None` if it does not exist.
+    """
+    for path in [fname] + [fname + c['ext'] for c in CODECS.values()]:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _split(codec, data, offset):
+    """
+    Yields `(offset, size, decompressed)` for each complete block in `data`, which starts at `offset` in the file.
+    """
+    view = memoryview(data)
+    start = 0
+    while start < len(data):
+        d = CODECS[codec]['decompressobj']()
+        try:
+            out = d.decompress(view[start:])
+        except Exception:
+            # a partially written block
+            return
+        if not d.eof:
+            return
+        size = len(data) - start - len(d.unused_data)
+        yield offset + start, size, out
+        start += size
+
+
+def _steps(lines):
+    steps = []
+    for line in lines:
+        try:
+            step = json.loads(line).get('step')
+        except Exception:
+            continue
+        if step is not None:
+            steps.append(step)
+    return (min(steps), max(steps)) if steps else (None, None)
+
+
+def read_index(fname):
+    """
+    Returns the `Block`s of the compressed log `fname`, in file order.
+    """
+    return _read_index(fname)[0]
+
+
+def _read_index(fname):
+    """
+    Returns the `Block`s of `fname` and how many of them were found in its index.
+    """
+    codec = codec_for(fname)
+    size = os.path.getsize(fname)
+    blocks = []
+    end = 0
+    try:
+        with open(fname + INDEX_EXT, 'rt') as f:
+            for line in f:
+                try:
+                    b = Block(**json.loads(line))
+                except Exception:
+                    # a partially written entry
+                    break
+                if b.offset != end or b.offset + b.size > size:
+                    # the log was truncated or replaced without its index
+                    break
+                blocks.append(b)
+                end = b.offset + b.size
+    except FileNotFoundError:
+        pass
+    indexed = len(blocks)
+    if end < size:
+        with open(fname, 'rb') as f:
+            f.seek(end)
+            data = f.read()
+        for offset, block_size, out in _split(codec, data, end):
+            lines = out.splitlines()
+            blocks.append(Block(offset, block_size, len(lines), *_steps(lines)))
+    return blocks, indexed
+
+
+def select(blocks, step_range=None):
+    """
+    Returns the blocks that may hold records with `lo <= step < hi`.
+    """
+    lo, hi = step_range or (None, None)
+    return [b for b in blocks if b.first_step is None or
+            ((lo is None or b.last_step >= lo) and (hi is None or b.first_step < hi))]
+
+
+def iter_blocks(fname, blocks, workers=None):
+    """
+    Yields the decompressed contents of `blocks` of `fname`, in order. Only the bytes of these blocks are read, and with `workers`
+    up to that many blocks are decompressed at once while keeping at most twice as many in memory.
+    """
+    codec = codec_for(fname)
+    with open(fname, 'rb') as f:
+        def read(b):
+            f.seek(b.offset)
+            return f.read(b.size)
+
+        if not workers or workers <= 1 or len(blocks) <= 1:
+            for b in blocks:
+                yield decompress(codec, read(b))
+            return
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            pending = collections.deque()
+            for b in blocks:
+                pending.append(executor.submit(decompress, codec, read(b)))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def iter_lines(fname, step_range=None, workers=None):
+    """
+    Yields the lines of the log `fname`, plain or compressed. For compressed logs only the blocks overlapping `step_range` are read,
+    so lines outside of it may still be returned.
+    """
+    if codec_for(fname) is None:
+        with open(fname, 'rt') as f:
+            yield from f
+        return
+    blocks = select(read_index(fname), step_range)
+    for data in iter_blocks(fname, blocks, workers=workers):
+        # not `str.splitlines`, which also splits on unicode line separators
+        yield from data.decode().split('\n')[:-1]
+
+
+def last_line(fname):
+    """
+    Returns the last non empty line of the compressed log `fname` by decompressing only its last block, or `None`.
+    """
+    blocks = read_index(fname)
+    for data in iter_blocks(fname, blocks[-1:]):
+        for line in reversed(data.splitlines()):
+            if line.strip():
+                return line
+    return None
+
+
+class BlockWriter:
+    """
+    Appends blocks of lines to a compressed log and their entries to its index.
+    """
+
+    def __init__(self, fname, codec, level=None):
+        self.fname = fname
+        self.codec = codec
+        self.level = level
+        self.repair()
+        self.file = open(fname, 'ab')
+        self.index = open(fname + INDEX_EXT, 'at')
+        self.offset = self.file.tell()
+
+    def repair(self):
+        """
+        Drops a partially written last block and indexes the blocks missing from the index, e.g. after the writer was killed,
+        so that new blocks can be found from the index.
+        """
+        if not os.path.isfile(self.fname):
+            if os.path.isfile(self.fname + INDEX_EXT):
+                os.remove(self.fname + INDEX_EXT)
+            return
+        blocks, indexed = _read_index(self.fname)
+        end = blocks[-1].offset + blocks[-1].size if blocks else 0
+        if os.path.getsize(self.fname) > end:
+            os.truncate(self.fname, end)
+        with open(self.fname + INDEX_EXT, 'a+t') as f:
+            f.seek(0)
+            num_lines = sum(1 for _ in f)
+        if indexed != len(blocks) or num_lines != indexed:
+            ftmp = '{}{}.{}.tmp'.format(self.fname, INDEX_EXT, os.getpid())
+            with open(ftmp, 'wt') as f:
+                f.writelines(json.dumps(b._asdict()) + '\n' for b in blocks)
+            os.replace(ftmp, self.fname + INDEX_EXT)
+
+    def write(self, lines, steps, durability='flush'):
+        data = compress(self.codec, ('\n'.join(lines) + '\n').encode(), self.level)
+        steps = [s for s in steps if s is not None]
+        self.file.write(data)
+        if durability in ('flush', 'fsync'):
+            self.file.flush()
+        if durability == 'fsync':
+            os.fsync(self.file.fileno())
+        block = Block(self.offset, len(data), len(lines), min(steps) if steps else None, max(steps) if steps else None)
+        self.index.write(json.dumps(block._asdict()) + '\n')
+        if durability in ('flush', 'fsync'):
+            self.index.flush()
+        self.offset += len(data)
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class BlockTail:
+    """
+    Like `Tail`, but returns the lines of the blocks appended to a compressed log since the last read.
+    """
+
+    def __init__(self, fname, offset=0):
+        self.fname = fname
+        self.offset = offset
+        self.more = False
+
+    def read_lines(self, max_bytes=None):
+        """
+        Args:
+            max_bytes: stop after the block that brings the compressed bytes read to this many, leaving the rest for the next calls.
+        """
+        try:
+            if os.path.getsize(self.fname) < self.offset:
+                # the log was replaced
+                self.offset = 0
+            blocks = [b for b in read_index(self.fname) if b.offset >= self.offset]
+        except FileNotFoundError:
+            self.more = False
+            return []
+        self.more = False
+        if max_bytes is not None:
+            total = 0
+            for i, b in enumerate(blocks):
+                total += b.size
+                if total >= max_bytes:
+                    self.more = i + 1 < len(blocks)
+                    blocks = blocks[:i + 1]
+                    break
+        lines = []
+        for b, data in zip(blocks, iter_blocks(self.fname, blocks)):
+            lines.extend(data.splitlines())
+            self.offset = b.offset + b.size
+        return lines
+
+    def wait(self, timeout):
+        if timeout:
+            time.sleep(timeout)
+
+    def close(self):
+        pass
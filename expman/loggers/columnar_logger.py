@@ -0,0 +1,236 @@
+from .logger import Logger
+import contextlib
+import logging
+import math
+import os
+import shutil
+import struct
+import numpy as np
+import ujson as json
+from urllib.parse import quote, unquote
+
+
+MAGIC = b'EXPC'
+VERSION = 1
+# magic, version, dtype, chunk size, reserved
+HEADER = struct.Struct('<4sH2sII')
+NUMERIC_DTYPE = np.dtype('<f8')
+NUMERIC_EXT = '.f8'
+# the `step` column is stored as integers, so that steps load back as ints
+INT_DTYPE = np.dtype('<i8')
+INT_EXT = '.i8'
+INT_KEYS = ('step', )
+# marks rows of an integer column without a value
+MISSING_INT = np.iinfo(INT_DTYPE).min
+OBJECT_EXT = '.jsonl'
+EXTS = (('numeric', NUMERIC_EXT), ('int', INT_EXT), ('object', OBJECT_EXT))
+
+
+class ColumnarLogger(Logger):
+    """
+    Writes each key of the logged records to its own column file inside `<dlog>/<logname>`.
+
+    Numeric values (including booleans) are stored as little-endian float64 after a small header, so a column can be
+    memory mapped without touching the other keys. Integer steps are stored as int64 instead. Other values are stored one JSON
+    value per line. Every column has one entry per record, records that do not contain a key are filled with NaN (or null, or
+    `MISSING_INT` for steps).
+    Records are written in chunks of `chunk_size` rows, and on `finish`.
+    """
+
+    def __init__(self, logname='log.columns', chunk_size=1024):
+        super().__init__()
+        self.logname = logname
+        self.chunk_size = chunk_size
+        self.dname = None
+        self.started = False
+        self.buffer = []
+        self.num_rows = 0
+        self.kinds = {}
+        self.lengths = {}
+
+    def start(self, dlog, config=None, delete_existing=False):
+        super().start(dlog, config=config, delete_existing=delete_existing)
+        self.dname = os.path.join(self.dlog, self.logname)
+        if delete_existing and os.path.isdir(self.dname):
+            shutil.rmtree(self.dname)
+        self.buffer.clear()
+        self.kinds = {}
+        self.lengths = {}
+        for key, kind, fname in self._list_columns():
+            self.kinds[key] = kind
+            self.lengths[key] = self._column_length(kind, fname)
+        self.num_rows = max(self.lengths.values(), default=0)
+        self.started = True
+        return self
+
+    def _column_fname(self, key, kind):
+        return os.path.join(self.dname, quote(key, safe='') + dict(EXTS)[kind])
+
+    def _list_columns(self):
+        if not os.path.isdir(self.dname):
+            return []
+        columns = []
+        for fname in sorted(os.listdir(self.dname)):
+            for kind, ext in EXTS:
+                if fname.endswith(ext):
+                    columns.append((unquote(fname[:-len(ext)]), kind, os.path.join(self.dname, fname)))
+        return columns
+
+    @staticmethod
+    def _column_length(kind, fname):
+        if kind != 'object':
+            return max(0, os.path.getsize(fname) - HEADER.size) // 8
+        with open(fname, 'rb') as f:
+            return sum(1 for _ in f)
+
+    @staticmethod
+    def _is_numeric(v):
+        return isinstance(v, (int, float)) and not isinstance(v, str)
+
+    @classmethod
+    def _kind(cls, key, v):
+        if key in INT_KEYS and isinstance(v, int) and not isinstance(v, bool):
+            return 'int'
+        return 'numeric' if cls._is_numeric(v) else 'object'
+
+    def log(self, content: dict):
+        assert self.started
+        # the caller may reuse the dict after this returns
+        self.buffer.append(dict(content))
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends buffered records to the column files.
+        """
+        if not self.buffer:
+            return
+        if not os.path.isdir(self.dname):
+            os.makedirs(self.dname)
+        for row in self.buffer:
+            for k, v in row.items():
+                if k not in self.kinds and v is not None:
+                    self.kinds[k] = self._kind(k, v)
+        for key, kind in self.kinds.items():
+            fname = self._column_fname(key, kind)
+            existing = self.lengths.get(key)
+            # keys that appear for the first time are back filled so all columns stay aligned
+            backfill = self.num_rows - (existing or 0)
+            self.lengths[key] = self.num_rows + len(self.buffer)
+            if kind != 'object':
+                dtype, missing = (INT_DTYPE, MISSING_INT) if kind == 'int' else (NUMERIC_DTYPE, np.nan)
+                values = np.full(backfill + len(self.buffer), missing, dtype=dtype)
+                for i, row in enumerate(self.buffer, backfill):
+                    v = row.get(key)
+                    if v is not None:
+                        try:
+                            values[i] = v
+                        except (TypeError, ValueError, OverflowError):
+                            logging.critical('Cannot store {}={} in {} column of {}'.format(key, repr(v), kind, self.dname))
+                with open(fname, 'ab') as f:
+                    if existing is None:
+                        f.write(HEADER.pack(MAGIC, VERSION, dtype.str[1:].encode(), self.chunk_size, 0))
+                    f.write(values.tobytes())
+            else:
+                lines = ['null'] * backfill + [json.dumps(row.get(key)) for row in self.buffer]
+                with open(fname, 'at') as f:
+                    f.write('\n'.join(lines) + '\n')
+        self.num_rows += len(self.buffer)
+        self.buffer.clear()
+
+    def load_columns(self, columns=None, ignore=tuple(), error='warn', step_range=None, every=1):
+        """
+        Returns a dict mapping each key to a NumPy array with one entry per record.
+        Numeric columns are memory mapped, so only the requested keys are read.
+        If `step_range` or `every` are given, the rows are selected using the `step` column and only those rows are copied out.
+        """
+        if not os.path.isdir(self.dname):
+            if error == 'warn':
+                logging.critical('directory doesnt exist {}'.format(self.dname))
+                return {}
+            elif error == 'ignore':
+                return {}
+            else:
+                raise Exception('directory doesnt exist {}'.format(self.dname))
+        ret = {}
+        all_columns = self._list_columns()
+        rows = self._select_rows(all_columns, step_range, every)
+        for key, kind, fname in all_columns:
+            if key in ignore or (columns is not None and key not in columns):
+                continue
+            try:
+                ret[key] = self._read_column(kind, fname)
+                if rows is not None:
+                    ret[key] = ret[key][rows[rows < len(ret[key])]]
+            except Exception as e:
+                if error == 'warn':
+                    logging.critical('In {}'.format(fname))
+                    logging.critical(repr(e))
+                elif error == 'ignore':
+                    pass
+                else:
+                    raise e
+        return ret
+
+    def _select_rows(self, all_columns, step_range, every):
+        if step_range is None and every == 1:
+            return None
+        num_rows = max([self._column_length(kind, fname) for _, kind, fname in all_columns], default=0)
+        rows = np.arange(num_rows)
+        if step_range is not None:
+            lo, hi = step_range
+            steps = [(kind, self._read_column(kind, fname)) for key, kind, fname in all_columns if key == 'step' and kind != 'object']
+            kind, steps = steps[0] if steps else ('numeric', np.full(num_rows, np.nan))
+            mask = steps != MISSING_INT if kind == 'int' else ~np.isnan(steps)
+            if lo is not None:
+                mask &= steps >= lo
+            if hi is not None:
+                mask &= steps < hi
+            rows = rows[mask]
+        return rows[::every]
+
+    @staticmethod
+    def _read_column(kind, fname):
+        if kind != 'object':
+            with open(fname, 'rb') as f:
+                magic, version, dtype, chunk_size, _ = HEADER.unpack(f.read(HEADER.size))
+            assert magic == MAGIC, 'Not a column file: {}'.format(fname)
+            dtype = INT_DTYPE if kind == 'int' else NUMERIC_DTYPE
+            length = ColumnarLogger._column_length(kind, fname)
+            if not length:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(fname, dtype=dtype, mode='r', offset=HEADER.size, shape=(length, ))
+        with open(fname, 'rt') as f:
+            return np.array([json.loads(line) for line in f], dtype=object)
+
+    def load_logs(self, ignore=tuple(), error='warn', columns=None, step_range=None, every=1):
+        columns = self.load_columns(columns=columns, ignore=ignore, error=error, step_range=step_range, every=every)
+        logs = [{} for _ in range(max([len(v) for v in columns.values()], default=0))]
+        for k, values in columns.items():
+            missing = MISSING_INT if values.dtype == INT_DTYPE else None
+            for d, v in zip(logs, values.tolist()):
+                if v is not None and v != missing and not (isinstance(v, float) and math.isnan(v)):
+                    d[k] = v
+        return logs
+
+    def finish(self):
+        self.flush()
+
+    @classmethod
+    def convert_json_log(cls, fjson, delete_existing=True, chunk_size=1024):
+        """
+        Converts a `log.jsonl` file written by `JSONLogger`, plain or compressed, into a column directory next to it.
+        """
+        from .blocks import find_log, iter_lines
+        log = cls(chunk_size=chunk_size).start(os.path.dirname(fjson), delete_existing=delete_existing)
+        with contextlib.closing(iter_lines(find_log(fjson) or fjson)) as f:
+            for line in f:
+                try:
+                    log.log(json.loads(line))
+                except ValueError as e:
+                    logging.critical('In {}'.format(fjson))
+                    logging.critical(repr(e))
+        log.finish()
+        logging.info('Converted {} to {}'.format(fjson, log.dname))
+        return log
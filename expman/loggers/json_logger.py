@@ -1,57 +1,526 @@
 from .logger import Logger
+from .tail import Tail
+from .summary import SummaryPyramid
+from . import blocks
+import atexit
+import contextlib
+import glob
+import heapq
+import itertools
 import logging
 import os
+import re
+import time
 import ujson as json
 
 
+DURABILITY = ('none', 'flush', 'fsync')
+REDUCTIONS = ('mean', 'sum', 'any')
+
+# environment variables holding the rank of a process, as set by torchrun and slurm
+RANK_VARIABLES = ('RANK', 'SLURM_PROCID')
+
+# finds the step of a record without decoding the whole line, see `top_level_step`. `JSONLogger` writes it as the first key,
+# so a match at the start of the line is always the top-level key
+STEP_PATTERN = re.compile(r'\s*\{"step":\s*(-?\d+)\s*[,}]')
+
+# loggers that logged since they were last closed, closed when the interpreter exits. These are strong references, so that a
+# logger dropped without `finish` still writes its buffer and incomplete summary buckets.
+_open_loggers = set()
+
+
+@atexit.register
+def _close_open_loggers():
+    for logger in list(_open_loggers):
+        try:
+            logger.close()
+        except Exception as e:
+            logging.critical('Failed to close {}: {}'.format(logger.fname, repr(e)))
+
+
+def top_level_step(line):
+    """
+    Returns the integer `step` of the JSON record `line` without decoding it, or `None` if it cannot be told for sure, i.e.
+    unless `step` is the first key of the record, as `JSONLogger` writes it.
+    """
+    m = STEP_PATTERN.match(line)
+    return None if m is None else int(m.group(1))
+
+
+def _line_step(line):
+    line = line.decode()
+    step = top_level_step(line)
+    if step is None:
+        try:
+            step = json.loads(line).get('step')
+        except Exception:
+            return None
+    return step
+
+
+def seek_step(fname, step, min_span=2 ** 16):
+    """
+    Returns the offset of a line of the plain log `fname`, at or before its first record with a step of at least `step`, by
+    bisecting the file and decoding only a few lines. The records must be in step order, as `Experiment` writes them.
+    """
+    with open(fname, 'rb') as f:
+        # every record before `lo` has a lower step
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while hi - lo > min_span:
+            mid = (lo + hi) // 2
+            f.seek(mid)
+            f.readline()
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                hi = mid
+                continue
+            s = _line_step(line)
+            if s is not None and s < step:
+                lo = f.tell()
+            else:
+                hi = mid
+    return lo
+
+
+def end_offset(fname):
+    """
+    Returns the offset right after the last complete line of the plain log `fname`.
+    """
+    with open(fname, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 2 ** 16)
+            f.seek(start)
+            i = f.read(end - start).rfind(b'\n')
+            if i >= 0:
+                return start + i + 1
+            end = start
+    return 0
+
+
+def in_step_range(step, lo, hi):
+    if step is None:
+        return False
+    return (lo is None or step >= lo) and (hi is None or step < hi)
+
+
+def resolve_rank(rank):
+    """
+    Returns `rank`, or with `rank='env'` the rank of this process from `RANK_VARIABLES`, or `None` if none is set.
+    """
+    if rank != 'env':
+        return rank
+    for var in RANK_VARIABLES:
+        if os.environ.get(var):
+            return int(os.environ[var])
+    return None
+
+
+def _merge_order(d):
+    step = d.get('step')
+    return -1 if step is None else step, d.get('time') or ''
+
+
+def _with_rank(records, rank):
+    for d in records:
+        d['rank'] = rank
+        yield d
+
+
+def reduce_records(records, how):
+    """
+    Combines the records of several ranks for one step into one: numeric values (including booleans) are averaged with
+    `how='mean'`, added with `how='sum'` or or-ed with `how='any'`, the latest `time` is kept, and for other values the first
+    rank's is kept.
+    """
+    if len(records) == 1:
+        d = dict(records[0])
+        d.pop('rank', None)
+        return d
+    values = {}
+    for d in records:
+        for k, v in d.items():
+            values.setdefault(k, []).append(v)
+    values.pop('rank', None)
+    out = {}
+    for k, vs in values.items():
+        if k == 'time':
+            out[k] = max(v for v in vs if v is not None) if any(v is not None for v in vs) else None
+        elif k != 'step' and all(isinstance(v, (int, float)) for v in vs):
+            if how == 'any':
+                out[k] = any(vs)
+            elif how == 'sum':
+                out[k] = sum(vs)
+            else:
+                out[k] = sum(vs) / len(vs)
+        else:
+            out[k] = vs[0]
+    return out
+
+
 class JSONLogger(Logger):
 
-    def __init__(self, logname='log.jsonl'):
+    def __init__(self, logname='log.jsonl', buffer_size=None, flush_interval=None, durability='flush', summary_levels=None, rank=None,
+                 reduce=None, compression=None, compression_level=None, decompress_workers=4):
+        """
+        Args:
+            logname: name of the log file inside the experiment directory.
+            rank: if given, write to the shard `log.rank<rank>.jsonl` instead of `logname`, so that every process of a distributed
+                job can log without coordinating with the others. 'env' reads the rank from the `RANK` or `SLURM_PROCID` environment
+                variables. When reading, the shards of all ranks are merged by step and time, see `load_logs`.
+            reduce: when reading shards, combine the records of all ranks for a step into one, with 'mean', 'sum' or 'any'.
+                Without it, each record is returned with the `rank` that wrote it. `follow` and summaries only cover one file.
+            buffer_size: number of records to hold in memory before writing them to the log file. Defaults to 1, or to 1000 with
+                `compression`, where each write is one compressed block.
+            flush_interval: if set, buffered records are also written once this many seconds have passed since the last write.
+                This is checked whenever a record is logged.
+            durability: what to do after each write.
+                'none' leaves the records in Python's file buffer, they reach the OS when the buffer fills or on `finish`.
+                'flush' hands the records to the OS, so they survive the process crashing.
+                'fsync' additionally calls `os.fsync`, so they survive the machine crashing.
+            summary_levels: if given, e.g. `(10, 100, 1000, 10000)`, per-bucket summaries of every numeric key are kept for buckets of
+                that many steps and written next to the log, see `SummaryPyramid` and `load_summary`.
+            compression: write `log.jsonl.gz` ('gzip') or `log.jsonl.zst` ('zstd', needs `zstandard`) in independently compressed
+                blocks, with an index of the steps in each block, see `expman.loggers.blocks`. Readers handle plain and compressed
+                logs alike, and with a `step_range` only decompress the blocks they need.
+            compression_level: codec compression level, 6 for gzip and 3 for zstd by default.
+            decompress_workers: number of blocks of a compressed log decompressed in parallel when reading.
+
+        Buffered records and incomplete summary buckets are always written out on `finish` and when the process exits, even if the
+        logger itself was dropped.
+        """
         super().__init__()
+        assert durability in DURABILITY, 'durability must be one of {}'.format(DURABILITY)
+        assert reduce is None or reduce in REDUCTIONS, 'reduce must be one of {}'.format(REDUCTIONS)
+        assert compression is None or compression in blocks.CODECS, 'compression must be one of {}'.format(tuple(blocks.CODECS))
+        self.rank = resolve_rank(rank)
+        self.reduce = reduce
+        if self.rank is not None:
+            base, ext = os.path.splitext(logname)
+            logname = '{}.rank{}{}'.format(base, self.rank, ext)
         self.logname = logname
+        self.compression = compression
+        self.compression_level = compression_level
+        self.decompress_workers = decompress_workers
+        self.buffer_size = buffer_size or (1000 if compression else 1)
+        self.flush_interval = flush_interval
+        self.durability = durability
         self.fname = None
         self.started = False
+        self.buffer = []
+        self.buffer_steps = []
+        self.num_records = 0
+        self.num_flushes = 0
+        self.bytes_written = 0
+        self.last_flush_time = None
+        self.file = None
+        self.registered = False
+        self.summary_levels = summary_levels
+        self.summary = None
+
+    @property
+    def fout(self):
+        """
+        The file this logger writes to, `fname` with the extension of its `compression` if any.
+        """
+        return self.fname + blocks.CODECS[self.compression]['ext'] if self.compression else self.fname
+
+    @property
+    def summary_prefix(self):
+        return os.path.join(self.dlog, os.path.splitext(self.logname)[0])
 
     def start(self, dlog, config=None, delete_existing=False):
         super().start(dlog, config=config, delete_existing=delete_existing)
         self.fname = os.path.join(self.dlog, self.logname)
-        if delete_existing and os.path.isfile(self.fname):
-            os.remove(self.fname)
+        if delete_existing and blocks.find_log(self.fname):
+            self.close()
+            for fname in [self.fname] + [self.fname + c['ext'] + suffix for c in blocks.CODECS.values() for suffix in ('', blocks.INDEX_EXT)]:
+                if os.path.isfile(fname):
+                    os.remove(fname)
+            for level in SummaryPyramid.available_levels(self.summary_prefix):
+                os.remove(SummaryPyramid.fname(self.summary_prefix, level))
+        if self.summary_levels:
+            self.summary = SummaryPyramid(self.summary_prefix, levels=self.summary_levels)
         self.started = True
+        self.last_flush_time = time.time()
         return self
 
     def log(self, content: dict):
         assert self.started
-        with open(self.fname, 'at') as f:
-            f.write(json.dumps(content) + '\n')
+        if not self.registered:
+            _open_loggers.add(self)
+            self.registered = True
+        if 'step' in content and next(iter(content)) != 'step':
+            # first, so that readers can find it without decoding the record, see `top_level_step`
+            content = {'step': content['step'], **content}
+        self.buffer.append(json.dumps(content))
+        if self.compression:
+            self.buffer_steps.append(content.get('step'))
+        self.num_records += 1
+        if self.summary is not None:
+            self.summary.add(content)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        elif self.flush_interval is not None and time.time() - self.last_flush_time >= self.flush_interval:
+            self.flush()
 
-    def load_logs(self, ignore=tuple(), error='warn'):
-        logs = []
-        if not os.path.isfile(self.fname):
+    def flush(self):
+        """
+        Writes buffered records to the log file according to `self.durability`.
+        """
+        self.last_flush_time = time.time()
+        if not self.buffer:
+            return
+        if self.file is None:
+            # the file is opened on first write so that readers do not create empty logs
+            self.file = blocks.BlockWriter(self.fout, self.compression, self.compression_level) if self.compression else open(self.fname, 'at')
+        if self.compression:
+            self.bytes_written += self.file.write(self.buffer, self.buffer_steps, durability=self.durability)
+            self.buffer_steps.clear()
+        else:
+            # characters, which is the number of bytes for the ASCII that ujson writes by default
+            self.bytes_written += self.file.write('\n'.join(self.buffer) + '\n')
+        self.num_flushes += 1
+        self.buffer.clear()
+        if self.durability in ('flush', 'fsync'):
+            if not self.compression:
+                self.file.flush()
+            if self.summary is not None:
+                self.summary.flush()
+        if self.durability == 'fsync' and not self.compression:
+            os.fsync(self.file.fileno())
+
+    def stats(self) -> dict:
+        return dict(records=self.num_records, flushes=self.num_flushes, bytes_written=self.bytes_written)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.summary is not None:
+            self.summary.close()
+        _open_loggers.discard(self)
+        self.registered = False
+
+    def summary_levels_available(self):
+        return SummaryPyramid.available_levels(self.summary_prefix)
+
+    def pick_summary_level(self, num_points):
+        """
+        Returns the finest summary level with roughly at most `num_points` buckets, or the coarsest one if none is that small.
+        """
+        levels = self.summary_levels_available()
+        for level in levels:
+            fname = SummaryPyramid.fname(self.summary_prefix, level)
+            with open(fname, 'rb') as f:
+                first = f.readline()
+            # estimate the number of buckets from the size of the first line
+            if not first or os.path.getsize(fname) / len(first) <= num_points:
+                return level
+        return levels[-1] if levels else None
+
+    def load_summary(self, level, columns=None, step_range=None, error='warn'):
+        """
+        Loads the summary of buckets of `level` steps written with `summary_levels`, see `SummaryPyramid.load`.
+        """
+        return SummaryPyramid.load(self.summary_prefix, level, columns=columns, step_range=step_range, error=error)
+
+    def shards(self):
+        """
+        Returns `(rank, fname)` for every shard of the log written with `rank`, plus `(None, fname)` for the unsharded log if it
+        exists too, or an empty list if there are no shards. Loggers writing a shard only read their own.
+        """
+        if self.rank is not None:
+            return []
+        base, ext = os.path.splitext(self.fname)
+        codec_exts = '|'.join(re.escape(c['ext']) for c in blocks.CODECS.values())
+        pattern = re.compile(re.escape(os.path.basename(base)) + r'\.rank(\d+)' + re.escape(ext) + '(' + codec_exts + ')?$')
+        shards = []
+        for fname in glob.glob(glob.escape(base) + '.rank*' + ext + '*'):
+            m = pattern.match(os.path.basename(fname))
+            if m:
+                shards.append((int(m.group(1)), fname))
+        if not shards:
+            return []
+        shards.sort()
+        fname = blocks.find_log(self.fname)
+        if fname is not None:
+            shards.insert(0, (None, fname))
+        return shards
+
+    def load_logs(self, ignore=tuple(), error='warn', columns=None, step_range=None, every=1, cache=None):
+        """
+        Args:
+            ignore: keys to leave out.
+            error: what to do with unreadable lines, one of 'warn', 'ignore' or 'raise'.
+            columns: if given, only these keys are returned.
+            step_range: if given, a `(lo, hi)` tuple, only records with `lo <= step < hi` are returned. Either end may be `None`.
+            every: only return every `every`-th record that is in `step_range`.
+            cache: an `expman.cache.LogCache`. If given, only lines appended since the file was last cached are decoded.
+                Compressed logs are not cached.
+
+        Without a cache, lines outside of `step_range` or skipped by `every` are not decoded.
+        If the log was written in shards, see `rank`, they are read in parallel streams and merged by step and time.
+        """
+        shards = self.shards()
+        if shards:
+            return self._load_shards(shards, ignore, error, columns, step_range, every, cache)
+        fname = blocks.find_log(self.fname)
+        if fname is None:
             if error == 'warn':
                 logging.critical('file doesnt exist {}'.format(self.fname))
-                return logs
+                return []
             elif error == 'ignore':
-                return logs
+                return []
             else:
                 raise Exception('file doesnt exist {}'.format(self.fname))
-        with open(self.fname, 'rt') as f:
+        return list(self._iter_file(fname, ignore, error, columns, step_range, every, cache))
+
+    def _iter_file(self, fname, ignore, error, columns, step_range, every, cache):
+        lo, hi = step_range or (None, None)
+        compressed = blocks.codec_for(fname) is not None
+        if cache is not None and not compressed:
+            rows = cache.read_jsonl(fname, error=error)
+            if step_range is not None:
+                rows = [d for d in rows if in_step_range(d.get('step'), lo, hi)]
+            for d in rows[::every]:
+                if columns is not None:
+                    yield {k: d[k] for k in columns if k in d and k not in ignore}
+                else:
+                    yield {k: v for k, v in d.items() if k not in ignore}
+            return
+        seen = 0
+        if compressed:
+            # only the blocks overlapping `step_range` are decompressed, which makes a cache unnecessary
+            lines = blocks.iter_lines(fname, step_range=step_range, workers=self.decompress_workers)
+        else:
+            lines = open(fname, 'rt')
+        with contextlib.closing(lines) as f:
             for line in f:
+                # whether the line is known to be in `step_range` before decoding it, so that `every` can skip it undecoded
+                known = step_range is None
+                if not known:
+                    step = top_level_step(line)
+                    if step is not None:
+                        if not in_step_range(step, lo, hi):
+                            continue
+                        known = True
+                if known:
+                    seen += 1
+                    if (seen - 1) % every:
+                        continue
                 try:
-                    d = {k: v for k, v in json.loads(line).items() if k not in ignore}
-                    logs.append(d)
+                    d = json.loads(line)
+                    if not known:
+                        if not in_step_range(d.get('step'), lo, hi):
+                            continue
+                        seen += 1
+                        if (seen - 1) % every:
+                            continue
+                    if columns is not None:
+                        d = {k: d[k] for k in columns if k in d and k not in ignore}
+                    else:
+                        d = {k: v for k, v in d.items() if k not in ignore}
                 except Exception as e:
                     if error == 'warn':
-                        logging.critical('In {}'.format(self.fname))
+                        logging.critical('In {}'.format(fname))
                         logging.critical(repr(e))
+                        continue
                     elif error == 'ignore':
-                        pass
+                        continue
                     else:
                         raise e
+                yield d
+
+    def _load_shards(self, shards, ignore, error, columns, step_range, every, cache):
+        # every shard is in step order, so they are merged lazily, holding one record per shard
+        keep = None if columns is None else list(columns) + ['step', 'time']
+        streams = []
+        for rank, fname in shards:
+            stream = self._iter_file(fname, (), error, keep, step_range, 1, cache)
+            streams.append(stream if rank is None else _with_rank(stream, rank))
+        merged = heapq.merge(*streams, key=_merge_order)
+        if self.reduce is not None:
+            merged = (reduce_records(list(group), self.reduce) for _, group in itertools.groupby(merged, key=lambda d: d.get('step')))
+        logs = []
+        for d in itertools.islice(merged, 0, None, every):
+            if columns is not None:
+                logs.append({k: d[k] for k in columns if k in d and k not in ignore})
+            else:
+                logs.append({k: v for k, v in d.items() if k not in ignore})
         return logs
 
+    def follow(self, columns=None, from_step=None, from_end=False, batch=False, poll_interval=0.5, idle_timeout=None, max_read=1 << 20, error='warn'):
+        """
+        Yields records as they are appended to the log file, starting with the ones already in it.
+
+        Args:
+            columns: if given, only these keys are returned.
+            from_step: skip records whose step is lower than this. Reading starts close to the first such record, found by
+                bisecting the log or from the index of a compressed log, rather than decoding the records before it.
+            from_end: only yield records appended after this call.
+            batch: yield lists of the records read in one go instead of single records.
+                When nothing new arrived within `poll_interval`, an empty list is yielded, so callers can interleave several followers.
+            poll_interval: seconds to wait for new data between reads.
+            idle_timeout: stop once no new records arrived for this many seconds. `None` follows forever.
+            max_read: bytes read from the log at once, so a long existing log is yielded in batches as it is read rather than
+                decoded in full before the first one. `None` reads everything available.
+        """
+        fname = blocks.find_log(self.fname) or (self.fout if self.compression else self.fname)
+        compressed = blocks.codec_for(fname) is not None
+        offset = 0
+        if os.path.isfile(fname) and (from_end or from_step is not None):
+            if compressed:
+                found = blocks.read_index(fname)
+                if from_step is not None and not from_end:
+                    found = blocks.select(found, (from_step, None))
+                    offset = found[0].offset if found else os.path.getsize(fname)
+                elif found:
+                    offset = found[-1].offset + found[-1].size
+            else:
+                offset = end_offset(fname) if from_end else seek_step(fname, from_step)
+        tail = blocks.BlockTail(fname, offset) if compressed else Tail(fname, offset)
+        last_read = time.time()
+        try:
+            while True:
+                records = []
+                for line in tail.read_lines(max_read):
+                    try:
+                        d = json.loads(line)
+                    except Exception as e:
+                        if error == 'warn':
+                            logging.critical('In {}'.format(self.fname))
+                            logging.critical(repr(e))
+                            continue
+                        elif error == 'ignore':
+                            continue
+                        else:
+                            raise e
+                    if from_step is not None and not in_step_range(d.get('step'), from_step, None):
+                        continue
+                    if columns is not None:
+                        d = {k: d[k] for k in columns if k in d}
+                    records.append(d)
+                if records:
+                    last_read = time.time()
+                    if batch:
+                        yield records
+                    else:
+                        yield from records
+                    continue
+                if tail.more:
+                    continue
+                if idle_timeout is not None and time.time() - last_read > idle_timeout:
+                    return
+                if batch:
+                    yield records
+                tail.wait(poll_interval)
+        finally:
+            tail.close()
+
     def finish(self):
-        self.name = None
+        self.close()
 
     @classmethod
     def convert_rl_log(cls, frl, delete_existing=False):
@@ -62,7 +531,7 @@ class JSONLogger(Logger):
             except Exception:
                 return n
 
-        log = cls().start(os.path.dirname(frl), delete_existing=delete_existing)
+        log = cls(buffer_size=10000, durability='none').start(os.path.dirname(frl), delete_existing=delete_existing)
         with open(frl) as f:
             try:
                 header = next(f).strip('#').strip().split(',')
@@ -71,8 +540,33 @@ class JSONLogger(Logger):
             for line in f:
                 if line.startswith('#'):
                     continue
-                read = line.strip().split(',')
-                row = [try_num(e) for e in read]
-                log.log(dict(zip(header, row)))
+                log.log(dict(zip(header, map(try_num, line.strip().split(',')))))
+        log.finish()
         logging.info('Converted {} to {}'.format(frl, log.fname))
         return log
+
+    @classmethod
+    def compress_log(cls, fjson, compression='gzip', block_size=1000, delete_existing=True):
+        """
+        Rewrites the plain log `fjson` as a block-compressed log next to it, and removes `fjson` unless `delete_existing` is unset.
+        """
+        dlog, logname = os.path.split(fjson)
+        fout = fjson + blocks.CODECS[compression]['ext']
+        for f in (fout, fout + blocks.INDEX_EXT):
+            if os.path.isfile(f):
+                os.remove(f)
+        log = cls(logname=logname, compression=compression, buffer_size=block_size, durability='none').start(dlog)
+        with open(fjson, 'rt') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    log.log(json.loads(line))
+                except ValueError as e:
+                    logging.critical('In {}'.format(fjson))
+                    logging.critical(repr(e))
+        log.finish()
+        if delete_existing:
+            os.remove(fjson)
+        logging.info('Compressed {} to {}'.format(fjson, fout))
+        return log
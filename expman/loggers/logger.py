@@ -9,7 +9,30 @@ class Logger:
     def log(self, content: dict):
         raise NotImplementedError()
 
-    def load_logs(self, ignore=tuple()):
+    def load_logs(self, ignore=tuple(), error='warn', columns=None, step_range=None, every=1):
+        raise NotImplementedError()
+
+    def load_columns(self, columns=None, ignore=tuple(), error='warn', step_range=None, every=1):
+        """
+        Returns a dict mapping each key to a NumPy array with one entry per record.
+        Records that do not contain a key are filled with NaN (or None for non-numeric keys).
+        """
+        import numpy as np
+        logs = self.load_logs(ignore=ignore, error=error, columns=columns, step_range=step_range, every=every)
+        keys = {}
+        for d in logs:
+            for k in d:
+                keys[k] = True
+        ret = {}
+        for k in keys:
+            values = [d.get(k) for d in logs]
+            if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, str)) for v in values):
+                ret[k] = np.array([float('nan') if v is None else v for v in values], dtype=float)
+            else:
+                ret[k] = np.array(values, dtype=object)
+        return ret
+
+    def follow(self, columns=None, from_step=None, **kwargs):
         raise NotImplementedError()
 
     def finish(self):
@@ -1,8 +1,8 @@
 from .logger import Logger
-import pprint
 
 
 class StdoutLogger(Logger):
 
     def log(self, content: dict):
+        import pprint
         pprint.pprint(content)
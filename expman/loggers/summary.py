@@ -0,0 +1,139 @@
+import glob
+import logging
+import os
+import re
+import ujson as json
+
+
+class SummaryPyramid:
+    """
+    Keeps count, sum, min, max and last value of every numeric key per bucket of `level` steps, for several levels at once,
+    and appends each bucket to `<prefix>.summary.<level>.jsonl` once a record from the next bucket arrives.
+
+    Each line holds `{"start": first step of the bucket, "end": last step seen, "stats": {key: [count, sum, min, max, last]}}`.
+    Incomplete buckets are written on `close`, readers merge lines with the same start.
+    """
+
+    def __init__(self, prefix, levels=(10, 100, 1000, 10000)):
+        self.prefix = prefix
+        self.levels = sorted(levels)
+        self.buckets = {level: None for level in self.levels}
+        self.files = {}
+
+    @staticmethod
+    def fname(prefix, level):
+        return '{}.summary.{}.jsonl'.format(prefix, level)
+
+    @classmethod
+    def available_levels(cls, prefix):
+        pattern = re.compile(re.escape(prefix) + r'\.summary\.(\d+)\.jsonl$')
+        levels = [pattern.match(f) for f in glob.glob(glob.escape(prefix) + '.summary.*.jsonl')]
+        return sorted(int(m.group(1)) for m in levels if m)
+
+    def add(self, content: dict):
+        step = content.get('step')
+        if step is None:
+            return
+        for level in self.levels:
+            bucket = self.buckets[level]
+            start = step // level * level
+            if bucket is not None and bucket['start'] != start:
+                self._write(level, bucket)
+                bucket = None
+            if bucket is None:
+                bucket = self.buckets[level] = dict(start=start, end=step, stats={})
+            bucket['end'] = step
+            stats = bucket['stats']
+            for k, v in content.items():
+                if k == 'step' or isinstance(v, bool) or not isinstance(v, (int, float)):
+                    continue
+                s = stats.get(k)
+                if s is None:
+                    stats[k] = [1, v, v, v, v]
+                else:
+                    s[0] += 1
+                    s[1] += v
+                    if v < s[2]:
+                        s[2] = v
+                    if v > s[3]:
+                        s[3] = v
+                    s[4] = v
+
+    def _write(self, level, bucket):
+        f = self.files.get(level)
+        if f is None:
+            f = self.files[level] = open(self.fname(self.prefix, level), 'at')
+        f.write(json.dumps(bucket) + '\n')
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        """
+        Writes the incomplete buckets and closes the files. Buckets continued later are merged on read.
+        """
+        for level, bucket in self.buckets.items():
+            if bucket is not None:
+                self._write(level, bucket)
+            self.buckets[level] = None
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+    @classmethod
+    def load(cls, prefix, level, columns=None, step_range=None, error='warn'):
+        """
+        Returns one row per bucket of `level` steps, with `step` set to the start of the bucket, the mean of each key under its own name,
+        and its min, max and last value under `<key>_min`, `<key>_max` and `<key>_last`.
+        """
+        fname = cls.fname(prefix, level)
+        if not os.path.isfile(fname):
+            if error == 'warn':
+                logging.critical('file doesnt exist {}'.format(fname))
+                return []
+            elif error == 'ignore':
+                return []
+            else:
+                raise Exception('file doesnt exist {}'.format(fname))
+        lo, hi = step_range or (None, None)
+        buckets = {}
+        with open(fname, 'rt') as f:
+            for line in f:
+                try:
+                    d = json.loads(line)
+                except Exception as e:
+                    if error == 'warn':
+                        logging.critical('In {}'.format(fname))
+                        logging.critical(repr(e))
+                        continue
+                    elif error == 'ignore':
+                        continue
+                    else:
+                        raise e
+                start = d['start']
+                if (lo is not None and start < lo) or (hi is not None and start >= hi):
+                    continue
+                merged = buckets.get(start)
+                if merged is None:
+                    buckets[start] = d
+                    continue
+                merged['end'] = max(merged['end'], d['end'])
+                for k, s in d['stats'].items():
+                    m = merged['stats'].get(k)
+                    if m is None:
+                        merged['stats'][k] = s
+                    else:
+                        merged['stats'][k] = [m[0] + s[0], m[1] + s[1], min(m[2], s[2]), max(m[3], s[3]), s[4]]
+        rows = []
+        for start in sorted(buckets):
+            row = dict(step=start)
+            for k, (count, total, vmin, vmax, last) in buckets[start]['stats'].items():
+                if columns is not None and k not in columns:
+                    continue
+                row[k] = total / count
+                row[k + '_min'] = vmin
+                row[k + '_max'] = vmax
+                row[k + '_last'] = last
+            rows.append(row)
+        return rows
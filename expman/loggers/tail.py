@@ -0,0 +1,83 @@
+import os
+import time
+
+
+class Tail:
+    """
+    Reads the complete lines appended to a file since the last read, remembering the byte offset in between.
+
+    A trailing line without a newline is held back until it is completed.
+    If the file is truncated or replaced (e.g. recreated with `delete_existing=True`), reading restarts from its beginning.
+    Waiting for new data uses inotify when `inotify_simple` is installed and polls otherwise.
+    """
+
+    def __init__(self, fname, offset=0):
+        self.fname = fname
+        self.offset = offset
+        self.file = None
+        self.ino = None
+        self.partial = b''
+        self.more = False
+        self.inotify = None
+        try:
+            import inotify_simple
+            self.inotify = inotify_simple.INotify()
+            flags = inotify_simple.flags
+            # watch the directory so that the file being created or replaced is noticed too
+            self.inotify.add_watch(os.path.dirname(os.path.abspath(fname)), flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.DELETE)
+        except (ImportError, OSError):
+            self.inotify = None
+
+    def _reopen(self, st):
+        if self.file is not None:
+            self.file.close()
+            # the file we were reading was replaced or truncated
+            self.offset = 0
+            self.partial = b''
+        self.file = open(self.fname, 'rb')
+        self.ino = st.st_ino
+        self.file.seek(self.offset)
+
+    def read_lines(self, max_bytes=None):
+        """
+        Returns the complete lines appended since the last call, without their newlines.
+
+        Args:
+            max_bytes: read about this many bytes at most (more if a single line is longer), leaving the rest for the next calls.
+                `more` tells whether data was left.
+        """
+        try:
+            st = os.stat(self.fname)
+        except FileNotFoundError:
+            self.more = False
+            return []
+        if self.file is None or st.st_ino != self.ino or st.st_size < self.offset:
+            self._reopen(st)
+        data = self.partial
+        while True:
+            chunk = self.file.read(-1 if max_bytes is None else max_bytes)
+            self.offset += len(chunk)
+            data += chunk
+            end = data.rfind(b'\n') + 1
+            if end or max_bytes is None or len(chunk) < max_bytes:
+                break
+        self.partial = data[end:]
+        self.more = max_bytes is not None and self.offset < st.st_size
+        return data[:end].splitlines()
+
+    def wait(self, timeout):
+        """
+        Blocks until the file might have changed or `timeout` seconds have passed.
+        """
+        if self.inotify is not None:
+            self.inotify.read(timeout=int(timeout * 1000))
+        elif timeout:
+            time.sleep(timeout)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
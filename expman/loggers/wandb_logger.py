@@ -1,17 +1,28 @@
 from .logger import Logger
 from .json_logger import JSONLogger
 from ..experiment import Experiment
+import concurrent.futures
 import os
 import wandb
 import logging
+import ujson as json
 
 
 class WandbLogger(Logger):
 
-    def __init__(self, project, name=None, **kwargs):
+    def __init__(self, project, name=None, batch_size=1, **kwargs):
+        """
+        Args:
+            project: W&B project.
+            name: W&B run id, defaults to the project.
+            batch_size: number of records to hold before passing them to `wandb.log`. Consecutive records with the same step are merged.
+            kwargs: passed on to `wandb.init`.
+        """
         super().__init__()
         self.project = project
         self.name = name or project
+        self.batch_size = batch_size
+        self.buffer = []
         self.kwargs = kwargs
         self.run = None
         self.wandb_config = None
@@ -25,23 +36,99 @@ class WandbLogger(Logger):
         return self
 
     def log(self, content: dict):
-        wandb.log(content)
+        # copied, as callers may reuse and mutate the dict before it is flushed
+        self.buffer.append(dict(content))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        rows = []
+        for content in self.buffer:
+            if rows and 'step' in content and rows[-1].get('step') == content['step']:
+                rows[-1].update(content)
+            else:
+                rows.append(dict(content))
+        self.buffer.clear()
+        for row in rows:
+            wandb.log(row)
 
     def finish(self):
+        self.flush()
         wandb.finish()
         self.run = None
         self.wandb_config = None
 
+    @staticmethod
+    def upload_mark_path(fexp):
+        return os.path.join(os.path.dirname(fexp), 'wandb_upload.json')
+
     @classmethod
-    def convert_exp(cls, fexp, project, ignore=tuple()):
+    def convert_exp(cls, fexp, project, ignore=tuple(), batch_size=1000, resume=True, sync_every=None):
+        """
+        Uploads the experiment at `fexp` and its `log.jsonl` to `project`, `batch_size` records at a time.
+
+        wandb uploads in the background, so the number of uploaded records is only written to `wandb_upload.json` next to `fexp`
+        once the run was finished, which waits for it to be synced. With `sync_every`, the run is also finished and resumed
+        after about every `sync_every` records, so that an interrupted upload loses less progress.
+        With `resume`, an upload to the same project that was interrupted continues after the last recorded records
+        instead of recreating the run. Records logged after them but before the interruption may be uploaded twice.
+        """
         exp = Experiment.from_fconfig(fexp)
         json_log = exp.load_logs(JSONLogger())
         config = exp.config.copy()
         for f in ignore:
             del config[f]
         config['seedless_name'] = os.path.basename(config['seedless_name'])
-        logger = cls(project=project, name=exp.name.replace(':', '_')).start(dlog=exp.logdir, config=config, delete_existing=True)
-        for r in json_log:
-            logger.log(r)
-        logger.finish()
+        name = exp.name.replace(':', '_')
+        fmark = cls.upload_mark_path(fexp)
+        uploaded = 0
+        if resume and os.path.isfile(fmark):
+            with open(fmark) as f:
+                mark = json.load(f)
+            if mark.get('project') == project and mark.get('name') == name:
+                uploaded = mark['rows']
+        if uploaded >= len(json_log) and uploaded:
+            logging.info('Already uploaded {} to project {}'.format(fexp, project))
+            return uploaded
+        logger = None
+        for i in range(uploaded, len(json_log), batch_size):
+            if logger is None:
+                logger = cls(project=project, name=name, batch_size=batch_size).start(dlog=exp.logdir, config=config, delete_existing=not uploaded)
+            for r in json_log[i:i + batch_size]:
+                logger.log(r)
+            logger.flush()
+            end = min(i + batch_size, len(json_log))
+            if end < len(json_log) and (not sync_every or end - uploaded < sync_every):
+                continue
+            logger.finish()
+            logger = None
+            uploaded = end
+            ftmp = '{}.{}.tmp'.format(fmark, os.getpid())
+            with open(ftmp, 'wt') as f:
+                json.dump(dict(project=project, name=name, rows=uploaded), f)
+            os.replace(ftmp, fmark)
         logging.info('Uploaded {} to project {}'.format(fexp, project))
+        return uploaded
+
+    @classmethod
+    def convert_exps(cls, fexps, project, ignore=tuple(), batch_size=1000, resume=True, sync_every=None, workers=4, callback=None):
+        """
+        Uploads several experiments with `convert_exp` in a pool of `workers` processes.
+        Failed uploads are logged and can be retried with `resume`.
+
+        Returns:
+            a dict mapping each experiment to its number of uploaded records, or the exception it failed with.
+        """
+        results = {}
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(cls.convert_exp, fexp, project, ignore=ignore, batch_size=batch_size, resume=resume, sync_every=sync_every): fexp for fexp in fexps}
+            for future in concurrent.futures.as_completed(futures):
+                fexp = futures[future]
+                try:
+                    results[fexp] = future.result()
+                except Exception as e:
+                    logging.critical('Failed to upload {}: {}'.format(fexp, repr(e)))
+                    results[fexp] = e
+                if callback is not None:
+                    callback(fexp)
+        return results
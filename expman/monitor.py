@@ -0,0 +1,235 @@
+"""
+Classifies the experiments of a log directory as running, stalled, finished or crashed, from the files they already write.
+"""
+import collections
+import datetime
+import glob
+import logging
+import os
+import shutil
+import subprocess
+import time
+import ujson as json
+from .scan import scan_experiments
+from .state import StateFile, read_state
+
+
+STATES = ('running', 'pending', 'stalled', 'finished', 'crashed')
+
+# slurm states, and those of `expman.local.LocalJob`, of jobs that will not run again
+DEAD_JOB_STATES = ('FAILED', 'CANCELLED', 'TIMEOUT', 'OUT_OF_MEMORY', 'NODE_FAIL', 'BOOT_FAIL', 'DEADLINE')
+PENDING_JOB_STATES = ('PENDING', 'REQUEUED', 'REQUEUE_HOLD', 'CONFIGURING')
+
+MONITOR_FILES = ('exp.json', StateFile.FNAME, 'job_status.json', 'job.manifest.json')
+
+
+def _parse_time(s):
+    """
+    Returns the POSIX timestamp of a time written by `Experiment`, which are in UTC without a time zone.
+    """
+    if not s:
+        return None
+    t = datetime.datetime.fromisoformat(s)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=datetime.timezone.utc)
+    return t.timestamp()
+
+
+def slurm_job_states(job_ids):
+    """
+    Returns the state of each slurm job in `job_ids` according to `sacct`, or an empty dict if slurm is not available.
+    """
+    if not job_ids or shutil.which('sacct') is None:
+        return {}
+    try:
+        out = subprocess.run(['sacct', '-n', '-P', '-X', '--format=JobID,State', '-j', ','.join(sorted(job_ids))],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=60, check=True).stdout
+    except Exception as e:
+        logging.critical('Failed to query slurm: {}'.format(repr(e)))
+        return {}
+    states = {}
+    for line in out.splitlines():
+        if '|' in line:
+            job_id, state = line.split('|')[:2]
+            # e.g. 'CANCELLED by 1234'; requeued jobs are listed once per run, the last one is current
+            states[job_id] = state.split(' ')[0]
+    return states
+
+
+def _read_json(fname):
+    with open(fname) as f:
+        return json.load(f)
+
+
+class _CachedFiles:
+    """
+    Files that are only reread, with `load(fname)`, when their modification time changes.
+    """
+
+    def __init__(self, load=_read_json):
+        self.load = load
+        self.entries = {}
+
+    def read(self, fname, st):
+        if st is None:
+            self.entries.pop(fname, None)
+            return None
+        entry = self.entries.get(fname)
+        if entry is None or entry[0] != st.st_mtime_ns:
+            try:
+                entry = (st.st_mtime_ns, self.load(fname))
+            except Exception:
+                # e.g. being rewritten by a writer that does not replace files atomically
+                return entry[1] if entry is not None else None
+            self.entries[fname] = entry
+        return entry[1]
+
+
+class Monitor:
+    """
+    Tracks the state and throughput of the experiments matching `glob_path`.
+
+    Each `poll` lists the experiment directories once and only rereads the `exp.json`, `state.bin`, `job_status.json` (written by
+    `expman.local.LocalPoolExecutor`) and `job.manifest.json` (which holds the slurm job id of a `SlurmJob`) that changed since the
+    previous poll, so polling thousands of runs every few seconds is cheap. Logs are never read.
+
+    A run is `finished` once `Experiment.finish` was called or its job completed, `crashed` if its job failed or was cancelled, or if
+    it has not written anything for `dead_after` seconds and no job is known to be running it, `pending` while its job waits in the
+    queue or if it was never started, and `stalled` if it has not written anything for `stall_after` seconds, or `stall_factor` times its usual interval between
+    writes if that is longer. Other runs are `running`.
+
+    Throughput, in steps per second, is measured between successive polls that saw a run progress, and otherwise since the run was
+    last started.
+
+    Args:
+        slurm: query `sacct` for the state of slurm jobs, at most every `slurm_interval` seconds.
+        window: number of past observations of each run used for its throughput.
+    """
+
+    def __init__(self, glob_path, stall_after=600, dead_after=3600, stall_factor=10, slurm=True, slurm_interval=60, window=10):
+        self.glob_path = glob_path
+        self.stall_after = stall_after
+        self.dead_after = dead_after
+        self.stall_factor = stall_factor
+        self.slurm = slurm
+        self.slurm_interval = slurm_interval
+        self.files = _CachedFiles()
+        self.states = _CachedFiles(lambda fname: read_state(fname)[0])
+        self.sweeps = _CachedFiles()
+        # expdir -> observations (time of the write, step)
+        self.history = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.slurm_states = {}
+        self.slurm_queried = set()
+        self.slurm_time = None
+
+    def _sweep_job_ids(self):
+        """
+        Maps each `exp.json` to its array task id from the records written by `expman.sweep.launch_sweep`.
+        """
+        job_ids = {}
+        for fsweep in sorted(glob.glob(os.path.join(os.path.dirname(self.glob_path), 'slurm', 'sweep_*.json'))):
+            try:
+                d = self.sweeps.read(fsweep, os.stat(fsweep))
+            except FileNotFoundError:
+                continue
+            for task in (d or {}).get('tasks', []):
+                job_ids[os.path.abspath(task['explog'])] = task['job_id']
+        return job_ids
+
+    def _update_slurm(self, job_ids, now):
+        if not self.slurm or not job_ids:
+            return
+        if self.slurm_time is not None and now - self.slurm_time < self.slurm_interval and job_ids <= self.slurm_queried:
+            return
+        self.slurm_states = slurm_job_states(job_ids)
+        self.slurm_queried = set(job_ids)
+        self.slurm_time = now
+
+    def poll(self, now=None):
+        """
+        Returns one dict per run with its `name`, `expdir`, `state`, `step`, `rate` (steps per second, `None` if unknown), `idle`
+        (seconds since it last wrote), `job_id` and `job_state`, sorted by directory.
+        """
+        now = time.time() if now is None else now
+        entries = scan_experiments(self.glob_path, names=MONITOR_FILES, stat=True)
+        sweep_ids = self._sweep_job_ids() if self.slurm else {}
+        runs = []
+        for e in entries:
+            expdir = os.path.abspath(e.path)
+            fexp = expdir + os.sep + 'exp.json'
+            d = self.files.read(fexp, e.files['exp.json'])
+            if d is None:
+                continue
+            if d.get('state_file') and d['state_file'] in e.files:
+                state = self.states.read(expdir + os.sep + d['state_file'], e.files[d['state_file']])
+                if state is not None:
+                    d = dict(d, **state)
+            status = job_manifest = None
+            if 'job_status.json' in e.files:
+                status = self.files.read(expdir + os.sep + 'job_status.json', e.files['job_status.json'])
+            if 'job.manifest.json' in e.files:
+                job_manifest = self.files.read(expdir + os.sep + 'job.manifest.json', e.files['job.manifest.json'])
+            run = dict(expdir=expdir, name=d['config'].get(d.get('name_field', 'name')), step=d.get('step'),
+                       job_id=None, job_state=None, d=d)
+            if status is not None:
+                run['job_id'], run['job_state'] = status.get('job_id'), status.get('state')
+            else:
+                checkpoints = (job_manifest or {}).get('checkpoints') or [{}]
+                run['job_id'] = checkpoints[-1].get('non_user_state_dict', {}).get('job_id') or sweep_ids.get(fexp)
+            runs.append(run)
+
+        self._update_slurm({r['job_id'] for r in runs if r['job_state'] is None and r['job_id']}, now)
+        for run in runs:
+            if run['job_state'] is None and run['job_id']:
+                run['job_state'] = self.slurm_states.get(run['job_id'])
+            self._classify(run, run.pop('d'), now)
+        for expdir in set(self.history) - {r['expdir'] for r in runs}:
+            del self.history[expdir]
+        return runs
+
+    def _classify(self, run, d, now):
+        last = _parse_time(d.get('last_written_time')) or _parse_time(d.get('start_time'))
+        finished = _parse_time(d.get('finished_time'))
+        run['idle'] = now - last if last is not None else None
+
+        history = self.history[run['expdir']]
+        if history and run['step'] is not None and run['step'] < history[-1][1]:
+            # resumed from an older checkpoint
+            history.clear()
+        if last is not None and run['step'] is not None and (not history or history[-1] != (last, run['step'])):
+            history.append((last, run['step']))
+        run['rate'] = None
+        interval = None
+        if len(history) > 1 and history[-1][0] > history[0][0]:
+            (t0, s0), (t1, s1) = history[0], history[-1]
+            run['rate'] = (s1 - s0) / (t1 - t0)
+            interval = (t1 - t0) / (len(history) - 1)
+        elif d.get('start_time') and d.get('start_step') is not None and last is not None and last > _parse_time(d['start_time']):
+            run['rate'] = (run['step'] - d['start_step']) / (last - _parse_time(d['start_time']))
+
+        job_state = run['job_state']
+        stall_after = max(self.stall_after, self.stall_factor * interval) if interval else self.stall_after
+        if job_state == 'COMPLETED' or (finished is not None and (last is None or finished >= last)):
+            run['state'] = 'finished'
+        elif job_state in DEAD_JOB_STATES:
+            run['state'] = 'crashed'
+        elif job_state in PENDING_JOB_STATES or run['idle'] is None:
+            run['state'] = 'pending'
+        elif run['idle'] > self.dead_after and job_state != 'RUNNING':
+            run['state'] = 'crashed'
+        elif run['idle'] > stall_after:
+            run['state'] = 'stalled'
+        else:
+            run['state'] = 'running'
+        return run
+
+    @staticmethod
+    def summary(runs):
+        """
+        Returns the number of runs in each state and the total throughput of the running ones, in steps per second.
+        """
+        counts = collections.Counter(r['state'] for r in runs)
+        d = {s: counts.get(s, 0) for s in STATES}
+        d['runs'] = len(runs)
+        d['rate'] = sum(r['rate'] for r in runs if r['state'] == 'running' and r['rate'])
+        return d
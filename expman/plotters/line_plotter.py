@@ -1,60 +1,99 @@
 from .plotter import Plotter
-from matplotlib import pyplot as plt
-import pandas as pd
+from ..aggregate import Aggregator, get_column
+from ..downsample import downsample, bucket_stats, rolling_mean
 import logging
 import numpy as np
-import seaborn as sns
 
 
-class LinePlotter(Plotter):
+def next_color(ax):
+    lines = ax._get_lines
+    if hasattr(lines, 'get_next_color'):
+        return lines.get_next_color()
+    return next(lines.prop_cycler)['color']
+
 
-    def plot_group(self, data, x, y, label, ax, xpid=None, read_every=1, smooth_window=10, align_x=1, alpha=0.4, linewidth=3):
-        color = next(ax._get_lines.prop_cycler)['color']
-        if xpid is not None:
-            all_data = []
-            unique_xpids = sorted(data[xpid].unique())
-            for xid in unique_xpids:
-                xp_data = data[data[xpid] == xid][::read_every]
-                xp_data[y+'_smooth'] = xp_data[y].rolling(smooth_window, min_periods=smooth_window//2).mean()
-                all_data.append(xp_data)
-                xs = xp_data[x].to_numpy()
-                ys = xp_data[y+'_smooth'].to_numpy()
-
-                order = np.argsort(xs)
-                xs = np.take_along_axis(xs, order, axis=0)
-                ys = np.take_along_axis(ys, order, axis=0)
+class LinePlotter(Plotter):
 
+    def plot_group(self, runs, x, y, label, ax, xpid=None, read_every=1, smooth_window=10, align_x=1, alpha=0.4, linewidth=3, method='lttb', max_points=None, band='ci'):
+        """
+        Args:
+            runs: list of `(xs, ys)` arrays, one per `xpid`. Without `xpid` there is a single run holding all the data.
+            method: how to downsample lines to `max_points`, one of 'lttb', 'minmax', 'mean', or `None` to draw every point.
+            max_points: number of points per line, defaults to the width of `ax` in pixels.
+            band: shade 'ci' (95% confidence interval of the mean), 'sd' (one standard deviation), or `None`.
+                Statistics are taken over runs at each aligned x, or over all points at each aligned x without `xpid`.
+        """
+        color = next_color(ax)
+        if max_points is None:
+            max_points = max(2, int(ax.get_window_extent().width))
+        # each run is averaged within a bin so that every run counts once
+        agg = Aggregator(x, [y], bin_width=align_x, over='runs' if xpid is not None else 'rows')
+        for i, (xs, ys) in enumerate(runs):
+            xs, ys = xs[::read_every], ys[::read_every]
+            ys = rolling_mean(ys, smooth_window, min_periods=smooth_window // 2)
+            order = np.argsort(xs, kind='stable')
+            xs, ys = xs[order], ys[order]
+            agg.add_arrays(label, i, xs, {y: ys})
+            if xpid is not None:
+                if method is not None:
+                    xs, ys = downsample(xs, ys, max_points, method=method)
                 ax.plot(xs, ys, linestyle='dashed', color=color, label='_nolegend_', alpha=alpha)
-            data = pd.concat(all_data)
+        if label is None:
+            return
+        stats = agg.result().get(label, {}).get(y)
+        if stats is None or not len(stats['x']):
+            return
+        xs, count, mean, std = stats['x'], stats['count'], stats['mean'], stats['std']
+        if band == 'ci':
+            spread = 1.96 * std / np.sqrt(np.maximum(count - 1, 1))
+        elif band == 'sd':
+            spread = std
         else:
-            data = data[::read_every]
-            data[y+'_smooth'] = data[y].rolling(smooth_window, min_periods=smooth_window//2).mean()
-        if label is not None:
-            data[x] = data[x] // align_x * align_x
-            sns.lineplot(data=data, x=x, y=y+'_smooth', label=label, ax=ax, color=color, linewidth=linewidth)
+            spread = None
+        if len(xs) > max_points:
+            stats = bucket_stats(xs, mean, max_points)
+            if spread is not None:
+                spread = bucket_stats(xs, spread, max_points)['mean']
+            xs, mean = stats['x'], stats['mean']
+        ax.plot(xs, mean, label=label, color=color, linewidth=linewidth)
+        if spread is not None:
+            ax.fill_between(xs, mean - spread, mean + spread, color=color, alpha=0.2, linewidth=0)
+        ax.legend()
 
-    def plot(self, exps_and_logs, x, y, group=None, xpid=None, read_every=1, smooth_window=10, align_x=1, ax=None, linewidth=3, alpha=0.4, force_label=None):
+    def plot(self, exps_and_logs, x, y, group=None, xpid=None, read_every=1, smooth_window=10, align_x=1, ax=None, linewidth=3, alpha=0.4, force_label=None,
+             method='lttb', max_points=None, band='ci'):
+        """
+        Plots `y` against `x` for each run in `exps_and_logs`, with one aggregated line per value of the config field `group`.
+        Runs are identified by the config field `xpid`.
+        Logs may be lists of dicts or dicts of arrays (`load_logs(..., as_arrays=True)`).
+        See `plot_group` for `method`, `max_points` and `band`.
+        """
         if ax is None:
+            from matplotlib import pyplot as plt
             fig, ax = plt.subplots(figsize=(10, 10))
 
-        data = []
+        # group -> xpid -> list of (xs, ys) chunks, config values are looked up once per run instead of once per row
+        groups = {}
         for exp, logs in exps_and_logs:
-            for r in logs:
-                r = r.copy()
-                r.update(exp.config)
-                data.append(r)
-        if not data:
+            xs, ys = get_column(exp, logs, x), get_column(exp, logs, y)
+            keep = ~(np.isnan(xs) | np.isnan(ys))
+            if not keep.any():
+                continue
+            g = exp.config.get(group) if group is not None else None
+            xid = exp.config.get(xpid) if xpid is not None else None
+            groups.setdefault(g, {}).setdefault(xid, []).append((xs[keep], ys[keep]))
+        if not groups:
             logging.critical('Nothing to plot!')
             return ax
 
-        data = pd.DataFrame(data)
-
-        if group is None:
-            self.plot_group(data=data, x=x, y=y, label=force_label, ax=ax, xpid=xpid, read_every=read_every, smooth_window=smooth_window, align_x=align_x, alpha=alpha, linewidth=linewidth)
-        else:
-            unique_groups = sorted(data[group].unique())
-            for g in unique_groups:
-                group_data = data[data[group] == g]
+        for g in sorted(groups, key=lambda g: (g is None, g)):
+            runs = groups[g]
+            runs = [(np.concatenate([xs for xs, _ in runs[xid]]), np.concatenate([ys for _, ys in runs[xid]])) for xid in sorted(runs, key=lambda xid: (xid is None, xid))]
+            if group is None:
+                self.plot_group(runs=runs, x=x, y=y, label=force_label, ax=ax, xpid=xpid, read_every=read_every, smooth_window=smooth_window, align_x=align_x, alpha=alpha, linewidth=linewidth,
+                                method=method, max_points=max_points, band=band)
+            else:
                 label = force_label or g
-                self.plot_group(data=group_data, x=x, y=y, label=label, ax=ax, xpid=xpid, read_every=read_every, smooth_window=smooth_window, align_x=align_x)
+                self.plot_group(runs=runs, x=x, y=y, label=label, ax=ax, xpid=xpid, read_every=read_every, smooth_window=smooth_window, align_x=align_x,
+                                method=method, max_points=max_points, band=band)
         return ax
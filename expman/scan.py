@@ -0,0 +1,124 @@
+import collections
+import glob
+import logging
+import os
+import ujson as json
+
+
+EXP_FILES = ('exp.json', 'log.jsonl', 'job.tar', 'job.manifest.json')
+
+ScanEntry = collections.namedtuple('ScanEntry', ['path', 'files'])
+ScanEntry.__doc__ = """
+An experiment directory found by `scan_experiments`.
+`files` maps each of the requested file names present in `path` to its `os.stat_result`, or to `None` when scanning without `stat`.
+"""
+
+
+class Manifest:
+    """
+    Remembers, per log directory, which experiment directories a glob matched and which files they contained.
+
+    Entries are keyed by the modification time of the directory they describe, which changes whenever an entry is
+    added to or removed from it. A directory whose mtime is unchanged is therefore only stat'ed instead of listed.
+    """
+
+    # kept next to the log cache rather than in `logdir` itself, since writing it would change the mtime of `logdir`
+    FNAME = os.path.join('.expman_cache', 'manifest.json')
+
+    def __init__(self, logdir):
+        self.fname = os.path.join(logdir, self.FNAME)
+        self.globs = {}
+        self.dirs = {}
+        self.dirty = False
+        if os.path.isfile(self.fname):
+            try:
+                with open(self.fname) as f:
+                    d = json.load(f)
+                self.globs, self.dirs = d['globs'], d['dirs']
+            except Exception as e:
+                logging.critical('Ignoring corrupt manifest {}: {}'.format(self.fname, repr(e)))
+
+    def get(self, table, key, mtime_ns):
+        entry = getattr(self, table).get(key)
+        if entry is not None and entry['mtime_ns'] == mtime_ns:
+            return entry['value']
+        return None
+
+    def put(self, table, key, mtime_ns, value):
+        getattr(self, table)[key] = dict(mtime_ns=mtime_ns, value=value)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.fname), exist_ok=True)
+        ftmp = '{}.{}.tmp'.format(self.fname, os.getpid())
+        with open(ftmp, 'wt') as f:
+            json.dump(dict(globs=self.globs, dirs=self.dirs), f)
+        os.replace(ftmp, self.fname)
+        self.dirty = False
+
+
+def _list_files(path, names, stat):
+    files = {}
+    with os.scandir(path) as it:
+        for e in it:
+            if e.name in names and e.is_file():
+                # the stat of a `DirEntry` is cached, and `is_file` usually needs no system call at all
+                files[e.name] = e.stat() if stat else None
+    return files
+
+
+def scan_experiments(glob_path, names=EXP_FILES, require='exp.json', stat=False, manifest=False):
+    """
+    Finds experiment directories matching `glob_path` with a single listing of each directory.
+
+    Args:
+        names: files to look for in each directory.
+        require: only return directories that contain this file.
+        stat: also return the `os.stat_result` of every file found, reusing what the listing already fetched where the OS allows.
+        manifest: use a `Manifest` in the directory containing the glob, so that unchanged directories are not listed again.
+            Pass `True` or a `Manifest`. Ignored when `stat` is set, since file sizes change without the directory changing.
+
+    Returns:
+        a list of `ScanEntry`, sorted by path.
+    """
+    root = os.path.dirname(glob_path)
+    if manifest is True:
+        manifest = Manifest(root) if not glob.has_magic(root) and os.path.isdir(root) else None
+    if stat:
+        manifest = None
+    names = set(names)
+    # directory entries only describe the files asked for
+    names_key = ','.join(sorted(names))
+    dirs = None
+    if manifest:
+        root_mtime = os.stat(root).st_mtime_ns
+        dirs = manifest.get('globs', glob_path, root_mtime)
+    if dirs is None:
+        dirs = sorted(glob.glob(glob_path))
+        if manifest:
+            manifest.put('globs', glob_path, root_mtime, dirs)
+    entries = []
+    for d in dirs:
+        files = None
+        if manifest:
+            try:
+                mtime = os.stat(d).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            found = manifest.get('dirs', d + '|' + names_key, mtime)
+            if found is not None:
+                files = {name: None for name in found}
+        if files is None:
+            try:
+                files = _list_files(d, names, stat)
+            except (NotADirectoryError, FileNotFoundError):
+                continue
+            if manifest:
+                manifest.put('dirs', d + '|' + names_key, mtime, sorted(files))
+        if require is None or require in files:
+            entries.append(ScanEntry(d, files))
+    if manifest:
+        manifest.save()
+    return entries
@@ -0,0 +1,125 @@
+"""
+The progress of an experiment (step and timestamps) kept in a small fixed-size file next to its `exp.json`, so that logging does
+not rewrite the config.
+"""
+import datetime
+import os
+import struct
+import zlib
+import ujson as json
+
+
+# magic, sequence number, step, last written time, start time, start step, finished time, then a crc32 of all of these.
+# Times are microseconds since the epoch in UTC, and `NONE` stands for `None`.
+RECORD = struct.Struct('<4sQqqqqq')
+CRC = struct.Struct('<I')
+MAGIC = b'EXPS'
+NONE = -2 ** 63
+# two slots, written alternately, so that a torn write never destroys the previous record
+SLOT_SIZE = 64
+FIELDS = ('step', 'last_written_time', 'start_time', 'start_step', 'finished_time')
+TIME_FIELDS = ('last_written_time', 'start_time', 'finished_time')
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _to_us(s):
+    if s is None:
+        return NONE
+    return (datetime.datetime.fromisoformat(s) - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _from_us(us):
+    if us == NONE:
+        return None
+    return (_EPOCH + datetime.timedelta(microseconds=us)).isoformat()
+
+
+def _pack(seq, state):
+    values = [_to_us(state.get(k)) if k in TIME_FIELDS else (NONE if state.get(k) is None else state[k]) for k in FIELDS]
+    record = RECORD.pack(MAGIC, seq, *values)
+    return (record + CRC.pack(zlib.crc32(record))).ljust(SLOT_SIZE, b'\0')
+
+
+def _unpack(slot):
+    if len(slot) < RECORD.size + CRC.size:
+        return None
+    record = slot[:RECORD.size]
+    if record[:4] != MAGIC or CRC.unpack_from(slot, RECORD.size)[0] != zlib.crc32(record):
+        return None
+    magic, seq, *values = RECORD.unpack(record)
+    state = {k: _from_us(v) if k in TIME_FIELDS else (None if v == NONE else v) for k, v in zip(FIELDS, values)}
+    return seq, state
+
+
+def read_state(fname):
+    """
+    Returns the latest valid progress record in `fname` as a dict of `FIELDS` and its sequence number, or `(None, 0)`.
+    """
+    try:
+        with open(fname, 'rb') as f:
+            data = f.read(2 * SLOT_SIZE)
+    except FileNotFoundError:
+        return None, 0
+    records = [r for r in (_unpack(data[:SLOT_SIZE]), _unpack(data[SLOT_SIZE:])) if r is not None]
+    if not records:
+        return None, 0
+    seq, state = max(records, key=lambda r: r[0])
+    return state, seq
+
+
+class StateFile:
+    """
+    Writes the progress of an experiment to `state.bin` in place.
+
+    Each write is a single `pwrite` of one 64 byte slot on a file kept open, alternating between two slots with an increasing
+    sequence number and a checksum. Readers take the valid slot with the highest sequence number, so they see either the
+    previous or the new record, never a mix of both, even if the writer dies halfway.
+    """
+
+    FNAME = 'state.bin'
+    FIELDS = FIELDS
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.fd = None
+        self.seq = None
+
+    def write(self, state):
+        if self.fd is None:
+            self.fd = os.open(self.fname, os.O_RDWR | os.O_CREAT, 0o644)
+            self.seq = read_state(self.fname)[1]
+        self.seq += 1
+        os.pwrite(self.fd, _pack(self.seq, state), (self.seq % 2) * SLOT_SIZE)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __getstate__(self):
+        # e.g. pickled by submitit along with its `Experiment`; the file is reopened on the next write
+        return dict(fname=self.fname, fd=None, seq=None)
+
+    def __del__(self):
+        self.close()
+
+
+def read_exp(fexp, cache=None):
+    """
+    Returns the contents of `fexp` with the progress in the `state.bin` next to it, as passed to `Experiment`.
+
+    The progress is only taken from `state.bin` if `fexp` refers to it, so that an `exp.json` rewritten by an older version of
+    expman is not shadowed by a stale `state.bin`. `cache` is an optional `expman.cache.LogCache` for `fexp`.
+    """
+    if cache is not None:
+        d = dict(cache.read_json(fexp))
+    else:
+        with open(fexp) as f:
+            d = json.load(f)
+    fstate = d.pop('state_file', None)
+    if fstate:
+        state, _ = read_state(os.path.join(os.path.dirname(fexp), fstate))
+        if state is not None:
+            d.update(state)
+    return d
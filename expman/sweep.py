@@ -0,0 +1,118 @@
+import datetime
+import itertools
+import logging
+import os
+import uuid
+import ujson as json
+from .experiment import Experiment
+
+
+def expand_grid(base, grid, name_field='name'):
+    """
+    Returns one config per combination of the values in `grid`, each a copy of `base` updated with that combination.
+    The name of each config is the name in `base` followed by `-<key><value>` for every key of `grid`, e.g. `sweep-lr0.1-seed2`.
+
+    Args:
+        base: config shared by all runs, with at least a name and a logdir.
+        grid: maps config keys to the list of values to sweep over.
+    """
+    keys = list(grid)
+    configs = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        config = dict(base)
+        config.update(zip(keys, values))
+        config[name_field] = '-'.join([str(base[name_field])] + ['{}{}'.format(k, v) for k, v in zip(keys, values)])
+        configs.append(config)
+    return configs
+
+
+def create_experiments(configs, name_field='name', logdir_field='logdir', overwrite=False):
+    """
+    Creates the directory and `exp.json` of every config and returns their `Experiment`s.
+    Existing experiments are loaded instead, so that relaunching a sweep resumes it, unless `overwrite` is set.
+    """
+    exps = []
+    names = set()
+    for config in configs:
+        exp = Experiment(dict(config), name_field=name_field, logdir_field=logdir_field)
+        assert str(exp.expdir) not in names, 'Duplicate experiment {}'.format(exp.expdir)
+        names.add(str(exp.expdir))
+        if not overwrite and os.path.isfile(exp.explog):
+            exp = Experiment.from_fconfig(exp.explog)
+        else:
+            exp.save()
+        exps.append(exp)
+    return exps
+
+
+def slurm_array_id(job_ids):
+    """
+    Returns the id of the slurm job array that `job_ids`, e.g. `['123_0', '123_1']`, belong to, or `None` if they are not the
+    tasks of one slurm array, e.g. when they were submitted to a local executor.
+    """
+    prefixes = {str(j).split('_')[0] for j in job_ids}
+    if len(prefixes) != 1 or not all('_' in str(j) for j in job_ids):
+        return None
+    prefix = prefixes.pop()
+    return prefix if prefix.isdigit() else None
+
+
+def new_sweep_id():
+    return '{}-{}'.format(datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:8])
+
+
+def launch_sweep(job_cls, configs, executor=None, folder=None, slurm_kwargs=None, array_parallelism=None, overwrite=False):
+    """
+    Launches a `SlurmJob` of class `job_cls` for every config as a single job array.
+
+    Every experiment is created first, then all jobs are submitted inside `executor.batch()`, which submitit turns into one
+    `sbatch --array` call instead of one submission per job. The id of every array task and the experiment it runs are written to
+    `<folder>/sweep_<sweep id>.json`, where the sweep id is the slurm array id, or a new unique id with other executors, whose job
+    ids may repeat across sweeps. Each task runs `job_cls.__call__(explog)`, so preemption still goes through `SlurmJob.checkpoint`.
+
+    Args:
+        executor: a `submitit` executor or an `expman.local.LocalPoolExecutor`, defaults to a `submitit.SlurmExecutor` in `folder`.
+        folder: where slurm logs and the sweep record go, defaults to `<logdir>/slurm` of the first config.
+        slurm_kwargs: passed to `executor.update_parameters`.
+        array_parallelism: maximum number of tasks of the array running at once.
+        overwrite: recreate the `exp.json` of experiments that already exist instead of resuming them.
+
+    Returns:
+        the submitted jobs, in the order of `configs`.
+    """
+    exps = create_experiments(configs, overwrite=overwrite)
+    if not exps:
+        return []
+    folder = folder or os.path.join(str(exps[0].logdir), 'slurm')
+    if executor is None:
+        import submitit
+        executor = submitit.SlurmExecutor(folder=folder, max_num_timeout=3)
+    kwargs = dict(slurm_kwargs or {})
+    if array_parallelism is not None:
+        kwargs['array_parallelism'] = array_parallelism
+    if kwargs:
+        executor.update_parameters(**kwargs)
+
+    jobs = []
+    for exp in exps:
+        job = job_cls()
+        job.exp = exp
+        jobs.append(job)
+    with executor.batch():
+        submitted = [executor.submit(job, str(exp.explog)) for job, exp in zip(jobs, exps)]
+    for job, s in zip(jobs, submitted):
+        job.job_id = s.job_id
+
+    array_id = slurm_array_id([s.job_id for s in submitted])
+    sweep_id = array_id or new_sweep_id()
+    os.makedirs(folder, exist_ok=True)
+    fsweep = os.path.join(folder, 'sweep_{}.json'.format(sweep_id))
+    with open(fsweep, 'wt') as f:
+        json.dump(dict(
+            sweep_id=sweep_id,
+            array_id=array_id,
+            time=datetime.datetime.utcnow().isoformat(),
+            tasks=[dict(job_id=s.job_id, explog=str(exp.explog)) for s, exp in zip(submitted, exps)],
+        ), f, indent=2)
+    logging.critical('Launched {} jobs as sweep {}, see {}'.format(len(submitted), sweep_id, fsweep))
+    return submitted
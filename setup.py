@@ -100,6 +100,8 @@ setup(
         'console_scripts': [
             'eplot=expman.bin.term_plot:main',
             'econv=expman.bin.convert_logs:main',
+            'ereport=expman.bin.report:main',
+            'emonitor=expman.bin.monitor:main',
         ],
     },
 )
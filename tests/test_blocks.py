@@ -0,0 +1,68 @@
+import os
+import sys
+from expman import JSONLogger
+from expman.bin import convert_logs
+from expman.loggers import blocks
+
+
+def write_log(logdir, n, block_size=10):
+    logger = JSONLogger(compression='gzip', buffer_size=block_size).start(str(logdir))
+    for i in range(n):
+        logger.log(dict(step=i, loss=1. / (i + 1)))
+    logger.finish()
+    return logger.fout
+
+
+def test_round_trip_and_select(tmp_path):
+    fout = write_log(tmp_path, 95)
+    found = blocks.read_index(fout)
+    assert [b.records for b in found] == [10] * 9 + [5]
+    assert (found[3].first_step, found[3].last_step) == (30, 39)
+    assert [b.first_step for b in blocks.select(found, (25, 45))] == [20, 30, 40]
+    assert [d['step'] for d in JSONLogger().start(str(tmp_path)).load_logs()] == list(range(95))
+    assert [d['step'] for d in JSONLogger().start(str(tmp_path)).load_logs(step_range=(25, 45))] == list(range(25, 45))
+
+
+def test_missing_and_stale_index(tmp_path):
+    fout = write_log(tmp_path, 50)
+    expected = blocks.read_index(fout)
+    os.remove(fout + blocks.INDEX_EXT)
+    assert blocks.read_index(fout) == expected
+    # an index left from a longer log that was replaced
+    with open(fout + blocks.INDEX_EXT, 'at') as f:
+        f.write('{"offset": 99999, "size": 10, "records": 1, "first_step": 99, "last_step": 99}\n')
+    assert blocks.read_index(fout) == expected
+
+
+def test_truncated_block_is_repaired(tmp_path):
+    fout = write_log(tmp_path, 30)
+    size = os.path.getsize(fout)
+    last = blocks.read_index(fout)[-1]
+    # killed while writing a block and before indexing it
+    with open(fout, 'ab') as f:
+        f.write(blocks.compress('gzip', b'{"step": 30}\n')[:-4])
+    assert blocks.read_index(fout)[-1] == last
+    logger = JSONLogger(compression='gzip', buffer_size=10).start(str(tmp_path))
+    for i in range(30, 40):
+        logger.log(dict(step=i, loss=0.))
+    logger.finish()
+    # the partial block was dropped before appending
+    assert blocks.read_index(fout)[-1].offset == size
+    assert [d['step'] for d in JSONLogger().start(str(tmp_path)).load_logs()] == list(range(40))
+    assert len(blocks.read_index(fout)) == 4
+
+
+def test_econv_keeps_source_unless_asked(tmp_path, monkeypatch):
+    fjson = os.path.join(str(tmp_path), 'log.jsonl')
+    logger = JSONLogger().start(str(tmp_path))
+    for i in range(25):
+        logger.log(dict(step=i))
+    logger.finish()
+    monkeypatch.setattr(sys, 'argv', ['econv', '-o', 'compressed', '--block_size', '10', fjson])
+    convert_logs.main()
+    assert os.path.isfile(fjson) and os.path.isfile(fjson + '.gz')
+    assert [b.records for b in blocks.read_index(fjson + '.gz')] == [10, 10, 5]
+    monkeypatch.setattr(sys, 'argv', ['econv', '-o', 'compressed', '--delete_source', fjson])
+    convert_logs.main()
+    assert not os.path.isfile(fjson)
+    assert [d['step'] for d in JSONLogger().start(str(tmp_path)).load_logs()] == list(range(25))
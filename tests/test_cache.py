@@ -0,0 +1,92 @@
+import os
+import pytest
+import ujson as json
+from expman import Experiment, JSONLogger
+from expman.cache import LogCache
+
+
+def write(fname, steps, mode='a'):
+    with open(fname, mode) as f:
+        f.writelines(json.dumps(dict(step=i)) + '\n' for i in steps)
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    counter = dict(evict=0)
+    evict = LogCache.evict
+
+    def counted(self):
+        counter['evict'] += 1
+        return evict(self)
+    monkeypatch.setattr(LogCache, 'evict', counted)
+    monkeypatch.setattr(LogCache, '_shared', {})
+    return counter
+
+
+def steps(rows):
+    return [d['step'] for d in rows]
+
+
+def test_grown_replaced_and_truncated(tmp_path):
+    fname = str(tmp_path / 'log.jsonl')
+    cache = LogCache(str(tmp_path / 'cache'))
+    write(fname, range(3))
+    assert steps(cache.read_jsonl(fname)) == [0, 1, 2]
+    write(fname, range(3, 5))
+    assert steps(cache.read_jsonl(fname)) == list(range(5))
+    # a partial line is left for the next read
+    with open(fname, 'a') as f:
+        f.write('{"step":')
+    assert steps(cache.read_jsonl(fname)) == list(range(5))
+    with open(fname, 'a') as f:
+        f.write('5}\n')
+    assert steps(LogCache(str(tmp_path / 'cache')).read_jsonl(fname)) == list(range(6))
+    # recreated with different contents
+    write(fname, [10, 11], mode='w')
+    assert steps(cache.read_jsonl(fname)) == [10, 11]
+    write(fname, [12], mode='w')
+    assert steps(cache.read_jsonl(fname)) == [12]
+
+
+def test_appends_instead_of_rewriting(tmp_path):
+    fname = str(tmp_path / 'log.jsonl')
+    cache = LogCache(str(tmp_path / 'cache'))
+    write(fname, range(1000))
+    cache.read_jsonl(fname)
+    size = os.path.getsize(cache._path(fname))
+    write(fname, [1000])
+    cache.read_jsonl(fname)
+    assert os.path.getsize(cache._path(fname)) - size < size / 10
+    assert cache.get(fname)['appends'] == 1
+    for i in range(LogCache.MAX_APPENDS):
+        write(fname, [1001 + i])
+        cache.read_jsonl(fname)
+    # rewritten as one entry once it has too many appends
+    assert cache.get(fname)['appends'] < LogCache.MAX_APPENDS
+    assert steps(LogCache(str(tmp_path / 'cache')).read_jsonl(fname)) == list(range(1001 + LogCache.MAX_APPENDS))
+
+
+def test_eviction(tmp_path, scans):
+    cache = LogCache(str(tmp_path / 'cache'), max_entries=100)
+    for i in range(200):
+        fname = str(tmp_path / '{}.jsonl'.format(i))
+        write(fname, [i])
+        cache.read_jsonl(fname)
+    assert 90 <= len(os.listdir(str(tmp_path / 'cache'))) <= 100
+    # the first write lists the cache, then one write in ten past the limit
+    assert scans['evict'] == 11
+    # least recently used first
+    assert cache.get(str(tmp_path / '199.jsonl')) is not None
+    assert cache.get(str(tmp_path / '0.jsonl')) is None
+
+
+def test_discover_logs_lists_cache_once(tmp_path, scans):
+    logdir = str(tmp_path)
+    for i in range(50):
+        exp = Experiment(dict(name='run{}'.format(i), logdir=logdir), loggers=[JSONLogger()]).start()
+        exp.log(dict(loss=i))
+        exp.finish()
+    for _ in range(3):
+        exps = Experiment.discover_logs(os.path.join(logdir, 'run*'), JSONLogger(), cache=True)
+        assert sorted(len(logs) for _, logs in exps) == [1] * 50
+    assert scans['evict'] == 1
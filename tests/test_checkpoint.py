@@ -0,0 +1,53 @@
+import collections
+import pickle
+import pytest
+from expman.checkpoint import CheckpointEngine
+
+
+def test_snapshot_keeps_mapping_types(tmp_path):
+    engine = CheckpointEngine(str(tmp_path / 'ckpt.pt'))
+    state = collections.OrderedDict([('a', [1, 2]), ('b', {'c': 3})])
+    state._metadata = {'': {'version': 1}}
+    snapshot = engine.snapshot(state)
+    assert type(snapshot) is collections.OrderedDict and snapshot == state
+    assert snapshot._metadata == state._metadata and snapshot._metadata is not state._metadata
+    assert snapshot['a'] is not state['a']
+
+    counts = collections.defaultdict(list, x=[1])
+    snapshot = engine.snapshot(counts)
+    assert snapshot.default_factory is list and snapshot == counts
+    snapshot['y'].append(2)
+    assert 'y' not in counts
+
+
+def test_save_and_load_keep_metadata(tmp_path):
+
+    def save_fn(obj, fname):
+        with open(fname, 'wb') as f:
+            pickle.dump(obj, f)
+
+    def load_fn(fname):
+        with open(fname, 'rb') as f:
+            return pickle.load(f)
+
+    engine = CheckpointEngine(str(tmp_path / 'ckpt.pkl'), save_fn=save_fn, load_fn=load_fn)
+    state = collections.OrderedDict(weight=[1., 2.])
+    state._metadata = {'': {'version': 2}}
+    engine.save(dict(model=state, step=5), step=5)
+    loaded, fname = engine.load_latest()
+    assert loaded['model'] == state and loaded['model']._metadata == {'': {'version': 2}}
+    assert loaded['step'] == 5
+
+
+def test_state_dict_round_trip(tmp_path):
+    torch = pytest.importorskip('torch')
+    model = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.BatchNorm1d(4))
+    engine = CheckpointEngine(str(tmp_path / 'ckpt.pt'), background=False)
+    state = model.state_dict()
+    engine.save(dict(model=state), step=1)
+    loaded = engine.load_latest()[0]['model']
+    assert loaded._metadata == state._metadata
+    restored = torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.BatchNorm1d(4))
+    restored.load_state_dict(loaded)
+    for k, v in model.state_dict().items():
+        assert torch.equal(restored.state_dict()[k], v)
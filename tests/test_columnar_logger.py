@@ -0,0 +1,44 @@
+import numpy as np
+from expman import JSONLogger
+from expman.loggers.columnar_logger import ColumnarLogger
+
+
+def test_reused_dict(tmp_path):
+    logger = ColumnarLogger(chunk_size=3).start(str(tmp_path))
+    m = {}
+    for i in range(5):
+        m['step'] = i
+        m['loss'] = i / 2
+        logger.log(m)
+    logger.finish()
+
+    loaded = ColumnarLogger().start(str(tmp_path))
+    assert loaded.load_logs() == [dict(step=i, loss=i / 2) for i in range(5)]
+    assert all(type(d['step']) is int for d in loaded.load_logs())
+    columns = loaded.load_columns()
+    assert columns['step'].dtype == np.int64
+    assert columns['loss'].dtype == np.float64
+
+
+def test_missing_values_and_step_range(tmp_path):
+    logger = ColumnarLogger(chunk_size=2).start(str(tmp_path))
+    for i in range(6):
+        logger.log(dict(step=i, loss=float(i)) if i % 2 else dict(step=i, acc=i, name='r{}'.format(i)))
+    logger.log(dict(loss=9.))
+    logger.finish()
+    loaded = ColumnarLogger().start(str(tmp_path))
+    logs = loaded.load_logs()
+    assert logs[1] == dict(step=1, loss=1.)
+    assert logs[2] == dict(step=2, acc=2, name='r2')
+    assert logs[6] == dict(loss=9.)
+    assert [d['step'] for d in loaded.load_logs(step_range=(2, 5))] == [2, 3, 4]
+    assert [d.get('step') for d in loaded.load_logs(every=2)] == [0, 2, 4, None]
+
+
+def test_convert_json_log(tmp_path):
+    json_logger = JSONLogger().start(str(tmp_path))
+    for i in range(10):
+        json_logger.log(dict(step=i, loss=1 / (i + 1)))
+    json_logger.finish()
+    logger = ColumnarLogger.convert_json_log(json_logger.fname)
+    assert logger.load_logs() == JSONLogger().start(str(tmp_path)).load_logs()
@@ -0,0 +1,51 @@
+import os
+from expman import Experiment, JSONLogger
+from expman.index import ConfigIndex
+
+
+def make_exp(logdir, name, lr, records, index=False):
+    exp = Experiment(dict(name=name, lr=lr, logdir=str(logdir)), loggers=[JSONLogger()], index=index).start()
+    for d in records:
+        exp.log(d)
+    exp.finish()
+    return exp
+
+
+def test_refresh_and_filter(tmp_path):
+    # eval metrics are logged at other steps than training ones, so the last record lacks them
+    make_exp(tmp_path, 'a', 1e-3, [dict(loss=2.), dict(acc=0.95), dict(loss=1.)])
+    make_exp(tmp_path, 'b', 1e-2, [dict(loss=3.), dict(acc=0.5), dict(loss=2.)])
+    with ConfigIndex(str(tmp_path)) as index:
+        assert len(index) == 2
+        assert index.get(str(tmp_path / 'a'))['final'] == dict(step=2, loss=1., acc=0.95)
+        assert [os.path.basename(d) for d in index.query('final.acc > 0.9')] == ['a']
+        assert [os.path.basename(d) for d in index.query('lr == 1e-2 and final.loss < 2.5')] == ['b']
+
+        make_exp(tmp_path, 'c', 1e-3, [dict(acc=0.99), dict(loss=0.5)])
+        make_exp(tmp_path, 'b', 1e-2, [dict(acc=0.97)])
+        os.remove(str(tmp_path / 'a' / 'exp.json'))
+        assert [os.path.basename(d) for d in index.refresh().query('final.acc > 0.9')] == ['b', 'c']
+        assert len(index) == 2
+
+
+def test_put_matches_rebuild(tmp_path):
+    make_exp(tmp_path, 'a', 1e-3, [dict(loss=2.), dict(acc=0.9), dict(loss=1.)], index=True)
+    with ConfigIndex(str(tmp_path)) as index:
+        logged = index.get(str(tmp_path / 'a'))
+        assert logged['final'] == index.rebuild().get(str(tmp_path / 'a'))['final'] == dict(step=2, loss=1., acc=0.9)
+
+    # resuming and saving keeps the metrics logged before
+    make_exp(tmp_path, 'a', 1e-3, [], index=True)
+    with ConfigIndex(str(tmp_path)) as index:
+        assert index.get(str(tmp_path / 'a'))['final'] == dict(step=2, loss=1., acc=0.9)
+
+
+def test_iter_logs_filter_with_glob_in_parent(tmp_path):
+    for sweep in ('s1', 's2'):
+        make_exp(tmp_path / sweep, 'a', 1e-3, [dict(loss=1.)])
+        make_exp(tmp_path / sweep, 'b', 1e-2, [dict(loss=1.)])
+    found = Experiment.iter_logs(str(tmp_path / 's*' / '*'), JSONLogger(), filter='lr == 1e-3')
+    assert sorted(str(exp.expdir) for exp, _ in found) == [str(tmp_path / s / 'a') for s in ('s1', 's2')]
+    assert sorted(os.listdir(str(tmp_path))) == ['s1', 's2']
+    assert list(Experiment.iter_logs(str(tmp_path / 'missing' / '*'), JSONLogger(), filter='lr == 1e-3')) == []
+    assert not os.path.exists(str(tmp_path / 'missing'))
@@ -0,0 +1,52 @@
+import os
+import ujson as json
+from expman import JSONLogger
+from expman.loggers.json_logger import top_level_step
+
+
+def test_top_level_step():
+    assert top_level_step('{"step":3,"loss":1.0}') == 3
+    assert top_level_step('{"step": -2}') == -2
+    assert top_level_step('{"step":1e3}') is None
+    assert top_level_step('{"eval":{"step":3,"acc":1},"step":100}') is None
+    assert top_level_step(json.dumps({'note': '"step": 3,', 'step': 100})) is None
+
+
+def test_step_written_first(tmp_path):
+    logger = JSONLogger().start(str(tmp_path))
+    logger.log(dict(loss=1., step=7))
+    logger.finish()
+    with open(logger.fname) as f:
+        assert top_level_step(f.readline()) == 7
+
+
+def test_step_range_with_misleading_records(tmp_path):
+    # written by other code, with `step` not first, nested, or inside strings
+    records = [
+        {'eval': {'step': 100}, 'step': 0},
+        {'note': '"step": 100,', 'step': 1},
+        {'step': 2},
+        {'loss': 1., 'step': 3},
+        {'eval': {'step': 2}, 'step': 100},
+    ]
+    with open(os.path.join(str(tmp_path), 'log.jsonl'), 'w') as f:
+        f.writelines(json.dumps(d) + '\n' for d in records)
+    logger = JSONLogger().start(str(tmp_path))
+    assert [d['step'] for d in logger.load_logs(step_range=(0, 4))] == [0, 1, 2, 3]
+    assert [d['step'] for d in logger.load_logs(step_range=(0, 4), every=2)] == [0, 2]
+    assert [d['step'] for d in logger.load_logs(step_range=(50, None))] == [100]
+
+
+def test_follow_yields_existing_log_in_batches(tmp_path):
+    logger = JSONLogger(buffer_size=1).start(str(tmp_path))
+    for i in range(1000):
+        logger.log(dict(step=i, loss=1. / (i + 1)))
+    logger.flush()
+    batches = []
+    for records in logger.follow(batch=True, poll_interval=0, idle_timeout=0, max_read=4096):
+        batches.append(records)
+    steps = [d['step'] for records in batches for d in records]
+    assert steps == list(range(1000))
+    assert len([b for b in batches if b]) > 1
+    assert max(len(json.dumps(records)) for records in batches) < 2 * 4096
+    logger.finish()
@@ -0,0 +1,63 @@
+import glob
+import os
+import ujson as json
+from expman import Experiment, JSONLogger
+from expman.job import SlurmJob
+from expman.local import LocalPoolExecutor
+from expman.sweep import expand_grid, launch_sweep, slurm_array_id
+
+
+class SweepJob(SlurmJob):
+
+    def state_dict(self):
+        return {}
+
+    def load_state_dict(self, d):
+        pass
+
+    def forward(self, explog):
+        self.exp.loggers = [JSONLogger()]
+        self.exp.start()
+        self.exp.log(dict(loss=self.exp.config['lr'] * self.exp.config['seed']))
+        self.exp.finish()
+
+
+def test_expand_grid():
+    configs = expand_grid(dict(name='sweep', logdir='logs'), dict(lr=[0.1, 0.01], seed=[0, 1]))
+    assert [c['name'] for c in configs] == ['sweep-lr0.1-seed0', 'sweep-lr0.1-seed1', 'sweep-lr0.01-seed0', 'sweep-lr0.01-seed1']
+    assert all(c['logdir'] == 'logs' for c in configs)
+
+
+def test_slurm_array_id():
+    assert slurm_array_id(['123_0', '123_1']) == '123'
+    assert slurm_array_id(['123_0', '124_0']) is None
+    assert slurm_array_id(['4242']) is None
+    assert slurm_array_id(['4242.0_0', '4242.0_1']) is None
+
+
+def test_launch_sweep_local(tmp_path):
+    configs = expand_grid(dict(name='sweep', logdir=str(tmp_path)), dict(lr=[0.1, 0.01], seed=[1, 2]))
+    folder = str(tmp_path / 'slurm')
+    executor = LocalPoolExecutor(folder, cpus=2)
+    sweeps = []
+    for _ in range(2):
+        submitted = launch_sweep(SweepJob, configs, executor=executor, folder=folder, array_parallelism=2)
+        for job in submitted:
+            job.result(timeout=120)
+        sweeps.append(submitted)
+
+    # local job ids are not unique across sweeps, so each sweep gets its own record
+    fsweeps = sorted(glob.glob(os.path.join(folder, 'sweep_*.json')))
+    assert len(fsweeps) == 2
+    for fsweep in fsweeps:
+        with open(fsweep) as f:
+            d = json.load(f)
+        assert d['array_id'] is None
+        assert os.path.basename(fsweep) == 'sweep_{}.json'.format(d['sweep_id'])
+        assert [t['explog'] for t in d['tasks']] == [os.path.join(str(tmp_path), c['name'], 'exp.json') for c in configs]
+
+    # relaunching resumes the existing experiments, which log once more
+    for config in configs:
+        exp = Experiment.from_fconfig(os.path.join(str(tmp_path), config['name'], 'exp.json'))
+        logs = exp.load_logs(JSONLogger())
+        assert [d['loss'] for d in logs] == [config['lr'] * config['seed']] * 2
@@ -0,0 +1,110 @@
+import importlib
+import sys
+import types
+import pytest
+import ujson as json
+from expman import Experiment, JSONLogger
+
+
+class FakeWandb(types.ModuleType):
+    """
+    Stands in for `wandb`: logged rows are only synced, i.e. uploaded, when the run is finished.
+    """
+
+    def __init__(self, fail_after=None):
+        super().__init__('wandb')
+        self.fail_after = fail_after
+        self.calls = 0
+        self.runs = []
+        self.synced = []
+        self.config = {}
+
+    def init(self, project, id, config=None, resume=None, **kwargs):
+        self.runs.append(dict(project=project, id=id, resume=resume, rows=[]))
+        return self.runs[-1]
+
+    def log(self, row):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError('upload interrupted')
+        self.runs[-1]['rows'].append(row)
+
+    def finish(self):
+        self.synced.extend(self.runs[-1]['rows'])
+
+
+@pytest.fixture
+def wandb_logger(monkeypatch):
+    def load(fake):
+        monkeypatch.setitem(sys.modules, 'wandb', fake)
+        monkeypatch.delitem(sys.modules, 'expman.loggers.wandb_logger', raising=False)
+        return importlib.import_module('expman.loggers.wandb_logger').WandbLogger
+    return load
+
+
+def make_exp(tmp_path, num_records):
+    exp = Experiment(dict(name='run', seedless_name='run', logdir=str(tmp_path)), loggers=[JSONLogger()]).start()
+    for i in range(num_records):
+        exp.log(dict(loss=i))
+    exp.finish()
+    return exp.explog
+
+
+def test_batches_merge_steps(wandb_logger):
+    fake = FakeWandb()
+    logger = wandb_logger(fake)(project='p', batch_size=3).start()
+    logger.log(dict(step=0, loss=1))
+    logger.log(dict(step=0, acc=2))
+    assert fake.calls == 0
+    logger.log(dict(step=1, loss=3))
+    assert fake.runs[0]['rows'] == [dict(step=0, loss=1, acc=2), dict(step=1, loss=3)]
+    logger.log(dict(step=2, loss=4))
+    logger.finish()
+    assert [r['step'] for r in fake.synced] == [0, 1, 2]
+
+    # a dict reused and mutated between calls
+    fake = FakeWandb()
+    logger = wandb_logger(fake)(project='p', batch_size=3).start()
+    content = {}
+    for i in range(3):
+        content['step'] = i
+        content['loss'] = 10 * i
+        logger.log(content)
+    content.clear()
+    logger.finish()
+    assert fake.runs[0]['rows'] == [dict(step=0, loss=0), dict(step=1, loss=10), dict(step=2, loss=20)]
+
+
+def test_resume_from_mark(tmp_path, wandb_logger):
+    fexp = make_exp(tmp_path, 10)
+    fake = FakeWandb(fail_after=6)
+    WandbLogger = wandb_logger(fake)
+    with pytest.raises(RuntimeError):
+        WandbLogger.convert_exp(fexp, 'p', batch_size=2, sync_every=4)
+    # rows 4 and 5 were logged but their run was not finished, so they may not have been uploaded
+    with open(WandbLogger.upload_mark_path(fexp)) as f:
+        assert json.load(f)['rows'] == 4
+    assert [r['step'] for r in fake.synced] == [0, 1, 2, 3]
+
+    fake = FakeWandb()
+    WandbLogger = wandb_logger(fake)
+    assert WandbLogger.convert_exp(fexp, 'p', batch_size=2, sync_every=4) == 10
+    assert [r['step'] for r in fake.synced] == list(range(4, 10))
+    assert [run['resume'] for run in fake.runs] == ['allow', 'allow']
+
+    fake = FakeWandb()
+    assert wandb_logger(fake).convert_exp(fexp, 'p', batch_size=2) == 10
+    assert fake.runs == []
+
+
+def test_mark_only_after_finish(tmp_path, wandb_logger):
+    fexp = make_exp(tmp_path, 5)
+    fake = FakeWandb(fail_after=4)
+    WandbLogger = wandb_logger(fake)
+    with pytest.raises(RuntimeError):
+        WandbLogger.convert_exp(fexp, 'p', batch_size=2)
+    assert not (tmp_path / 'run' / 'wandb_upload.json').exists()
+    fake = FakeWandb()
+    assert wandb_logger(fake).convert_exp(fexp, 'p', batch_size=2) == 5
+    assert fake.runs[0]['resume'] is None
+    assert [r['step'] for r in fake.synced] == list(range(5))